@@ -0,0 +1,64 @@
+import asyncio
+from models.asynclights import AsyncLights
+from models.asyncgroups import AsyncGroups
+from models.utils.asynccomms import AsyncComms
+from models.utils.comms import Comms
+
+
+class AsyncBridge(object):
+    """
+    Asynchronous (asyncio) access to the bridge along with all the lights and groups from the setup, Python 3 only.
+
+    Create it from a coroutine with 'bridge = await AsyncBridge.create()' and call 'await bridge.close()' when done.
+    All methods setting something on the bridge are awaitable.
+    """
+
+    def __init__(self, comms, max_concurrency=10):
+        assert (isinstance(comms, AsyncComms))
+        self._comms = comms                         # asynchronous bridge communication
+        self.max_concurrency = max_concurrency      # maximum number of lights set concurrently by one collection call
+        self.lights = None                          # collection of lights (acting as a dictionary), see load()
+        self.groups = None                          # collection of groups (acting as a dictionary), see load()
+
+    @classmethod
+    async def create(cls, bridge_ip=None, bridge_user=None, max_concurrency=10):
+        """
+        Connect to the bridge and load all lights and groups.
+
+        If the bridge IP and user are not given, they are taken from 'bridges.json' (or found by scanning,
+        see Comms) without blocking the event loop.
+
+        :param bridge_ip: IP of the bridge (optional).
+        :param bridge_user: User registered on the bridge (optional).
+        :param max_concurrency: Maximum number of lights set concurrently by one collection call.
+        :return AsyncBridge instance.
+        """
+
+        if (bridge_ip is None) or (bridge_user is None):
+            comms = await asyncio.get_running_loop().run_in_executor(None, Comms)
+            # only used for finding the bridge, its connections are not needed anymore
+            comms.close()
+            bridge_ip, bridge_user = comms.bridge_ip, comms.bridge_user
+        bridge = cls(AsyncComms(bridge_ip, bridge_user), max_concurrency)
+        await bridge.load()
+        return bridge
+
+    async def load(self):
+        """
+        Load (or reload) all lights and groups from the bridge with a single request.
+
+        :return None
+        """
+
+        datastore = await self._comms.get('')
+        self.lights = AsyncLights(self._comms, datastore['lights'], self.max_concurrency)
+        self.groups = AsyncGroups(self._comms, self.lights, datastore['groups'], self.max_concurrency)
+
+    async def close(self):
+        """
+        Close all connections to the bridge.
+
+        :return None
+        """
+
+        await self._comms.close()
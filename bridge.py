@@ -1,8 +1,14 @@
 import time
+import json
 import pprint
 from models.lights import Lights
 from models.groups import Groups
+from models.animation import Animation, Animator
+from models.framestream import FrameStream
 from models.utils.comms import Comms
+from models.utils.poller import StatePoller
+from models.utils.fanout import FanOutExecutor
+from models.utils.bridgestore import topology_version
 
 
 class Bridge(object):
@@ -10,10 +16,253 @@ class Bridge(object):
     Access the bridge along with all the lights, groups, etc. from the setup.
     """
 
-    def __init__(self):
-        self._comms = Comms()                           # bridge communication
-        self.lights = Lights(self._comms)               # collection of lights (acting as a dictionary)
-        self.groups = Groups(self._comms, self.lights)  # collection of groups (acting as a dictionary)
+    def __init__(self, executor=None, max_concurrency=FanOutExecutor.DEFAULT_MAX_CONCURRENCY, serial=None):
+        """
+        :param executor: Executor running collection calls (bridge.lights.set_color(), etc.) for each light,
+                         i.e. a concurrent.futures.ThreadPoolExecutor (optional, a bounded thread pool by default).
+        :param max_concurrency: Maximum number of commands from collection calls running at the same time.
+        :param serial: Serial number of the bridge (optional, the default bridge from 'bridges.json').
+        """
+
+        self._comms = Comms(executor, max_concurrency, serial=serial)  # bridge communication
+        # the whole setup (lights, groups, etc.) is loaded with a single request and handed to each collection
+        datastore = self._comms.get('')
+        self._comms.store.update(self._comms.serial_number, topology_version=topology_version(datastore))
+        self.lights = Lights(self._comms, datastore['lights'])                  # collection of lights (as a dictionary)
+        self.groups = Groups(self._comms, self.lights, datastore['groups'])     # collection of groups (as a dictionary)
+        self._poller = None                             # background poller, see subscribe() and start_polling()
+        self._animator = None                           # background player of the animations, see animate()
+
+    def enable_scheduler(self, rates=None, burst=1, max_pending=100):
+        """
+        Pace all commands sent to the bridge (see CommandScheduler):
+        - at most 'rates' commands per second for each resource class (10 for lights and 1 for groups by default),
+        - writes to the same light/group not sent yet are merged (only the latest values are sent),
+        - commands called directly on a light are sent before collection calls (bridge.lights.turn_on(), etc.)
+          and before background commands (see 'with priority_lane(PRIORITY_BACKGROUND):').
+
+        :param rates: Dictionary of commands per second by resource class (i.e. {'lights': 10, 'groups': 1}).
+        :param burst: Number of commands that can be sent at once after an idle period (for each resource class).
+        :param max_pending: Maximum number of commands waiting to be sent.
+        :return The CommandScheduler instance (print it to see queue depth, merged/dropped counts and rate).
+        """
+
+        return self._comms.enable_scheduler(rates, burst, max_pending)
+
+    def disable_scheduler(self):
+        """
+        Send all pending commands and stop pacing the commands sent to the bridge.
+
+        :return None
+        """
+
+        self._comms.disable_scheduler()
+
+    def enable_pipelining(self, error_callback=None, max_in_flight=16):
+        """
+        Send all commands back-to-back on one persistent connection, without waiting for the previous responses.
+        Responses are checked in background: errors are kept in 'bridge._comms.put_errors' (see display_errors())
+        and passed to error_callback(url_suffix, data, error) if given.
+
+        :param error_callback: Function called for each error returned by the bridge (optional).
+        :param max_in_flight: Maximum number of commands waiting for a response.
+        :return The Pipeline instance.
+        """
+
+        return self._comms.enable_pipelining(error_callback, max_in_flight)
+
+    def disable_pipelining(self):
+        """
+        Wait for the responses of all pipelined commands and stop pipelining.
+
+        :return None
+        """
+
+        self._comms.disable_pipelining()
+
+    def display_errors(self):
+        """
+        Display the last errors returned by the bridge for the commands sent (time, object, data sent, error).
+
+        :return None
+        """
+
+        for error_time, url_suffix, data, error in self._comms.put_errors:
+            print(time.strftime('%H:%M:%S', time.localtime(error_time)) + ' ' + url_suffix + ' ' + data + ' : Error ' +
+                  str(error['type']) + ' : ' + str(error['description']))
+
+    def subscribe(self, resource, callback, kinds=None):
+        """
+        Call a function for each change of the lights or groups (i.e. turned on/off, brightness, color, reachable,
+        renamed), detected by polling the bridge in background (polling starts with the first subscription,
+        see start_polling() for setting the interval).
+
+        :param resource: 'lights' or 'groups'.
+        :param callback: Function called as callback(event) for each change (see ChangeEvent).
+        :param kinds: List of changes the callback is interested in, i.e. ['on', 'bri'] (optional, all if not given).
+        :return None
+        """
+
+        self._get_poller().subscribe(resource, callback, kinds)
+        self._poller.start()
+
+    def unsubscribe(self, resource, callback):
+        """
+        Stop calling a function subscribed for the changes of the lights or groups.
+
+        :param resource: 'lights' or 'groups'.
+        :param callback: Function previously subscribed.
+        :return None
+        """
+
+        if self._poller is not None:
+            self._poller.unsubscribe(resource, callback)
+
+    def start_polling(self, interval=1.0):
+        """
+        Poll the bridge in background: all lights and all groups are fetched with one request each,
+        every 'interval' seconds, and the changes are passed to the subscribed functions (see subscribe()).
+
+        :param interval: Seconds between two polls.
+        :return The StatePoller instance.
+        """
+
+        self._get_poller().interval = interval
+        self._poller.start()
+        return self._poller
+
+    def stop_polling(self):
+        """
+        Stop polling the bridge in background.
+
+        :return None
+        """
+
+        if self._poller is not None:
+            self._poller.stop()
+
+    def _get_poller(self):
+        if self._poller is None:
+            self._poller = StatePoller(self._comms)
+            # lights and groups renamed from other apps are indexed again under their new names
+            self._poller.subscribe('lights', self._on_renamed, ['renamed'])
+            self._poller.subscribe('groups', self._on_renamed, ['renamed'])
+        return self._poller
+
+    def _on_renamed(self, event):
+        if event.resource == 'lights':
+            light = self.lights.by_id(event.id)
+            if light is not None:
+                self.lights._reindex(light)
+                [group._reindex(light) for group in self.groups.values()]
+        else:
+            group = self.groups.by_id(event.id)
+            if group is not None:
+                self.groups._reindex(group)
+
+    @staticmethod
+    def _print_error(data):
+        # the response of a failed request has an error item for each attribute, or nothing at all
+        errors = [item['error'] for item in data or [] if isinstance(item, dict) and 'error' in item]
+        if errors:
+            print('Error ' + str(errors[0].get('type')) + ' : ' + str(errors[0].get('description')))
+        else:
+            print('Error : no response from the bridge')
+
+    def animate(self, lights, keyframes, fps=Animation.DEFAULT_FPS, loop=False):
+        """
+        Play an animation in background, i.e. from red to blue in 2 seconds and back, until stopped:
+
+            animation = bridge.animate(bridge.groups.Living, [Keyframe(0, rgb=(255, 0, 0)),
+                                                              Keyframe(2, rgb=(0, 0, 255), easing='ease_in_out'),
+                                                              Keyframe(4, rgb=(255, 0, 0))], loop=True)
+            animation.stop()
+
+        Several animations can play at the same time on different lights (see Animation).
+
+        :param lights: Light, group, bridge.lights or a list of these.
+        :param keyframes: List of Keyframe (rgb, xy, ct and/or bri at a given time).
+        :param fps: Frames per second.
+        :param loop: Play again from the start after the last keyframe, until stopped.
+        :return The Animation instance (print it to see the frames played, dropped and the states sent).
+        """
+
+        if self._animator is None:
+            self._animator = Animator()
+        return self._animator.play(Animation(lights, keyframes, fps, loop))
+
+    def stop_animations(self):
+        """
+        Stop all animations, the lights keep their current state.
+
+        :return None
+        """
+
+        if self._animator is not None:
+            self._animator.stop()
+
+    def stream_frames(self, regions, rate=FrameStream.DEFAULT_RATE, threshold=0.01):
+        """
+        Make lights follow the colors of a stream of frames (i.e. screen captures), each light the average color of
+        a region of the frames:
+
+            stream = bridge.stream_frames({bridge.lights.Left: (0, 0, 0.5, 1), bridge.lights.Right: (0.5, 0, 1, 1)})
+            stream.push(frame)      # for each frame, i.e. a height x width x 3 NumPy array
+            stream.stop()
+
+        Frames can be pushed faster than they are processed, only the latest one is kept (see FrameStream).
+
+        :param regions: Dictionary of the region (left, top, right, bottom as fractions of the frame) of each light,
+                        group or list of lights.
+        :param rate: Maximum number of frames processed (and states sent) per second.
+        :param threshold: Minimum xy distance from the color sent last for sending a new color.
+        :return The started FrameStream instance (print it to see the frames received, replaced and processed).
+        """
+
+        return FrameStream(regions, rate, threshold).start()
+
+    def rename_light(self, light_id, name):
+        """
+        Rename a light. See 'http://<bridgeIP>/debug/clip.html', PUT '/api/<bridgeUser>/lights/<light_id>'.
+        The light is then available under its new name (i.e. bridge.lights.<NewName>, bridge.lights.by_name()).
+
+        :param light_id: Id of the light to be renamed.
+        :param name: New name of the light.
+        :return None
+        """
+
+        light = self.lights.by_id(light_id)
+        if light is None:
+            print('Error : light ' + str(light_id) + ' not found')
+            return
+        data = self._comms.put(light._path, json.dumps({'name': name}), immediate=True)
+        if data and ('success' in data[0]):
+            print('Light renamed: ' + str(light_id) + ', name: ' + light.name)
+            self.lights._reindex(light)
+            [group._reindex(light) for group in self.groups.values()]
+        else:
+            self._print_error(data)
+
+    def rename_group(self, group_id, name):
+        """
+        Rename a group. See 'http://<bridgeIP>/debug/clip.html', PUT '/api/<bridgeUser>/groups/<group_id>'.
+        The group is then available under its new name (i.e. bridge.groups.<NewName>, bridge.groups.by_name()).
+
+        :param group_id: Id of the group to be renamed.
+        :param name: New name of the group.
+        :return None
+        """
+
+        group = self.groups.by_id(group_id)
+        if group is None:
+            print('Error : group ' + str(group_id) + ' not found')
+            return
+        data = self._comms.put(group._path, json.dumps({'name': name}), immediate=True)
+        if data and ('success' in data[0]):
+            print('Group renamed: ' + str(group_id) + ', name: ' + group.name)
+            self.groups._reindex(group)
+        else:
+            self._print_error(data)
 
     def post_group(self, light_ids, name=None):
         """
@@ -54,12 +303,12 @@ class Bridge(object):
         :return None.
         """
 
-        self.groups._delete_group(group_id)
         data = self._comms.delete(r'groups/' + str(group_id))
-        if 'success' in data[0].keys():
+        if data and ('success' in data[0]):
             print('Group deleted: ' + str(group_id))
+            self.groups._delete_group(group_id)
         else:
-            print('Error ' + str(data[0]['error']['type']) + ' : ' + str(data[0]['error']['description']))
+            self._print_error(data)
 
     def post_user(self):
         """
@@ -0,0 +1,121 @@
+import functools
+from bridge import Bridge
+from models.utils.userobj import UserObj
+from models.utils.callableobj import CallableObj
+from models.utils.fanout import FanOutExecutor, FanOutResult
+from models.utils.bridgestore import BridgeStore
+
+
+class ClusterCallable(object):
+    """
+    Collection call (i.e. cluster.lights.turn_off()) sent to the collection of each bridge that supports it,
+    concurrently for all bridges, so that it takes about as long as for a single bridge.
+
+    A call returns a FanOutResult with the outcome for each light, indexed by its name in the cluster.
+    """
+
+    def __init__(self, method_name, collections, names, fanout):
+        self._method_name = method_name
+        self._collections = collections     # collection of each bridge (Lights), indexed by bridge key
+        self._names = names                 # name in the cluster of each object, indexed by (bridge key, name)
+        self._fanout = fanout
+
+    def __call__(self, *args, **kwargs):
+        calls = [(key, functools.partial(getattr(collection, self._method_name), *args, **kwargs))
+                 for key, collection in self._collections.items() if hasattr(collection, self._method_name)]
+        outcome = self._fanout.run(calls)
+
+        result = FanOutResult()
+        for key, bridge_result in outcome.results.items():
+            result.results.update((self._names[(key, name)], value) for name, value in bridge_result.results.items())
+            result.errors.update((self._names[(key, name)], error) for name, error in bridge_result.errors.items())
+        for key, error in outcome.errors.items():
+            # the whole call failed for this bridge
+            result.errors.update((self._names[(key, name)], error) for name in self._collections[key].keys())
+        return result
+
+
+class ClusterCollection(UserObj):
+    """
+    Lights (or groups) of several bridges as a single collection.
+
+    Contains a dictionary of all the objects indexed by name; when several bridges have an object with the same name,
+    its name is qualified with the bridge key (i.e. 'Living Tall_4b21c0', member 'LivingTall_4b21c0').
+    Objects are indexed by id as '<bridge key>/<id>' (see by_id()).
+    Collection calls of the bridges (i.e. cluster.lights.turn_off()) are sent to all bridges concurrently.
+    """
+
+    def __init__(self, collections, fanout):
+        """
+        :param collections: Collection of each bridge (Lights or Groups), indexed by bridge key.
+        :param fanout: FanOutExecutor running the calls for each bridge.
+        """
+
+        counts = {}
+        for collection in collections.values():
+            for name in collection.keys():
+                counts[name] = counts.get(name, 0) + 1
+
+        # name in the cluster of each object, qualified with the bridge key if not unique
+        names = dict(((key, name), name if counts[name] == 1 else name + '_' + key)
+                     for key, collection in collections.items() for name in collection.keys())
+        self._obj = dict((names[(key, name)], obj)
+                         for key, collection in collections.items() for name, obj in collection.items())
+        self._by_id = dict((key + '/' + obj.id, obj) for key, collection in collections.items() for obj in
+                           collection.values())
+        self._by_name = dict((name.replace(' ', ''), obj) for name, obj in self._obj.items())
+        self._names = dict((key + '/' + collections[key][name].id, cluster_name)
+                           for (key, name), cluster_name in names.items())
+        # each name becomes a member of this instance with the proper object associated
+        [setattr(self, adapted_name, obj) for adapted_name, obj in self._by_name.items()]
+
+        # each collection call of the bridges is sent to all bridges supporting it
+        method_names = set(method_name for collection in collections.values()
+                           for method_name, value in vars(collection).items() if isinstance(value, CallableObj))
+        for method_name in method_names:
+            setattr(self, method_name, ClusterCallable(method_name, collections, names, fanout))
+
+    def __repr__(self):
+        return "".join('(' + id + ') * ' + name + '\n' for id, name in sorted(self._names.items()))
+
+
+class BridgeCluster(object):
+    """
+    Access several bridges (i.e. when the lights are more than a single bridge supports)
+    with all their lights and groups in a single namespace.
+
+    The bridges are opened in parallel. Collection calls (i.e. cluster.lights.turn_off()) are sent to all
+    bridges concurrently, while each bridge paces its own commands (see Bridge).
+    """
+
+    def __init__(self, serials=None, executor=None, max_concurrency=FanOutExecutor.DEFAULT_MAX_CONCURRENCY):
+        """
+        :param serials: Serial numbers of the bridges (optional, all bridges from 'bridges.json' by default).
+        :param executor: Executor running collection calls for each light, shared by all bridges (optional).
+        :param max_concurrency: Maximum number of commands from collection calls running at the same time,
+                                for each bridge.
+        """
+
+        if serials is None:
+            serials = BridgeStore().serials()
+        if not serials:
+            raise RuntimeError('No bridge configured, connect to each bridge with Bridge(serial=...) first !!!')
+        self._fanout = FanOutExecutor(max_concurrency=len(serials))
+
+        opened = self._fanout.run([(serial, functools.partial(Bridge, executor, max_concurrency, serial))
+                                   for serial in serials])
+        for serial, error in opened.errors.items():
+            print('Error : bridge ' + str(serial) + ' : ' + str(error))
+        if not opened.results:
+            raise RuntimeError('No bridge found !!!')
+
+        # bridges indexed by bridge key (last 6 digits of the serial number)
+        self.bridges = dict((serial[-6:], bridge) for serial, bridge in opened.results.items())
+        self.lights = ClusterCollection(dict((key, bridge.lights) for key, bridge in self.bridges.items()),
+                                        self._fanout)
+        self.groups = ClusterCollection(dict((key, bridge.groups) for key, bridge in self.bridges.items()),
+                                        self._fanout)
+
+    def __repr__(self):
+        return "".join(key + ' * ' + str(bridge._comms.bridge_ip) + ' * ' + str(len(bridge.lights)) + ' lights * ' +
+                       str(len(bridge.groups)) + ' groups\n' for key, bridge in sorted(self.bridges.items()))
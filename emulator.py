@@ -0,0 +1,535 @@
+import argparse
+import binascii
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+from models.utils.discovery import SSDPResponder, SSDP_ADDRESS
+from models.utils.bridgestore import BridgeStore
+
+if sys.version_info < (3, 0):
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+# model id, type and product name of the lights emulated for each kind (gamut 'A', 'B', 'C' or 'white')
+LIGHT_MODELS = {
+    'A': ('LLC010', 'Color light', 'Hue Living Colors Iris'),
+    'B': ('LCT001', 'Extended color light', 'Hue color lamp'),
+    'C': ('LCT010', 'Extended color light', 'Hue color lamp'),
+    'white': ('LWB004', 'Dimmable light', 'Hue white lamp')
+}
+
+# state attributes of each type of light
+LIGHT_STATES = {
+    'Dimmable light': {'on': False, 'bri': 254, 'alert': 'none', 'reachable': True},
+    'Color light': {'on': False, 'bri': 254, 'hue': 8418, 'sat': 140, 'effect': 'none', 'xy': [0.4573, 0.41],
+                    'alert': 'none', 'colormode': 'xy', 'reachable': True},
+    'Extended color light': {'on': False, 'bri': 254, 'hue': 8418, 'sat': 140, 'effect': 'none', 'xy': [0.4573, 0.41],
+                             'ct': 366, 'alert': 'none', 'colormode': 'xy', 'reachable': True}
+}
+
+# error types of the bridge (see 'https://developers.meethue.com/documentation/error-messages')
+UNAUTHORIZED_USER = 1
+INVALID_JSON = 2
+RESOURCE_NOT_AVAILABLE = 3
+METHOD_NOT_AVAILABLE = 4
+MISSING_PARAMETERS = 5
+PARAMETER_NOT_AVAILABLE = 6
+INVALID_VALUE = 7
+LINK_BUTTON_NOT_PRESSED = 101
+DEVICE_OFF = 201
+INTERNAL_ERROR = 901
+
+
+def error(type, address, description):
+    return {'error': {'type': type, 'address': address, 'description': description}}
+
+
+def check_value(name, value):
+    """
+    Check the value of a state attribute, the way the bridge does.
+
+    :param name: Name of the attribute (i.e. 'bri').
+    :param value: Value sent.
+    :return The value set (i.e. brightness limited to 1 - 254, xy rounded to 4 decimals), None if not valid.
+    """
+
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    if name == 'on':
+        return value if isinstance(value, bool) else None
+    if name in ('bri', 'sat', 'ct'):
+        low, high = {'bri': (1, 254), 'sat': (0, 254), 'ct': (153, 500)}[name]
+        return max(low, min(high, value)) if is_int(value) else None
+    if name in ('hue', 'transitiontime'):
+        return value if is_int(value) and (0 <= value <= 65535) else None
+    if name == 'xy':
+        if isinstance(value, list) and (len(value) == 2) and all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) and (0 <= v <= 1) for v in value):
+            return [round(float(v), 4) for v in value]
+        return None
+    if name == 'alert':
+        return value if value in ('none', 'select', 'lselect') else None
+    if name == 'effect':
+        return value if value in ('none', 'colorloop') else None
+    return None
+
+
+class BridgeEmulator(object):
+    """
+    Emulation of a Philips hue bridge (API version 1), for testing and benchmarking without a bridge.
+
+    Serves 'description.xml' and the endpoints used by PieShine over HTTP (keep-alive and pipelining included):
+    GET of the whole datastore, of 'lights', 'groups', 'config' and of each light/group, 'lights/new',
+    PUT of 'lights/<id>/state', 'groups/<id>/action' (group 0 for all lights), 'lights/<id>' and 'groups/<id>',
+    POST of users (with the link button, see press_link_button()) and groups, DELETE of groups and users.
+    The values are checked and set the way the bridge does (i.e. brightness limited to 1 - 254, error 201 for
+    setting the color of a light which is off).
+
+    Lights of gamut A, B, C (see LIGHT_MODELS) and white lights are emulated, in rooms of 'group_size' lights.
+    Responding like a real bridge:
+        latency - Seconds waited before each response, or (minimum, maximum) for a random delay.
+        rate_limits - PUT requests accepted per second for each resource type, i.e. {'lights': 10, 'groups': 1}
+                      (about what a bridge handles), the ones over the limit get a '503 Service Unavailable'.
+        error_rate - Part of the PUT, POST and DELETE requests answered with an internal error (0 to 1).
+
+    Statistics (see stats()): requests received for each method, throttled and failed requests, users created.
+
+    Connect to it like to a bridge, i.e. BridgeEmulator(1000, username='pieshine').register() then Bridge(), or
+    with ssdp=SSDP_ADDRESS for the discovery. PieShine talks to the bridge on port 80: run several emulators
+    on different loopback IPs (i.e. 127.0.0.2) rather than on different ports.
+    """
+
+    LINK_BUTTON_TIME = 30
+
+    def __init__(self, lights=10, kinds=('A', 'B', 'C', 'white'), group_size=10, host='127.0.0.1', port=80,
+                 serial='001788fffe000000', username=None, latency=0, rate_limits=None, error_rate=0, ssdp=None):
+        """
+        :param lights: Number of lights.
+        :param kinds: Kinds of the lights (see LIGHT_MODELS), given to the lights in turn.
+        :param group_size: Number of lights in each room group.
+        :param host: IP to listen on.
+        :param port: Port to listen on.
+        :param serial: Serial number of the bridge.
+        :param username: User already registered (optional, see press_link_button() for adding users).
+        :param latency: Seconds waited before each response, or (minimum, maximum).
+        :param rate_limits: PUT requests accepted per second for each resource type (optional, no limit by default).
+        :param error_rate: Part of the PUT, POST and DELETE requests answered with an internal error (0 to 1).
+        :param ssdp: Address the SSDP responder listens on (optional, i.e. SSDP_ADDRESS for the multicast group,
+                     no SSDP by default).
+        """
+
+        for kind in kinds:
+            if kind not in LIGHT_MODELS:
+                raise ValueError('Unknown kind of light ' + str(kind) + ', use one of ' + ', '.join(
+                    sorted(LIGHT_MODELS)))
+        self.serial = serial
+        self.latency = latency
+        self.rate_limits = dict(rate_limits or {})
+        self.error_rate = error_rate
+        self.requests = {}
+        self.throttled = self.failed = self.users_created = 0
+        self._lock = threading.RLock()
+        self._buckets = {}          # tokens left and time of the last request, for each rate limited resource type
+        self._link_button_time = None
+        self._datastore = self._create_datastore(lights, kinds, group_size)
+        if username is not None:
+            self._add_user(username, 'PieShine#emulator')
+
+        self._server = _Server((host, port), _Handler)
+        self._server.emulator = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='BridgeEmulator')
+        self._thread.daemon = True
+        self._thread.start()
+        self._ssdp = None
+        if ssdp is not None:
+            self._ssdp = SSDPResponder('http://%s:%d/description.xml' % (self.host, self.port), serial.upper(), ssdp)
+
+    def __repr__(self):
+        return ('BridgeEmulator * %s:%d * %s * %d lights * %d groups * requests = %s * throttled = %d * '
+                'failed = %d' % (self.host, self.port, self.serial, len(self._datastore['lights']),
+                                 len(self._datastore['groups']), self.requests, self.throttled, self.failed))
+
+    def stats(self):
+        """
+        Get the statistics of the emulator.
+
+        :return Dictionary with 'requests' (number of requests for each method), 'throttled', 'failed',
+                'users_created' counters and 'ssdp' (M-SEARCH requests answered).
+        """
+
+        return {'requests': dict(self.requests), 'throttled': self.throttled, 'failed': self.failed,
+                'users_created': self.users_created, 'ssdp': self._ssdp.requests if self._ssdp is not None else 0}
+
+    def close(self):
+        """
+        Stop the emulator.
+
+        :return None
+        """
+
+        if self._ssdp is not None:
+            self._ssdp.close()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def press_link_button(self):
+        """
+        Press the link button: new users can be created for LINK_BUTTON_TIME seconds.
+
+        :return None
+        """
+
+        self._link_button_time = time.time()
+
+    def register(self, store=None):
+        """
+        Write the emulated bridge in the bridges store, as the default bridge, so that Bridge() connects to it.
+
+        :param store: BridgeStore (optional, 'bridges.json' by default).
+        :return None
+        """
+
+        with self._lock:
+            usernames = list(self._datastore['config']['whitelist'])
+        if not usernames:
+            raise ValueError('No user registered, create the emulator with a username')
+        (store or BridgeStore()).update(self.serial, ip=self.host, username=usernames[0], model='BSB002',
+                                        validated=None)
+
+    def light(self, id):
+        """
+        Get the data of a light, i.e. for checking the state set.
+
+        :param id: Id of the light.
+        :return Copy of the light data.
+        """
+
+        with self._lock:
+            return json.loads(json.dumps(self._datastore['lights'][str(id)]))
+
+    @property
+    def _link_button(self):
+        return (self._link_button_time is not None) and (time.time() - self._link_button_time < self.LINK_BUTTON_TIME)
+
+    def _create_datastore(self, count, kinds, group_size):
+        lights = {}
+        for n in range(1, count + 1):
+            model_id, type, product = LIGHT_MODELS[kinds[(n - 1) % len(kinds)]]
+            lights[str(n)] = {'state': copy.deepcopy(LIGHT_STATES[type]), 'type': type, 'name': 'Light ' + str(n),
+                              'modelid': model_id, 'manufacturername': 'Philips', 'productname': product,
+                              'uniqueid': '00:17:88:01:%02x:%02x:%02x:%02x-0b' % (
+                                  (n >> 24) & 0xff, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff),
+                              'swversion': '5.105.0.21169'}
+        groups = {}
+        ids = sorted(lights, key=int)
+        for n in range(0, len(ids), max(1, group_size)):
+            id = str(len(groups) + 1)
+            groups[id] = {'name': 'Room ' + id, 'lights': ids[n:n + group_size], 'type': 'Room', 'class': 'Other',
+                          'action': {'on': False, 'bri': 254, 'alert': 'none'}}
+        config = {'name': 'Philips hue', 'modelid': 'BSB002', 'bridgeid': self.serial.upper(),
+                  'mac': ':'.join(self.serial[n:n + 2] for n in (0, 2, 4, 10, 12, 14)),
+                  'swversion': '1709131301', 'apiversion': '1.21.0', 'linkbutton': False, 'whitelist': {}}
+        return {'lights': lights, 'groups': groups, 'config': config, 'schedules': {}, 'scenes': {}, 'rules': {},
+                'sensors': {}, 'resourcelinks': {}}
+
+    def _add_user(self, username, devicetype):
+        now = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())
+        self._datastore['config']['whitelist'][username] = {'name': devicetype, 'create date': now,
+                                                            'last use date': now}
+
+    def _handle(self, method, path, body):
+        # response to a request: (HTTP status, content type, body)
+        self.requests[method] = self.requests.get(method, 0) + 1
+        latency = self.latency
+        if isinstance(latency, (list, tuple)):
+            latency = random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if parts == ['description.xml'] and (method == 'GET'):
+            return 200, 'text/xml', self._description()
+        if not parts or (parts[0] != 'api'):
+            return 404, 'text/plain', b'Not Found'
+        if (method == 'PUT') and not self._accept(parts):
+            self.throttled += 1
+            return 503, 'text/plain', b'Service Unavailable'
+        if (method != 'GET') and self.error_rate and (random.random() < self.error_rate):
+            self.failed += 1
+            return 200, 'application/json', self._json([error(INTERNAL_ERROR, '/' + '/'.join(parts[2:]),
+                                                              'Internal error, 503')])
+        try:
+            data = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            return 200, 'application/json', self._json([error(INVALID_JSON, '', 'body contains invalid json')])
+        with self._lock:
+            return 200, 'application/json', self._json(self._api(method, parts[1:], data))
+
+    def _accept(self, parts):
+        # token bucket for each rate limited resource type
+        resource = parts[2] if len(parts) > 2 else None
+        rate = self.rate_limits.get(resource)
+        if not rate:
+            return True
+        with self._lock:
+            now = time.time()
+            tokens, last = self._buckets.get(resource, (float(max(1, rate)), now))
+            tokens = min(float(max(1, rate)), tokens + (now - last) * rate)
+            accepted = tokens >= 1
+            self._buckets[resource] = (tokens - 1 if accepted else tokens, now)
+            return accepted
+
+    def _api(self, method, parts, data):
+        if not parts:
+            # create a user
+            if method != 'POST':
+                return [error(METHOD_NOT_AVAILABLE, '/', 'method, ' + method + ', not available for resource, /')]
+            if not isinstance(data, dict) or ('devicetype' not in data):
+                return [error(MISSING_PARAMETERS, '/', 'invalid/missing parameters in body')]
+            if not self._link_button:
+                return [error(LINK_BUTTON_NOT_PRESSED, '', 'link button not pressed')]
+            username = binascii.hexlify(os.urandom(20)).decode('ascii')
+            self._add_user(username, data['devicetype'])
+            self.users_created += 1
+            return [{'success': {'username': username}}]
+
+        user, parts = parts[0], parts[1:]
+        address = '/' + '/'.join(parts)
+        if user not in self._datastore['config']['whitelist']:
+            return [error(UNAUTHORIZED_USER, address or '/', 'unauthorized user')]
+        if method == 'GET':
+            return self._get(parts, address)
+        if method == 'PUT':
+            return self._put(parts, address, data)
+        if method == 'POST':
+            return self._post(parts, address, data)
+        if method == 'DELETE':
+            return self._delete(parts, address)
+        return [error(METHOD_NOT_AVAILABLE, address, 'method, ' + method + ', not available for resource, ' + address)]
+
+    def _get(self, parts, address):
+        if not parts:
+            datastore = dict(self._datastore, config=dict(self._datastore['config'], linkbutton=self._link_button))
+            datastore['groups'] = dict((id, self._get_group(id)) for id in self._datastore['groups'])
+            return datastore
+        if parts == ['lights', 'new']:
+            return {'lastscan': 'none'}
+        if parts == ['groups']:
+            return dict((id, self._get_group(id)) for id in self._datastore['groups'])
+        if parts[:2] == ['groups', '0'] or ((parts[0] == 'groups') and (len(parts) > 1) and
+                                             (parts[1] in self._datastore['groups'])):
+            node = self._get_group(parts[1])
+            parts = parts[2:]
+        else:
+            node = self._datastore
+        for part in parts:
+            if not isinstance(node, dict) or (part not in node):
+                return [error(RESOURCE_NOT_AVAILABLE, address, 'resource, ' + address + ', not available')]
+            node = node[part]
+        if node is self._datastore['config']:
+            node = dict(node, linkbutton=self._link_button)
+        return node
+
+    def _get_group(self, id):
+        # group data along with the state of its lights
+        if id == '0':
+            group = {'name': 'Group 0', 'lights': sorted(self._datastore['lights'], key=int), 'type': 'LightGroup',
+                     'action': {'on': False, 'bri': 254, 'alert': 'none'}}
+        else:
+            group = dict(self._datastore['groups'][id])
+        on = [self._datastore['lights'][light_id]['state']['on'] for light_id in group['lights']
+              if light_id in self._datastore['lights']]
+        group['state'] = {'all_on': bool(on) and all(on), 'any_on': any(on)}
+        return group
+
+    def _put(self, parts, address, data):
+        if not isinstance(data, dict):
+            return [error(INVALID_JSON, address, 'body contains invalid json')]
+        if (len(parts) == 3) and (parts[0], parts[2]) == ('lights', 'state') and (
+                parts[1] in self._datastore['lights']):
+            return self._set_state(parts[1], data, address, True)
+        if (len(parts) == 3) and (parts[0], parts[2]) == ('groups', 'action') and (
+                parts[1] == '0' or parts[1] in self._datastore['groups']):
+            group = self._get_group(parts[1])
+            for light_id in group['lights']:
+                if light_id in self._datastore['lights']:
+                    self._set_state(light_id, data, address, False)
+            response = []
+            for name, value in data.items():
+                value = check_value(name, value)
+                if value is None:
+                    response.append(error(INVALID_VALUE, address + '/' + name,
+                                          'invalid value, ' + str(data[name]) + ', for parameter, ' + name))
+                    continue
+                if parts[1] != '0':
+                    self._datastore['groups'][parts[1]]['action'][name] = value
+                response.append({'success': {address + '/' + name: value}})
+            return response
+        if (len(parts) == 2) and (parts[0] in ('lights', 'groups')) and (parts[1] in self._datastore[parts[0]]):
+            resource = self._datastore[parts[0]][parts[1]]
+            response = []
+            for name, value in data.items():
+                if (name == 'name') or ((parts[0] == 'groups') and (name in ('lights', 'class'))):
+                    resource[name] = value
+                    response.append({'success': {address + '/' + name: value}})
+                else:
+                    response.append(error(PARAMETER_NOT_AVAILABLE, address + '/' + name,
+                                          'parameter, ' + name + ', not available'))
+            return response
+        return [error(RESOURCE_NOT_AVAILABLE, address, 'resource, ' + address + ', not available')]
+
+    def _set_state(self, light_id, data, address, strict):
+        # set the state of a light, attributes it does not have are errors only for the light itself (not groups)
+        state = self._datastore['lights'][light_id]['state']
+        response = []
+        turned_on = data.get('on') is True
+        for name in sorted(data, key=lambda name: name != 'on'):
+            value = check_value(name, data[name])
+            if (name not in state) and (name != 'transitiontime'):
+                if strict:
+                    response.append(error(PARAMETER_NOT_AVAILABLE, address + '/' + name,
+                                          'parameter, ' + name + ', not available'))
+                continue
+            if value is None:
+                response.append(error(INVALID_VALUE, address + '/' + name,
+                                      'invalid value, ' + str(data[name]) + ', for parameter, ' + name))
+                continue
+            if (name not in ('on', 'alert', 'transitiontime')) and not (state['on'] or turned_on):
+                if strict:
+                    response.append(error(DEVICE_OFF, address + '/' + name,
+                                          'parameter, ' + name + ', is not modifiable. Device is set to off.'))
+                continue
+            if name != 'transitiontime':
+                state[name] = value
+            if name in ('xy', 'ct'):
+                state['colormode'] = name
+            elif name in ('hue', 'sat'):
+                state['colormode'] = 'hs'
+            response.append({'success': {address + '/' + name: value}})
+        return response
+
+    def _post(self, parts, address, data):
+        if parts != ['groups']:
+            return [error(METHOD_NOT_AVAILABLE, address, 'method, POST, not available for resource, ' + address)]
+        if not isinstance(data, dict) or not isinstance(data.get('lights'), list):
+            return [error(MISSING_PARAMETERS, address, 'invalid/missing parameters in body')]
+        for light_id in data['lights']:
+            if light_id not in self._datastore['lights']:
+                return [error(RESOURCE_NOT_AVAILABLE, '/lights/' + str(light_id),
+                              'resource, /lights/' + str(light_id) + ', not available')]
+        id = str(max([int(id) for id in self._datastore['groups']] + [0]) + 1)
+        group = {'name': data.get('name', 'Group ' + id), 'lights': data['lights'],
+                 'type': data.get('type', 'LightGroup'), 'action': {'on': False, 'bri': 254, 'alert': 'none'}}
+        if group['type'] == 'Room':
+            group['class'] = data.get('class', 'Other')
+        else:
+            group['recycle'] = False
+        self._datastore['groups'][id] = group
+        return [{'success': {'id': id}}]
+
+    def _delete(self, parts, address):
+        if (len(parts) == 2) and (parts[0] in ('groups', 'lights')) and (parts[1] in self._datastore[parts[0]]):
+            self._datastore[parts[0]].pop(parts[1])
+            if parts[0] == 'lights':
+                for group in self._datastore['groups'].values():
+                    group['lights'] = [light_id for light_id in group['lights'] if light_id != parts[1]]
+        elif (parts[:2] == ['config', 'whitelist']) and (len(parts) == 3) and (
+                parts[2] in self._datastore['config']['whitelist']):
+            self._datastore['config']['whitelist'].pop(parts[2])
+        else:
+            return [error(RESOURCE_NOT_AVAILABLE, address, 'resource, ' + address + ', not available')]
+        return [{'success': address + ' deleted'}]
+
+    def _description(self):
+        return ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+                '<root xmlns="urn:schemas-upnp-org:device-1-0">\n'
+                '<specVersion><major>1</major><minor>0</minor></specVersion>\n'
+                '<URLBase>http://%s:%d/</URLBase>\n'
+                '<device>\n'
+                '<deviceType>urn:schemas-upnp-org:device:Basic:1</deviceType>\n'
+                '<friendlyName>Philips hue (%s)</friendlyName>\n'
+                '<manufacturer>Royal Philips Electronics</manufacturer>\n'
+                '<modelName>Philips hue bridge 2015</modelName>\n'
+                '<modelNumber>BSB002</modelNumber>\n'
+                '<serialNumber>%s</serialNumber>\n'
+                '<UDN>uuid:2f402f80-da50-11e1-9b23-%s</UDN>\n'
+                '</device>\n'
+                '</root>\n' % (self.host, self.port, self.host, self.serial, self.serial)).encode('utf-8')
+
+    @staticmethod
+    def _json(data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connections open (see ConnectionPool and Pipeline)
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, content_type, data = self.server.emulator._handle(self.command, self.path, body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_DELETE = _respond
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Emulate a Philips hue bridge.')
+    parser.add_argument('--lights', type=int, default=10, help='number of lights')
+    parser.add_argument('--kinds', default='A,B,C,white', help='kinds of the lights, given in turn (A, B, C, white)')
+    parser.add_argument('--group-size', type=int, default=10, help='number of lights in each room')
+    parser.add_argument('--host', default='127.0.0.1', help='IP to listen on')
+    parser.add_argument('--port', type=int, default=80, help='port to listen on')
+    parser.add_argument('--serial', default='001788fffe000000', help='serial number of the bridge')
+    parser.add_argument('--username', help='user already registered')
+    parser.add_argument('--latency', type=float, nargs='+', default=[0], help='seconds (or minimum and maximum) '
+                                                                              'waited before each response')
+    parser.add_argument('--lights-rate', type=float, help='light commands accepted per second')
+    parser.add_argument('--groups-rate', type=float, help='group commands accepted per second')
+    parser.add_argument('--error-rate', type=float, default=0, help='part of the commands failing (0 to 1)')
+    parser.add_argument('--ssdp', action='store_true', help='respond to the SSDP discovery')
+    parser.add_argument('--register', action='store_true', help='write the bridge in bridges.json (needs --username)')
+    args = parser.parse_args()
+
+    emulator = BridgeEmulator(args.lights, args.kinds.split(','), args.group_size, args.host, args.port, args.serial,
+                              args.username, args.latency[0] if len(args.latency) == 1 else tuple(args.latency[:2]),
+                              {'lights': args.lights_rate, 'groups': args.groups_rate}, args.error_rate,
+                              SSDP_ADDRESS if args.ssdp else None)
+    if args.register:
+        emulator.register()
+    print('Bridge emulator listening on http://%s:%d, press Enter to press the link button, Ctrl+C to stop' % (
+        emulator.host, emulator.port))
+    try:
+        while True:
+            if not sys.stdin.readline():
+                # no console (i.e. running in background), the link button can only be pressed from code
+                while True:
+                    time.sleep(3600)
+            emulator.press_link_button()
+            print('Link button pressed')
+            print(emulator)
+    except KeyboardInterrupt:
+        emulator.close()
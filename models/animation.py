@@ -0,0 +1,322 @@
+import functools
+import threading
+import time
+from models.lights import Light, DimmableLight, ExtendedColorLight, gamutB
+from models.utils.color import Gamut
+from models.utils.scheduler import priority_lane, PRIORITY_BACKGROUND
+
+
+# easing curves, mapping the progress between two keyframes (0 to 1) to the progress of the values (0 to 1)
+EASINGS = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t * t,
+    'ease_out': lambda t: t * (2 - t),
+    'ease_in_out': lambda t: t * t * (3 - 2 * t),
+    'step': lambda t: 1.0 if t >= 1 else 0.0
+}
+
+
+def get_lights(targets):
+    """
+    Get the lights to animate.
+
+    :param targets: Light, collection of lights (Group, Lights) or list of lights and collections.
+    :return List of light objects, each light only once.
+    """
+
+    if isinstance(targets, Light):
+        targets = [targets]
+    elif hasattr(targets, 'values'):
+        targets = list(targets.values())
+    lights = []
+    for target in targets:
+        for light in ([target] if isinstance(target, Light) else get_lights(target)):
+            if light not in lights:
+                lights.append(light)
+    return lights
+
+
+class Keyframe(object):
+    """
+    State of the lights at a given time of an animation (see Animation).
+
+    At most one color is given (rgb, xy or ct), the values not given are kept from the previous keyframe.
+    The easing curve shapes the transition from the previous keyframe to this one (see EASINGS).
+    """
+
+    def __init__(self, time, rgb=None, xy=None, ct=None, bri=None, easing='linear'):
+        """
+        :param time: Seconds from the start of the animation.
+        :param rgb: Color as (red, green, blue), values between 0 and 255 (converted for the gamut of each light).
+        :param xy: Color as [x, y] coordinates in CIE color space.
+        :param ct: Mired color temperature (converted to a color for the lights not supporting it).
+        :param bri: Brightness (1 to 254), from the color if not given (rgb).
+        :param easing: Name of the easing curve (see EASINGS) or function of the progress (0 to 1).
+        """
+
+        if len([value for value in (rgb, xy, ct) if value is not None]) > 1:
+            raise ValueError('Only one color (rgb, xy or ct) can be given for a keyframe')
+        if not callable(easing) and (easing not in EASINGS):
+            raise ValueError('Unknown easing ' + str(easing) + ', use one of ' + ', '.join(sorted(EASINGS)))
+        self.time = float(time)
+        self.color = ('rgb', tuple(rgb)) if rgb is not None else ('xy', tuple(xy)) if xy is not None else (
+            ('ct', ct) if ct is not None else None)
+        self.bri = bri
+        self.easing = easing if callable(easing) else EASINGS[easing]
+
+    def __repr__(self):
+        return 'Keyframe * %.2fs * %s * bri = %s' % (self.time, self.color, self.bri)
+
+
+class Animation(object):
+    """
+    Keyframe animation of a set of lights, played in background by the bridge (see Bridge.animate()).
+
+    The state of each light is computed for every frame beforehand (the colors are converted for the gamut of each
+    light), so playing a frame only sends the states that changed since the previous frame, each with a transition
+    time of one frame so that the light moves smoothly to it. The frames are played at the times they are due:
+    when sending takes longer than a frame, the frames missed are dropped (not sent late).
+
+    Statistics:
+        played - Frames played.
+        dropped - Frames dropped because the animation fell behind.
+        sent - Light states sent.
+        errors - Light states that could not be sent.
+    """
+
+    DEFAULT_FPS = 5
+
+    def __init__(self, lights, keyframes, fps=DEFAULT_FPS, loop=False):
+        """
+        :param lights: Lights to animate (see get_lights()).
+        :param keyframes: List of Keyframe, the first one is usually at time 0.
+        :param fps: Frames per second (the bridge handles about 10 light commands per second in total).
+        :param loop: Start again from the first frame after the last one, until stopped.
+        """
+
+        if not keyframes:
+            raise ValueError('At least one keyframe is needed')
+        self.lights = get_lights(lights)
+        self.keyframes = sorted(keyframes, key=lambda keyframe: keyframe.time)
+        self.fps = float(fps)
+        self.loop = loop
+        self.duration = self.keyframes[-1].time
+        # transition time of each state sent, in multiples of 100ms
+        self.transitiontime = int(round(10 / self.fps))
+        self.count = max(1, int(round(self.duration * self.fps)) + (0 if loop else 1))
+        self.played = self.dropped = self.sent = self.errors = 0
+        self._frames = self._compute_frames()
+        self._start_time = None
+        self._index = -1
+        self._sent_states = {}
+        self._finished = threading.Event()
+
+    def __repr__(self):
+        return ('Animation * %d lights * %.2fs * %d fps%s * played = %d * dropped = %d * sent = %d * errors = %d * %s' %
+                (len(self.lights), self.duration, self.fps, ' (loop)' if self.loop else '', self.played, self.dropped,
+                 self.sent, self.errors, 'running' if self.running else 'stopped'))
+
+    @property
+    def running(self):
+        return (self._start_time is not None) and not self._finished.is_set()
+
+    def stop(self):
+        """
+        Stop the animation, the lights keep their current state.
+
+        :return None
+        """
+
+        self._finished.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the animation is over (not looping) or stopped.
+
+        :param timeout: Maximum number of seconds to wait (optional).
+        :return True if the animation is over, False on timeout.
+        """
+
+        return self._finished.wait(timeout)
+
+    def _compute_frames(self):
+        # state of each light for each frame, computed once for all lights of the same kind and gamut
+        frames = {}
+        by_kind = {}
+        for light in self.lights:
+            kind = (light.__class__, getattr(light, 'gamut', None))
+            if kind not in by_kind:
+                by_kind[kind] = [self._get_state(light, n / self.fps) for n in range(self.count)]
+            frames[light] = by_kind[kind]
+        return frames
+
+    def _get_state(self, light, t):
+        # keyframes before and after the given time (with the values kept from the previous keyframes)
+        previous = current = self._resolve(0)
+        for n in range(1, len(self.keyframes)):
+            if self.keyframes[n].time > t:
+                previous, current = self._resolve(n - 1), self._resolve(n)
+                break
+        else:
+            previous = current = self._resolve(len(self.keyframes) - 1)
+        (time0, color0, bri0, index0), (time1, color1, bri1, index1) = previous, current
+        progress = self.keyframes[index1].easing(min(1.0, max(0.0, (t - time0) / (time1 - time0)))) if (
+            time1 > time0) else 1.0
+
+        state = {}
+        if isinstance(light, DimmableLight) and not (color0 and color1 and (color0[0] == color1[0] == 'rgb')):
+            # white lights only follow the brightness (given or of the rgb colors)
+            color0 = color1 = None
+        if (color0 is not None) and (color1 is not None):
+            if color0[0] == color1[0] == 'ct' and isinstance(light, ExtendedColorLight):
+                state['ct'] = int(round(color0[1] + (color1[1] - color0[1]) * progress))
+            elif color0[0] == color1[0] == 'rgb':
+                rgb = [c0 + (c1 - c0) * progress for c0, c1 in zip(color0[1], color1[1])]
+                x, y, bri = (light.gamut or gamutB).rgb_to_xy_bri(*[int(round(c)) for c in rgb])
+                if not isinstance(light, DimmableLight):
+                    state['xy'] = [round(x, 4), round(y, 4)]
+                state['bri'] = max(1, min(254, bri))
+            else:
+                # different kinds of colors (or ct for a light not supporting it) are interpolated as xy
+                (x0, y0, b0), (x1, y1, b1) = self._get_xy(light, color0), self._get_xy(light, color1)
+                state['xy'] = [round(x0 + (x1 - x0) * progress, 4), round(y0 + (y1 - y0) * progress, 4)]
+                if (b0 is not None) and (b1 is not None):
+                    state['bri'] = max(1, min(254, int(round(b0 + (b1 - b0) * progress))))
+        if (bri0 is not None) and (bri1 is not None):
+            state['bri'] = max(1, min(254, int(round(bri0 + (bri1 - bri0) * progress))))
+        return state
+
+    def _resolve(self, n):
+        # time, color, brightness of a keyframe (values not given are kept from the previous keyframes) and index
+        color = bri = None
+        for keyframe in self.keyframes[:n + 1]:
+            color = keyframe.color if keyframe.color is not None else color
+            bri = keyframe.bri if keyframe.bri is not None else bri
+        return self.keyframes[n].time, color, bri, n
+
+    @staticmethod
+    def _get_xy(light, color):
+        # x, y and brightness (None if not part of the color) of a color for the gamut of a light
+        if color[0] == 'xy':
+            return color[1][0], color[1][1], None
+        if color[0] == 'ct':
+            x, y, bri = (light.gamut or gamutB).rgb_to_xy_bri(*Gamut.get_rgb_from_ct(color[1], 255))
+            return x, y, None
+        return (light.gamut or gamutB).rgb_to_xy_bri(*color[1])
+
+    def _start(self, start_time):
+        self._start_time = start_time
+
+    @property
+    def _next_time(self):
+        return self._start_time + (self._index + 1) / self.fps
+
+    def _play(self, now):
+        # play the frame due now, the ones missed in between are dropped
+        index = int((now - self._start_time) * self.fps)
+        if not self.loop:
+            index = min(index, self.count - 1)
+        if index <= self._index:
+            return
+        self.dropped += index - self._index - 1
+        self._index = index
+        self.played += 1
+
+        frame = index % self.count
+        calls = {}
+        for light in self.lights:
+            state = self._frames[light][frame]
+            if state and (state != self._sent_states.get(light)):
+                sent = dict(state, transitiontime=self.transitiontime)
+                if light not in self._sent_states:
+                    sent['on'] = True
+                self._sent_states[light] = state
+                call = functools.partial(light._put_state, sent)
+                calls.setdefault(light._comms.fanout, []).append((light.name, call))
+        # the states are sent concurrently (for each bridge), after the commands of the user (see priority_lane())
+        with priority_lane(PRIORITY_BACKGROUND):
+            for fanout, fanout_calls in calls.items():
+                result = fanout.run(fanout_calls)
+                self.sent += len(result.results)
+                self.errors += len(result.errors)
+
+        if not self.loop and (index >= self.count - 1):
+            self._finished.set()
+
+
+class Animator(object):
+    """
+    Background player of the animations of a bridge: a single thread plays the frames of all animations
+    when they are due (see Animation). Several animations can run at the same time on different lights.
+    """
+
+    def __init__(self):
+        self._animations = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        with self._lock:
+            return "".join(str(animation) + '\n' for animation in self._animations)
+
+    @property
+    def running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def play(self, animation):
+        """
+        Start playing an animation.
+
+        :param animation: Animation instance, its lights must not be animated already.
+        :return The animation.
+        """
+
+        with self._lock:
+            self._animations = [playing for playing in self._animations if playing.running]
+            busy = [light for playing in self._animations for light in playing.lights if light in animation.lights]
+            if busy:
+                raise ValueError('Lights already animated : ' + ', '.join(light.name for light in busy))
+            animation._start(time.time())
+            self._animations.append(animation)
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name='Animator')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return animation
+
+    def stop(self):
+        """
+        Stop all animations.
+
+        :return None
+        """
+
+        with self._lock:
+            for animation in self._animations:
+                animation.stop()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._animations = [animation for animation in self._animations if animation.running]
+                if not self._animations:
+                    self._thread = None
+                    return
+                animations = list(self._animations)
+
+            now = time.time()
+            next_time = min(animation._next_time for animation in animations)
+            if next_time > now:
+                self._wakeup.wait(next_time - now)
+                self._wakeup.clear()
+                continue
+            for animation in animations:
+                if animation.running and (animation._next_time <= now):
+                    try:
+                        animation._play(now)
+                    except Exception as e:
+                        print('Error playing ' + str(animation) + ' : ' + str(e))
+                        animation.stop()
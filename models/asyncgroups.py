@@ -0,0 +1,87 @@
+import time
+from models.utils.userobj import UserObj
+from models.utils.asynccomms import AsyncComms
+from models.utils.asynccallableobj import AsyncCallableObj
+from models.asynclights import AsyncLights
+
+
+class AsyncGroup(UserObj):
+    """
+    Asynchronous (asyncio) model of a Philips hue lights group, Python 3 only.
+
+    Same properties as Group, read from the last data fetched from the bridge (see 'await group.refresh()').
+    Each method supported by the lights from the group can be awaited for the whole group
+    (i.e. 'await group.turn_on()'), running concurrently for all its lights, at most max_concurrency at the same time.
+    """
+
+    def __init__(self, comms, id, data, lights, max_concurrency=10):
+        assert (isinstance(comms, AsyncComms))
+        assert (isinstance(lights, AsyncLights))
+        self._comms = comms
+        self.id = id
+        self._data = data
+        self.refresh_time = time.time()
+
+        group_lights = [light for light in lights.values() if light.id in self.lights]
+        # each group will have a dictionary formed by the lights associated, indexed by light name
+        self.set_obj({light.name: light for light in group_lights})
+        # each light name from this group becomes a member of this instance, with the proper object associated
+        [setattr(self, light._adapt_name(), light) for light in group_lights]
+
+        # each public coroutine of the lights is awaited for all lights from the group that support it
+        method_names = set(method_name for light in group_lights for method_name in dir(light)
+                           if not method_name.startswith('_') and method_name != 'refresh' and
+                           callable(getattr(light, method_name)))
+        for method_name in method_names:
+            setattr(self, method_name, AsyncCallableObj([getattr(light, method_name) for light in group_lights
+                                                         if hasattr(light, method_name)], max_concurrency))
+
+    def __repr__(self):
+        return "".join(light.__repr__() + '\n' for light in self.values())
+
+    @property
+    def name(self):
+        return self._data['name']
+
+    @property
+    def lights(self):
+        return self._data['lights']
+
+    @property
+    def type(self):
+        return self._data['type']
+
+    @property
+    def state(self):
+        return self._data['state']
+
+    @property
+    def action(self):
+        return self._data['action']
+
+    def _adapt_name(self):
+        return self.name.replace(' ', '')
+
+    async def refresh(self):
+        self._data = await self._comms.get('groups/' + str(self.id))
+        self.refresh_time = time.time()
+
+
+class AsyncGroups(UserObj):
+    """
+    Asynchronous (asyncio) control of all groups, Python 3 only.
+
+    Contains a dictionary of all the group objects in the setup indexed by the group names.
+    Also you can address each group as a member of this instance.
+    """
+
+    def __init__(self, comms, lights, groups_data, max_concurrency=10):
+        all_groups = [AsyncGroup(comms, key, value, lights, max_concurrency) for key, value in groups_data.items()]
+        # build the dictionary of groups indexed by group name
+        self.set_obj({group.name: group for group in all_groups})
+        # each group name becomes a member of this instance with the proper object associated
+        [setattr(self, group._adapt_name(), group) for group in all_groups]
+
+    def __repr__(self):
+        return "".join('(' + str(group.id) + ') * ' + group.name + ' (' + group.type + ') *** ' + ', '.join(
+            [light.name for light in group.values()]) + '\n' for group in self.values())
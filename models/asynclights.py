@@ -0,0 +1,222 @@
+import json
+import time
+from models.lights import ModelsGamut, get_gamut_by_name
+from models.utils.userobj import UserObj
+from models.utils.asynccomms import AsyncComms
+from models.utils.asynccallableobj import AsyncCallableObj
+
+
+class AsyncLight(object):
+    """
+    Asynchronous (asyncio) model of a Philips hue light, Python 3 only.
+
+    Same properties as Light, read from the last state fetched from the bridge (no request is sent when reading).
+    Call 'await light.refresh()' (or 'await bridge.lights.refresh()' for all lights at once) to update them.
+    All methods that set something on the bridge must be awaited.
+    """
+
+    def __init__(self, comms, id, data):
+        assert (isinstance(comms, AsyncComms))
+        self._comms = comms
+        self.id = id
+        self._data = data
+        self.refresh_time = time.time()
+
+        # for colored light bulbs identify the gamut according to its model id
+        if self.model_id in ModelsGamut:
+            self.gamut = get_gamut_by_name(ModelsGamut[self.model_id])
+        else:
+            self.gamut = None
+
+    def __repr__(self):
+        return '(' + self.id + ') * ' + self.name + ' * ' + ('On' if self.on else 'Off') + ' * bri = ' + str(self.bri)
+
+    @property
+    def name(self):
+        return self._data['name']
+
+    @property
+    def on(self):
+        return self._data['state']['on']
+
+    @property
+    def bri(self):
+        return self._data['state']['bri']
+
+    @property
+    def alert(self):
+        return self._data['state']['alert']
+
+    @property
+    def reachable(self):
+        return self._data['state']['reachable']
+
+    @property
+    def type(self):
+        return self._data['type']
+
+    @property
+    def model_id(self):
+        return self._data['modelid']
+
+    @property
+    def manufacturer_name(self):
+        return self._data['manufacturername']
+
+    @property
+    def unique_id(self):
+        return self._data['uniqueid']
+
+    @property
+    def sw_version(self):
+        return self._data['swversion']
+
+    def _adapt_name(self):
+        return self.name.replace(' ', '')
+
+    def _update(self, data):
+        self._data = data
+        self.refresh_time = time.time()
+
+    async def _put_state(self, state):
+        return await self._comms.put('lights/' + str(self.id) + '/state', json.dumps(state))
+
+    async def refresh(self):
+        self._update(await self._comms.get('lights/' + str(self.id)))
+
+    async def set_state(self, **state):
+        return await self._put_state(state)
+
+    async def turn_on(self):
+        return await self._put_state({'on': True})
+
+    async def turn_off(self):
+        return await self._put_state({'on': False})
+
+    async def set_bri(self, bri):
+        return await self._put_state({'bri': bri})
+
+    async def set_alert(self, alert):
+        return await self._put_state({'alert': alert})
+
+
+class AsyncDimmableLight(AsyncLight):
+    """
+    Asynchronous model of a white Philips hue light (same properties as an AsyncLight instance).
+    """
+
+
+class AsyncColorLight(AsyncLight):
+    """
+    Asynchronous model of a colored Philips hue light (same properties as a ColorLight instance).
+    """
+
+    def __repr__(self):
+        return super(AsyncColorLight, self).__repr__() + ' * Gamut ' + str(self.gamut.name) + ' [x,y] = ' + str(
+            self.xy) + ' * sat = ' + str(self.sat) + ' * hue = ' + str(self.hue)
+
+    @property
+    def hue(self):
+        return self._data['state']['hue']
+
+    @property
+    def sat(self):
+        return self._data['state']['sat']
+
+    @property
+    def effect(self):
+        return self._data['state']['effect']
+
+    @property
+    def xy(self):
+        return self._data['state']['xy']
+
+    @property
+    def colormode(self):
+        return self._data['state']['colormode']
+
+    async def set_hue(self, hue):
+        return await self._put_state({'hue': hue})
+
+    async def set_sat(self, sat):
+        return await self._put_state({'sat': sat})
+
+    async def set_effect(self, effect):
+        return await self._put_state({'effect': effect})
+
+    async def set_xy(self, x, y):
+        return await self._put_state({'xy': [x, y]})
+
+    async def set_color(self, red, green, blue):
+        if self.gamut is None:
+            print('Model id not found. Cannot set color !!!')
+            return
+
+        x, y, bri = self.gamut.rgb_to_xy_bri(red, green, blue)
+        return await self._put_state({'xy': [x, y], 'bri': bri})
+
+
+class AsyncExtendedColorLight(AsyncColorLight):
+    """
+    Asynchronous model of a colored Philips hue light supporting color temperature
+    (same properties as an ExtendedColorLight instance).
+    """
+
+    def __repr__(self):
+        return super(AsyncExtendedColorLight, self).__repr__() + ' * ct = ' + str(self.ct)
+
+    @property
+    def ct(self):
+        return self._data['state']['ct']
+
+    async def set_ct(self, ct):
+        return await self._put_state({'ct': ct})
+
+
+# Associate a light type (as reported by the bridge) with its asynchronous model.
+AsyncLightTypes = {
+    'Dimmable light': AsyncDimmableLight,
+    'Color light': AsyncColorLight,
+    'Extended color light': AsyncExtendedColorLight
+}
+
+
+class AsyncLights(UserObj):
+    """
+    Asynchronous (asyncio) control of all lights, Python 3 only.
+
+    Contains a dictionary of all the light objects in the setup indexed by the light names.
+    Also you can access each light as a member of this instance.
+    Each method supported by the lights can be awaited for all lights at once (i.e. 'await lights.turn_on()'),
+    running concurrently for all lights, at most max_concurrency at the same time.
+    """
+
+    def __init__(self, comms, lights_data, max_concurrency=10):
+        self._comms = comms
+        all_lights = [AsyncLightTypes[value['type']](comms, key, value)
+                      for key, value in lights_data.items() if value['type'] in AsyncLightTypes]
+        # build the dictionary of lights indexed by light name
+        self.set_obj({light.name: light for light in all_lights})
+        # each light name becomes a member of this instance with the proper object associated
+        [setattr(self, light._adapt_name(), light) for light in all_lights]
+
+        # each public coroutine of the lights is awaited for all lights that support it
+        method_names = set(method_name for light in all_lights for method_name in dir(light)
+                           if not method_name.startswith('_') and method_name != 'refresh' and
+                           callable(getattr(light, method_name)))
+        for method_name in method_names:
+            setattr(self, method_name, AsyncCallableObj([getattr(light, method_name) for light in all_lights
+                                                         if hasattr(light, method_name)], max_concurrency))
+
+    def __repr__(self):
+        return "".join(str(light) + '\n' for light in self.values())
+
+    async def refresh(self):
+        """
+        Update the state of all lights with a single request.
+
+        :return None
+        """
+
+        lights_data = await self._comms.get('lights/')
+        [light._update(lights_data[light.id]) for light in self.values() if light.id in lights_data]
@@ -0,0 +1,259 @@
+import functools
+import math
+import threading
+import time
+from models.lights import ColorLight, gamutB
+from models.animation import get_lights
+from models.utils.color import numpy
+
+
+class FrameStream(object):
+    """
+    Ambient lighting from a stream of frames (i.e. screen captures or a video): each light follows the average color
+    of a region of the frames.
+
+    Frames are pushed from any thread (see push() and feed()) into a single slot holding the latest frame only:
+    a frame not processed yet is replaced by the newer one, so the stream never falls behind the source.
+    A background thread takes the latest frame at most 'rate' times per second, averages the regions
+    (vectorized with NumPy), converts the colors for the gamut of each light and sends only the lights whose
+    color changed noticeably (see 'threshold' and 'bri_threshold').
+    The frames are not copied: NumPy arrays are read in place, buffers through memoryview/numpy.frombuffer().
+
+    Statistics:
+        received - Frames pushed.
+        replaced - Frames replaced by a newer one before being processed.
+        processed - Frames processed.
+        sent - Light states sent.
+        skipped - Light states not sent, the color did not change enough.
+        errors - Light states that could not be sent.
+    """
+
+    DEFAULT_RATE = 10
+
+    def __init__(self, regions, rate=DEFAULT_RATE, threshold=0.01, bri_threshold=8, sample_step=4):
+        """
+        :param regions: Dictionary of the region followed by each light, group or list of lights, i.e.
+                        {bridge.lights.Left: (0, 0, 0.3, 1), bridge.groups.Living: (0.3, 0, 0.7, 1)}.
+                        A region is (left, top, right, bottom) as fractions of the frame width and height.
+        :param rate: Maximum number of frames processed (and states sent) per second.
+        :param threshold: Minimum distance between the xy color sent last and the new one for sending it
+                          (0.01 is about the smallest color difference noticeable).
+        :param bri_threshold: Minimum brightness difference for sending the new brightness.
+        :param sample_step: Average one pixel out of 'sample_step' on each row and column of the regions.
+        """
+
+        self.regions = []
+        for target, region in regions.items():
+            left, top, right, bottom = region
+            if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+                raise ValueError('Invalid region ' + str(region) + ', use (left, top, right, bottom) between 0 and 1')
+            self.regions.extend((light, tuple(region)) for light in get_lights(target))
+        self.rate = float(rate)
+        self.threshold = threshold
+        self.bri_threshold = bri_threshold
+        self.sample_step = max(1, int(sample_step))
+        self.transitiontime = int(round(10 / self.rate))
+        self.received = self.replaced = self.processed = self.sent = self.skipped = self.errors = 0
+        self._frame = None                  # latest frame pushed, not processed yet: (frame, width, height)
+        self._lock = threading.Lock()
+        self._new_frame = threading.Event()
+        self._stop = threading.Event()
+        self._sent_states = {}              # last x, y, bri sent for each light
+        self._thread = None
+
+    def __repr__(self):
+        return ('FrameStream * %d lights * %d fps * received = %d * replaced = %d * processed = %d * sent = %d * '
+                'skipped = %d * errors = %d * %s' % (len(self.regions), self.rate, self.received, self.replaced,
+                                                     self.processed, self.sent, self.skipped, self.errors,
+                                                     'running' if self.running else 'stopped'))
+
+    @property
+    def running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def start(self):
+        """
+        Start processing the frames pushed, in background.
+
+        :return The FrameStream instance.
+        """
+
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='FrameStream')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop processing the frames, the lights keep their current color.
+
+        :return None
+        """
+
+        self._stop.set()
+        self._new_frame.set()
+        if self.running and (self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def push(self, frame, width=None, height=None):
+        """
+        Hand over a new frame, replacing the previous one if it was not processed yet. The frame is not copied,
+        so it must not be modified afterwards (push a new buffer for each frame).
+
+        :param frame: Height x width x 3 NumPy array of red, green, blue values (uint8),
+                      or buffer of width * height * 3 bytes (bytes, bytearray, memoryview, array('B'), etc.).
+        :param width: Width of the frame in pixels (only for buffers).
+        :param height: Height of the frame in pixels (only for buffers).
+        :return None
+        """
+
+        if (numpy is not None) and isinstance(frame, numpy.ndarray) and (frame.ndim == 3):
+            height, width = frame.shape[:2]
+        elif (width is None) or (height is None):
+            raise ValueError('The width and height are needed for a frame given as a buffer')
+        with self._lock:
+            if self._frame is not None:
+                self.replaced += 1
+            self._frame = (frame, width, height)
+            self.received += 1
+        self._new_frame.set()
+
+    def feed(self, stream, width, height, fps=None):
+        """
+        Push the frames read from a file or a pipe of raw RGB frames (i.e. the output of
+        'ffmpeg -i video.mp4 -f rawvideo -pix_fmt rgb24 -'), until its end or until the stream is stopped.
+
+        :param stream: Binary file object, each frame is width * height * 3 bytes.
+        :param width: Width of the frames in pixels.
+        :param height: Height of the frames in pixels.
+        :param fps: Frames read per second (optional, as fast as the file or pipe gives them by default,
+                    i.e. set it for playing a file in real time).
+        :return Number of frames read.
+        """
+
+        size = width * height * 3
+        count = 0
+        start = time.time()
+        while not self._stop.is_set():
+            # a new buffer for each frame, filled in place (the previous one may still be processed)
+            frame = bytearray(size)
+            read = 0
+            while read < size:
+                n = stream.readinto(memoryview(frame)[read:])
+                if not n:
+                    return count
+                read += n
+            self.push(frame, width, height)
+            count += 1
+            if fps:
+                delay = start + float(count) / fps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        return count
+
+    def _run(self):
+        next_time = time.time()
+        while not self._stop.is_set():
+            self._new_frame.wait()
+            delay = next_time - time.time()
+            if delay > 0:
+                # not more than 'rate' frames per second, newer frames pushed meanwhile replace this one
+                self._stop.wait(delay)
+                continue
+            with self._lock:
+                frame = self._frame
+                self._frame = None
+                self._new_frame.clear()
+            if self._stop.is_set() or (frame is None):
+                continue
+            next_time = max(next_time + 1 / self.rate, time.time())
+            try:
+                self._process(*frame)
+            except Exception as e:
+                print('Error processing frame : ' + str(e))
+            self.processed += 1
+
+    def _process(self, frame, width, height):
+        averages = self._get_averages(frame, width, height)
+
+        # colors converted together for each gamut
+        by_gamut = {}
+        for (light, region), rgb in zip(self.regions, averages):
+            by_gamut.setdefault(getattr(light, 'gamut', None) or gamutB, []).append((light, rgb))
+        calls = {}
+        for gamut, lights in by_gamut.items():
+            values = gamut.rgb_to_xy_bri_batch([rgb for light, rgb in lights])
+            if numpy is None:
+                values = [values[n:n + 3] for n in range(0, len(values), 3)]
+            for (light, rgb), (x, y, bri) in zip(lights, values):
+                state = self._get_state(light, x, y, int(bri))
+                if state is None:
+                    self.skipped += 1
+                    continue
+                call = functools.partial(light._put_state, state)
+                calls.setdefault(light._comms.fanout, []).append((light.name, call))
+
+        for fanout, fanout_calls in calls.items():
+            result = fanout.run(fanout_calls)
+            self.sent += len(result.results)
+            self.errors += len(result.errors)
+
+    def _get_state(self, light, x, y, bri):
+        # state to send if the color changed enough since the last one sent, otherwise None
+        is_color = isinstance(light, ColorLight) and (light.gamut is not None)
+        bri = max(1, min(254, bri))
+        previous = self._sent_states.get(light)
+        state = {}
+        if is_color and ((previous is None) or (math.hypot(x - previous[0], y - previous[1]) >= self.threshold)):
+            state['xy'] = [round(x, 4), round(y, 4)]
+        if (previous is None) or (abs(bri - previous[2]) >= self.bri_threshold):
+            state['bri'] = bri
+        if not state:
+            return None
+        if previous is None:
+            state['on'] = True
+        x, y = state['xy'] if 'xy' in state else previous[:2] if previous else (x, y)
+        self._sent_states[light] = (x, y, state.get('bri', previous[2] if previous else bri))
+        state['transitiontime'] = self.transitiontime
+        return state
+
+    def _get_pixel_bounds(self, region, width, height):
+        left, top, right, bottom = region
+        x0, y0 = int(left * width), int(top * height)
+        return x0, y0, max(x0 + 1, int(round(right * width))), max(y0 + 1, int(round(bottom * height)))
+
+    def _get_averages(self, frame, width, height):
+        # average (red, green, blue) of the region of each light
+        step = self.sample_step
+        if numpy is not None:
+            if not isinstance(frame, numpy.ndarray):
+                frame = numpy.frombuffer(frame, dtype=numpy.uint8, count=width * height * 3)
+            frame = frame.reshape(height, width, 3)
+            averages = numpy.empty((len(self.regions), 3))
+            for n, (light, region) in enumerate(self.regions):
+                x0, y0, x1, y1 = self._get_pixel_bounds(region, width, height)
+                averages[n] = frame[y0:y1:step, x0:x1:step].mean(axis=(0, 1))
+            return numpy.rint(averages).astype(int).tolist()
+
+        view = frame
+        if hasattr(memoryview, 'cast'):
+            # Python 2 slices the buffer itself (a memoryview cannot be sliced with a step)
+            view = memoryview(frame)
+            if (view.ndim != 1) or (view.format != 'B'):
+                view = view.cast('B')
+        averages = []
+        for light, region in self.regions:
+            x0, y0, x1, y1 = self._get_pixel_bounds(region, width, height)
+            totals = [0, 0, 0]
+            pixels = 0
+            for y in range(y0, y1, step):
+                start = (y * width + x0) * 3
+                stop = (y * width + x1) * 3
+                for c in range(3):
+                    # only the sampled components of the row are copied
+                    totals[c] += sum(bytearray(view[start + c:stop:3 * step]))
+                pixels += len(range(x0, x1, step))
+            averages.append(tuple(int(round(float(total) / pixels)) for total in totals))
+        return averages
@@ -1,9 +1,10 @@
-import time
+import json
 from models.utils.comms import Comms
+from models.utils.stream import StreamSender
 from models.utils.userobj import UserObj
 from models.utils.callableobj import CallableObj
 from models.utils.testobj import TestObj
-from models.lights import Lights, REFRESH_TIMEOUT
+from models.lights import Lights, StateBatch, get_methods_by_name
 
 
 class Group(UserObj, TestObj):
@@ -13,6 +14,7 @@ class Group(UserObj, TestObj):
 
     Contains a dictionary of all the light objects in the group indexed by the light names.
     Also you can address each light from the group as a member of this instance.
+    The lights and the methods of the group are set up when first accessed (member, [], TAB completion).
 
     Properties:
         name - Unique name of the group.
@@ -22,63 +24,141 @@ class Group(UserObj, TestObj):
         action - Get On/Off state, brightness and alert settings of the group
     """
 
-    def __init__(self, comms, id, lights=None):
+    def __init__(self, comms, id, lights=None, data=None):
         assert(isinstance(comms, Comms))
         self._comms = comms
         self.id = id
-        self.__data = self._refresh()
-        self.refresh_time = time.time()
+        # initial data is either given (already fetched along with the other groups) or fetched when first needed
+        if data is not None:
+            self._comms.cache.set(self._path, data)
 
         # lights is a dictionary of light objects from the setup (Lights() instance) indexed after light names
         if lights:
             assert (isinstance(lights, Lights))
-            # each group will have a dictionary formed by the lights associated, indexed by light name
-            self.set_obj({light.name: light for light in lights.values() if light.id in self.lights})
-
-            # in order to control all lights from this group get the all parameters that can be set
-            method_names = []
-            # for each light in the setup
-            for light in lights.values():
-                # choose only lights from this group
-                if light.id in self.lights:
-                    # each light name from this group becomes a member of this instance,
-                    # with the proper object associated
-                    setattr(self, light._adapt_name(), light)
-
-                    for method_name in dir(light):
-                        # get all methods
-                        if callable(getattr(light, method_name)) and not method_name.startswith('_'):
-                            # and keep only those which are not private
-                            method_names.append(method_name)
-
-            # for each method
-            for method_name in set(method_names):
-                methods = []
-                # for each light in the setup
-                for light in lights.values():
-                    # choose lights from the groups only
-                    if light.id in self.lights:
-                        # if the light supports this setting (i.e. cannot call set_color() for white lights, etc.)
-                        if method_name in dir(light):
-                            # get the method object
-                            methods.append(getattr(light, method_name))
-                # Each method will be called for each light in the group.
-                # If a method does not apply to all lights in the group,
-                # it will be called only for those lights that it can be applied to.
-                # Basically when calling bridge.groups.Living.turn_on() this will execute for all lights in the group,
-                # like calling bridge.groups.Living.LivingMain.turn_on(), bridge.groups.Living.LivingTwo.turn_on(), etc.
-                setattr(self, method_name, CallableObj(methods))
+        # the lights of the group and their methods are only wired when first needed (see _resolve())
+        self._setup_lights = lights if lights else None
+        self._resolved = False
+        self._stream = None     # colors streamed over UDP, see start_stream()
+
+    def __getattr__(self, name):
+        # called only for members not found, i.e. lights and methods of a group not resolved yet (or '_obj')
+        if name.startswith('__') or self.__dict__.get('_resolved', True):
+            raise AttributeError(name)
+        self._resolve()
+        return getattr(self, name)
+
+    def __dir__(self):
+        # TAB completion lists the lights and methods of the group
+        self._resolve()
+        return sorted(set(dir(self.__class__)) | set(self.__dict__))
+
+    def _resolve(self):
+        if self._resolved:
+            return
+        self._resolved = True
+        lights = self._setup_lights
+        self._setup_lights = None
+        if lights is None:
+            # without the lights of the setup there are no lights (nor methods) to wire
+            self.set_obj({})
+            return
+
+        # the lights of the group are looked up by id (see Lights.by_id())
+        member_ids = set(self.lights)
+        group_lights = [lights.by_id(light_id) for light_id in self.lights if lights.by_id(light_id) is not None]
+        # each group will have a dictionary formed by the lights associated, indexed by light name
+        self.set_obj({light.name: light for light in group_lights})
+        # each light name from this group becomes a member of this instance, with the proper object associated
+        [setattr(self, light._adapt_name(), light) for light in group_lights]
+
+        # in order to control all lights from this group get all parameters that can be set
+        # (from the methods of each light class)
+        for method_name, methods in get_methods_by_name(group_lights, self.__class__).items():
+            # Each method will be called for each light in the group.
+            # If a method does not apply to all lights in the group (i.e. cannot call set_color() for white lights),
+            # it will be called only for those lights that it can be applied to.
+            # Basically when calling bridge.groups.Living.turn_on() this will execute for all lights in the group,
+            # like calling bridge.groups.Living.LivingMain.turn_on(), bridge.groups.Living.LivingTwo.turn_on(), etc.
+            # If it applies to all lights, it is sent once with the group action when possible.
+            action = self._put_action if len(methods) == len(member_ids) else None
+            setattr(self, method_name, CallableObj(methods, action, self._comms.fanout))
+
+    def _reindex(self, obj):
+        # a group not resolved yet indexes its lights with their current names when resolved
+        if self._resolved:
+            super(Group, self)._reindex(obj)
+
+    def _test(self):
+        self._resolve()
+        super(Group, self)._test()
 
     def __repr__(self):
         return "".join(light.__repr__() + '\n' for light in self.values())
 
+    def batch(self):
+        """
+        Collect all settings made inside a 'with' block, for all lights from the group, and send them at the end
+        of the block with a single request for each light (see Light.batch()).
+
+        :return StateBatch context manager.
+        """
+
+        return StateBatch(self.values())
+
+    def start_stream(self, rate=StreamSender.DEFAULT_RATE, color_space='rgb', address=None,
+                     port=StreamSender.DEFAULT_PORT):
+        """
+        Stream the colors of the lights from the group over UDP, 'rate' times per second, i.e. for effects
+        changing faster than the bridge handles PUT requests:
+
+            stream = bridge.groups.Living.start_stream()
+            stream.set_color(bridge.groups.Living.LivingTall, 255, 0, 0)
+            bridge.groups.Living.stop_stream()
+
+        The stream starts with the current color of each light. The messages follow the layout of the Hue
+        entertainment API, but are sent as plain UDP (not DTLS): use address/port of a StreamReceiver for testing.
+
+        :param rate: Messages sent per second.
+        :param color_space: 'rgb' (see StreamSender.set_color()) or 'xy' (see StreamSender.set_xy()).
+        :param address: IP receiving the stream (optional, the bridge by default).
+        :param port: UDP port receiving the stream.
+        :return The StreamSender instance (print it to see the messages sent).
+        """
+
+        self.stop_stream()
+        self._resolve()
+        colors = {}
+        for light in self.values():
+            if color_space == 'rgb':
+                colors[light.id] = light._get_rgb(light._data['state'])
+            elif light._data['state'].get('xy') is not None:
+                colors[light.id] = tuple(light._data['state']['xy']) + (light.bri,)
+        self._stream = self._comms.start_stream(self.lights, rate, color_space, colors, address, port)
+        return self._stream
+
+    def stop_stream(self):
+        """
+        Stop streaming the colors of the lights from the group, the lights keep the last colors sent.
+
+        :return None
+        """
+
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+
+    @property
+    def _path(self):
+        return 'groups/' + str(self.id)
+
     @property
     def _data(self):
-        # perform GET at minimum 5s
-        if time.time() - self.refresh_time >= REFRESH_TIMEOUT:
-            self.__data = self._refresh()
-            self.refresh_time = time.time()
-        return self.__data
+        # shared state cache, all groups are refreshed together with a single GET (see StateCache)
+        return self._comms.cache.get(self._path)
+
+    @property
+    def refresh_time(self):
+        return self._comms.cache.refresh_time(self._path)
 
     @property
     def name(self):
@@ -101,7 +181,7 @@ class Group(UserObj, TestObj):
         return self._data['action']
 
     @classmethod
-    def _scan(cls, comms, type=None, lights=None):
+    def _scan(cls, comms, type=None, lights=None, groups_data=None):
         """
         Scan for a given group type.
 
@@ -109,21 +189,22 @@ class Group(UserObj, TestObj):
         :param type: Type of the group
         :param lights: Dictionary of light objects from the setup, indexed after light names (Lights() instance).
                        Each Group instance will add its lights based on self.lights and each Light.id from lights.
+        :param groups_data: Data of all groups indexed by group id, as returned by GET 'groups/'
+                            (optional, fetched from the bridge if not given).
         :return: List of groups filtered after type parameter, or all groups if type is None.
         """
 
-        d = comms.get('groups/')
-        group_ids = []
-        for key, value in d.items():
-            if (type is None) or (value['type'] == type):
-                group_ids.append(key)
-        return [cls(comms, group_id, lights) for group_id in group_ids]
+        d = groups_data if groups_data is not None else comms.cache.get_all('groups')
+        return [cls(comms, key, lights, value) for key, value in d.items() if (type is None) or (value['type'] == type)]
 
     def _adapt_name(self):
         return self.name.replace(' ', '')
 
-    def _refresh(self):
-        return self._comms.get('groups/' + str(self.id))
+    def _force_refresh(self):
+        self._comms.cache.invalidate(self._path)
+
+    def _put_action(self, state):
+        self._comms.put(self._path + '/action', json.dumps(state))
 
 
 class RoomGroup(Group):
@@ -139,12 +220,12 @@ class RoomGroup(Group):
         return self._data['class']
 
     @classmethod
-    def _scan(cls, comms, lights=None):
+    def _scan(cls, comms, lights=None, groups_data=None):
         """
         Get a list of all 'Room' groups type from the setup.
         """
 
-        return super(RoomGroup, cls)._scan(comms, 'Room', lights)
+        return super(RoomGroup, cls)._scan(comms, 'Room', lights, groups_data)
 
 
 class LightGroup(Group):
@@ -160,12 +241,12 @@ class LightGroup(Group):
         return self._data['recycle']
 
     @classmethod
-    def _scan(cls, comms, lights=None):
+    def _scan(cls, comms, lights=None, groups_data=None):
         """
         Get a list of all 'LightGroup' groups type from the setup.
         """
 
-        return super(LightGroup, cls)._scan(comms, 'LightGroup', lights)
+        return super(LightGroup, cls)._scan(comms, 'LightGroup', lights, groups_data)
 
 
 class Groups(UserObj):
@@ -176,10 +257,14 @@ class Groups(UserObj):
     Also you can address each group as a member of this instance.
     """
 
-    def __init__(self, comms, lights=None):
-        # get a list with each type of group
-        room_groups = RoomGroup._scan(comms, lights)
-        custom_groups = LightGroup._scan(comms, lights)
+    def __init__(self, comms, lights=None, groups_data=None):
+        # all groups are fetched with a single request (unless already given) and split after each type of group
+        if groups_data is None:
+            groups_data = comms.cache.get_all('groups')
+        else:
+            comms.cache.set_all('groups', groups_data)
+        room_groups = RoomGroup._scan(comms, lights, groups_data)
+        custom_groups = LightGroup._scan(comms, lights, groups_data)
         all_groups = room_groups + custom_groups
         # and build the dictionary of groups indexed by group name
         self.set_obj({group.name: group for group in all_groups})
@@ -191,21 +276,16 @@ class Groups(UserObj):
             [light.name for light in group.values()]) + '\n' for group in self.values())
 
     def _add_group(self, comms, id, lights):
-        # add an instance for the new group
-        group = LightGroup(comms, id, lights)
-        # and add it to the dictionary of groups indexed by group name
-        self[group.name] = group
+        # add an instance for the new group to the dictionary of groups indexed by group name (and by group id),
         # this group name becomes another member of this instance with the group object associated
-        setattr(self, group._adapt_name(), group)
+        self._add(LightGroup(comms, str(id), lights))
 
     def _delete_group(self, id):
         # get the group to be deleted
-        for group in self.values():
-            if group.id == str(id):
-                key = group.name
-                # delete the member associated with this group name
-                delattr(self, group._adapt_name())
-                # delete the instance
-                del group
-        # delete the group from the dictionary
-        self.pop(key)
+        group = self.by_id(id)
+        if group is None:
+            print('Error : group ' + str(id) + ' not found')
+            return
+        # delete it from the dictionary of groups and the member associated with its name
+        self._remove(group)
+        group._comms.cache.discard(group._path)
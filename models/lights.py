@@ -1,12 +1,18 @@
-import time
+import functools
+import json
+import threading
 from models.utils.comms import Comms
 from models.utils.userobj import UserObj
 from models.utils.callableobj import CallableObj
 from models.utils.testobj import TestObj
-from models.utils.color import Gamut
+from models.utils.color import Gamut, numpy
+from models.utils.colortable import ColorTable
+from models.utils.statecache import StateCache
 
 
-REFRESH_TIMEOUT = 5
+# seconds before the state of the lights is fetched again, kept for compatibility: the lights are now refreshed
+# by the state cache of Comms, see StateCache.DEFAULT_TTL (and Comms.cache.ttl for changing it)
+REFRESH_TIMEOUT = StateCache.DEFAULT_TTL['lights']
 
 # Associate a model id with a gamut.
 ModelsGamut = {
@@ -95,6 +101,59 @@ def get_gamut_by_name(name):
         return None
 
 
+# color temperature shown for white lights (2700K), see Lights.get_rgb()
+WHITE_LIGHT_CT = 370
+
+
+def use_color_tables(enabled=True, max_error=ColorTable.DEFAULT_MAX_ERROR, cache_dir=None):
+    """
+    Convert the colors of set_color() from a lookup table for each gamut (A, B and C) instead of the formulas.
+    Each table is built (or read from its cache file) as colors are converted for its gamut.
+
+    :param enabled: False to use the formulas again.
+    :param max_error: Maximum difference of x and y from the formulas (see ColorTable).
+    :param cache_dir: Directory of the cache files (optional, 'color_tables' in the current directory by default).
+    :return None
+    """
+
+    for gamut in (gamutA, gamutB, gamutC):
+        gamut.use_table(enabled, max_error, cache_dir)
+
+
+def sends_state(get_state):
+    """
+    Setter of a light sending the state returned by get_state(self, *args, **kwargs). The state can also be computed
+    without sending it (see Light._capture_state()), get_state() must not have side effects.
+
+    :param get_state: Function returning the state to send (None if nothing can be sent).
+    :return The setter.
+    """
+
+    @functools.wraps(get_state)
+    def setter(self, *args, **kwargs):
+        state = get_state(self, *args, **kwargs)
+        if state is not None:
+            self._put_state(state)
+    setter.get_state = get_state
+    return setter
+
+
+def get_methods_by_name(lights, collection_class):
+    """
+    Build the table of methods called by a collection of lights (Lights, Group) for each light that supports them.
+
+    :param lights: List of light objects (DimmableLight, ColorLight, ExtendedColorLight).
+    :param collection_class: Class of the collection, methods it implements itself (i.e. batch()) are left out.
+    :return Dictionary of lists of bound methods (in the order of the lights) indexed by method name.
+    """
+
+    methods_by_name = {}
+    for light in lights:
+        for method_name in light._get_methods(collection_class):
+            methods_by_name.setdefault(method_name, []).append(getattr(light, method_name))
+    return methods_by_name
+
+
 class Light(TestObj):
     """
     Model of a Philips hue light.
@@ -115,12 +174,17 @@ class Light(TestObj):
         sw_version - Software version running on the light.
     """
 
-    def __init__(self, comms, id):
+    # public methods of each light class (left out the ones of a collection class), see _get_methods()
+    _method_tables = {}
+
+    def __init__(self, comms, id, data=None):
         assert (isinstance(comms, Comms))
         self._comms = comms
         self.id = id
-        self.__data = self._refresh()
-        self.refresh_time = time.time()
+        self._local = threading.local()     # attributes collected in a 'with light.batch():' block, for each thread
+        # initial state is either given (already fetched along with the other lights) or fetched when first needed
+        if data is not None:
+            self._comms.cache.set(self._path, data)
 
         # for colored light bulbs identify the gamut according to its model id
         if self.model_id in ModelsGamut:
@@ -132,12 +196,17 @@ class Light(TestObj):
         return '(' + self.id + ') * ' + self.name + ' * ' + ('On' if self.on else 'Off') + ' * bri = ' + str(self.bri)
 
     @property
-    def _data(self, refresh=False):
-        # perform GET at minimum 5s
-        if refresh or (time.time() - self.refresh_time >= REFRESH_TIMEOUT):
-            self.__data = self._refresh()
-            self.refresh_time = time.time()
-        return self.__data
+    def _path(self):
+        return 'lights/' + str(self.id)
+
+    @property
+    def _data(self):
+        # shared state cache, all lights are refreshed together with a single GET (see StateCache)
+        return self._comms.cache.get(self._path)
+
+    @property
+    def refresh_time(self):
+        return self._comms.cache.refresh_time(self._path)
 
     @property
     def name(self):
@@ -180,7 +249,7 @@ class Light(TestObj):
         return self._data['swversion']
 
     @classmethod
-    def _scan(cls, comms, color=None):
+    def _scan(cls, comms, color=None, lights_data=None):
         """
         Scan for a given light type.
 
@@ -189,34 +258,124 @@ class Light(TestObj):
                       DimmableLight = white light
                       ColorLight = colored light
                       ExtendedColorLight = same as ColorLight, but color temperature can also be set)
+        :param lights_data: Data of all lights indexed by light id, as returned by GET 'lights/'
+                            (optional, fetched from the bridge if not given).
         :return: List of lights filtered after color parameter, or all lights if color is None.
         """
 
-        light_ids = []
-        d = comms.get('lights/')
-        [light_ids.append(key) for key, value in d.items() if (color is None) or (value['type'] == color)]
-        return [cls(comms, light_id) for light_id in light_ids]
+        d = lights_data if lights_data is not None else comms.cache.get_all('lights')
+        return [cls(comms, key, value) for key, value in d.items() if (color is None) or (value['type'] == color)]
+
+    @classmethod
+    def _get_methods(cls, collection_class=None):
+        # computed once for each light class, instead of looking up every attribute of every light
+        key = (cls, collection_class)
+        if key not in Light._method_tables:
+            Light._method_tables[key] = tuple(sorted(
+                method_name for method_name in dir(cls)
+                if not method_name.startswith('_') and callable(getattr(cls, method_name)) and
+                not hasattr(collection_class, method_name)))
+        return Light._method_tables[key]
 
     def _adapt_name(self):
         return self.name.replace(' ', '')
 
-    def _refresh(self):
-        return self._comms.get('lights/' + str(self.id))
-
     def _force_refresh(self):
-        self.refresh_time = time.time() - REFRESH_TIMEOUT
+        self._comms.cache.invalidate(self._path)
+
+    @property
+    def _batch_state(self):
+        # a batch only collects the settings made by its own thread, the other threads keep sending theirs
+        return getattr(self._local, 'batch_state', None)
+
+    @_batch_state.setter
+    def _batch_state(self, state):
+        self._local.batch_state = state
+
+    def _put_state(self, state):
+        # inside a batch the attributes are only collected, to be sent at the end of the batch with a single request
+        batch_state = self._batch_state
+        if batch_state is not None:
+            batch_state.update(state)
+        else:
+            self._comms.put(self._path + '/state', json.dumps(state))
+
+    def _capture_state(self, method_name, *args, **kwargs):
+        # the state a setting would send for this light, without sending it (see sends_state()),
+        # None while in a batch or if the setting does not send a state computed beforehand
+        get_state = getattr(getattr(self.__class__, method_name, None), 'get_state', None)
+        if (self._batch_state is not None) or (get_state is None):
+            return None
+        return get_state(self, *args, **kwargs)
+
+    def batch(self):
+        """
+        Collect all settings made inside a 'with' block and send them with a single request at the end of the block
+        (nothing is sent if an exception is raised inside the block), i.e.:
+
+            with bridge.lights.LivingTall.batch():
+                bridge.lights.LivingTall.turn_on()
+                bridge.lights.LivingTall.set_bri(200)
+                bridge.lights.LivingTall.set_ct(300)
+
+        :return StateBatch context manager.
+        """
+
+        return StateBatch([self])
 
+    @sends_state
+    def set_state(self, **state):
+        """
+        Set several attributes of the light with a single request,
+        i.e. set_state(on=True, bri=200, xy=[0.4, 0.4], transitiontime=4).
+
+        :param state: Attributes to set
+                      (see 'http://<bridgeIP>/debug/clip.html', PUT '/api/<bridgeUser>/lights/<id>/state').
+        :return None
+        """
+
+        return dict(state)
+
+    @sends_state
     def turn_on(self):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"on":true}')
+        return {'on': True}
 
+    @sends_state
     def turn_off(self):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"on":false}')
+        return {'on': False}
 
+    @sends_state
     def set_bri(self, bri):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"bri":' + str(bri) + '}')
+        return {'bri': bri}
 
+    @sends_state
     def set_alert(self, alert):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"alert":"' + str(alert) + '"}')
+        return {'alert': alert}
+
+
+class StateBatch(object):
+    """
+    Context manager collecting the settings of one or more lights (see Light.batch()) and sending them,
+    for each light, as a single PUT request to 'lights/<id>/state' at the end of the block.
+    """
+
+    def __init__(self, lights):
+        self._lights = list(lights)
+        self._owned = []
+
+    def __enter__(self):
+        # nested batches for the same light are merged into the outer one
+        self._owned = [light for light in self._lights if light._batch_state is None]
+        for light in self._owned:
+            light._batch_state = {}
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for light in self._owned:
+            state, light._batch_state = light._batch_state, None
+            if state and exc_type is None:
+                light._put_state(state)
+        self._owned = []
 
 
 class DimmableLight(Light):
@@ -225,12 +384,18 @@ class DimmableLight(Light):
     """
 
     @classmethod
-    def _scan(cls, comms, color='Dimmable light'):
+    def _scan(cls, comms, color='Dimmable light', lights_data=None):
         """
         Get a list of all white light objects from the setup.
         """
 
-        return super(DimmableLight, cls)._scan(comms, color)
+        return super(DimmableLight, cls)._scan(comms, color, lights_data)
+
+    def _get_rgb(self, state):
+        # color shown for the given state (warm white)
+        if not state['on']:
+            return 0, 0, 0
+        return Gamut.get_rgb_from_ct(WHITE_LIGHT_CT, state['bri'])
 
 
 class ColorLight(Light):
@@ -250,6 +415,8 @@ class ColorLight(Light):
         colormode - Identify the light color mode:
             'hs' - set from hue and sat
             'xy' - set from 'xy'
+        rgb - Current color of the light as a tuple (red, green, blue), each between 0 and 255 ((0, 0, 0) if off),
+              converted from xy, hue and sat or ct depending on the color mode.
     """
 
     def __repr__(self):
@@ -276,34 +443,61 @@ class ColorLight(Light):
     def colormode(self):
         return self._data['state']['colormode']
 
+    @property
+    def rgb(self):
+        return self._get_rgb(self._data['state'])
+
     @classmethod
-    def _scan(cls, comms, color='Color light'):
+    def _scan(cls, comms, color='Color light', lights_data=None):
         """
         Get a list of all colored light (except the ones that support color temperature setting) objects from the setup.
         """
 
-        return super(ColorLight, cls)._scan(comms, color)
+        return super(ColorLight, cls)._scan(comms, color, lights_data)
+
+    def _get_rgb(self, state):
+        # color shown for the given state
+        if not state['on']:
+            return 0, 0, 0
+        colormode = state.get('colormode', 'xy')
+        if colormode == 'hs':
+            return Gamut.get_rgb_from_hue_and_sat(state['hue'], state['sat'], state['bri'])
+        if colormode == 'ct':
+            return Gamut.get_rgb_from_ct(state['ct'], state['bri'])
+        if self.gamut is None:
+            return Gamut.get_rgb_from_ct(WHITE_LIGHT_CT, state['bri'])
+        return self.gamut.get_rgb_from_xy_and_bri(state['xy'][0], state['xy'][1], state['bri'])
 
+    @sends_state
     def set_hue(self, hue):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"hue":' + str(hue) + '}')
+        return {'hue': hue}
 
+    @sends_state
     def set_sat(self, sat):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"sat":' + str(sat) + '}')
+        return {'sat': sat}
 
+    @sends_state
     def set_effect(self, effect):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"effect":"' + str(effect) + '"}')
+        return {'effect': effect}
 
+    @sends_state
     def set_xy(self, x, y):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"xy":[' + str(x) + ',' + str(y) + ']' + '}')
+        return {'xy': [x, y]}
 
-    def set_color(self, red, green, blue):
+    def _get_color_state(self, red, green, blue):
+        # both xy and brightness are sent with a single request (None if the gamut of the light is not known)
         if self.gamut is None:
+            return None
+        x, y, bri = self.gamut.rgb_to_xy_bri(red, green, blue)
+        return {'xy': [x, y], 'bri': bri}
+
+    def set_color(self, red, green, blue):
+        state = self._get_color_state(red, green, blue)
+        if state is None:
             print('Model id not found. Cannot set color !!!')
             return
-
-        x, y, bri = self.gamut.get_xy_and_bri_from_rgb(red, green, blue)
-        self.set_xy(x, y)
-        self.set_bri(bri)
+        self._put_state(state)
+    set_color.get_state = _get_color_state
 
 
 class ExtendedColorLight(ColorLight):
@@ -326,14 +520,15 @@ class ExtendedColorLight(ColorLight):
         return self._data['state']['ct']
 
     @classmethod
-    def _scan(cls, comms, color='Extended color light'):
+    def _scan(cls, comms, color='Extended color light', lights_data=None):
         """
         Get a list of all colored light (that support color temperature setting) objects from the setup.
         """
-        return super(ExtendedColorLight, cls)._scan(comms, color)
+        return super(ExtendedColorLight, cls)._scan(comms, color, lights_data)
 
+    @sends_state
     def set_ct(self, ct):
-        self._comms.put('lights/' + str(self.id) + '/state', '{"ct":' + str(ct) + '}')
+        return {'ct': ct}
 
 
 class Lights(UserObj, TestObj):
@@ -344,42 +539,79 @@ class Lights(UserObj, TestObj):
     Also you can access each light as a member of this instance.
     """
 
-    def __init__(self, comms):
-        # get a list with each type of light
-        dimmable_lights = DimmableLight._scan(comms)
-        color_lights = ColorLight._scan(comms)
-        extended_color_lights = ExtendedColorLight._scan(comms)
+    # see REFRESH_TIMEOUT of this module
+    REFRESH_TIMEOUT = REFRESH_TIMEOUT
+
+    def __init__(self, comms, lights_data=None):
+        self._comms = comms
+        # all lights are fetched with a single request (unless already given) and split after each type of light
+        if lights_data is None:
+            lights_data = comms.cache.get_all('lights')
+        else:
+            comms.cache.set_all('lights', lights_data)
+        dimmable_lights = DimmableLight._scan(comms, lights_data=lights_data)
+        color_lights = ColorLight._scan(comms, lights_data=lights_data)
+        extended_color_lights = ExtendedColorLight._scan(comms, lights_data=lights_data)
         all_lights = dimmable_lights + color_lights + extended_color_lights
         # and build the dictionary of lights indexed by light name
         self.set_obj({light.name: light for light in all_lights})
         # each light name becomes a member of this instance with the proper object associated
         [setattr(self, light._adapt_name(), light) for light in all_lights]
 
-        # in order to control all lights get all parameters that can be set
-        method_names = []
-        for light in all_lights:
-            # for each light
-            for method_name in dir(light):
-                # get all methods
-                if callable(getattr(light, method_name)) and not method_name.startswith('_'):
-                    # and keep only those which are not private
-                    method_names.append(method_name)
-
-        # for each method
-        for method_name in set(method_names):
-            methods = []
-            # for each light in the setup
-            for light in all_lights:
-                # if the light supports this setting (i.e. cannot call set_color() for white lights, etc.)
-                if method_name in dir(light):
-                    # get the method object
-                    methods.append(getattr(light, method_name))
+        # in order to control all lights get all parameters that can be set (from the methods of each light class)
+        for method_name, methods in get_methods_by_name(all_lights, self.__class__).items():
             # Each method will be called for each light in the setup.
-            # If a method does not apply to all lights in the setup,
+            # If a method does not apply to all lights in the setup (i.e. cannot call set_color() for white lights),
             # it will be called only for those lights that it can be applied to.
             # Basically when calling bridge.lights.turn_on() this will execute for all lights in the setup,
             # like calling bridge.lights.LivingMain.turn_on(), bridge.lights.Stairs.turn_on(), etc.
-            setattr(self, method_name, CallableObj(methods))
+            # If it applies to all lights, it is sent once with the action of group 0 (all lights) when possible.
+            action = self._put_action if len(methods) == len(all_lights) == len(lights_data) else None
+            setattr(self, method_name, CallableObj(methods, action, self._comms.fanout))
 
     def __repr__(self):
         return "".join(str(light) + '\n' for light in self.values())
+
+    def batch(self):
+        """
+        Collect all settings made inside a 'with' block, for all lights, and send them at the end of the block
+        with a single request for each light, i.e.:
+
+            with bridge.lights.batch():
+                bridge.lights.turn_on()
+                bridge.lights.set_bri(200)
+
+        :return StateBatch context manager.
+        """
+
+        return StateBatch(self.values())
+
+    def get_rgb(self):
+        """
+        Get the current color of all lights at once (i.e. for a preview of the whole setup), from a single snapshot
+        of the state of the lights. Colors set from xy are converted together for each gamut
+        (see Gamut.xy_bri_to_rgb_batch(), vectorized when NumPy is installed).
+
+        :return Dictionary of (red, green, blue) tuples indexed by light name ((0, 0, 0) for the lights that are off,
+                white lights are shown warm white).
+        """
+
+        lights_data = self._comms.cache.get_all('lights')
+        result = {}
+        xy_lights = {}      # name and state of the lights set from xy, for each gamut
+        for name, light in self.items():
+            state = lights_data[light.id]['state'] if light.id in lights_data else light._data['state']
+            if state['on'] and light.gamut is not None and state.get('colormode', 'xy') == 'xy':
+                xy_lights.setdefault(light.gamut, []).append((name, state))
+            else:
+                result[name] = light._get_rgb(state)
+
+        for gamut, lights in xy_lights.items():
+            rgb = gamut.xy_bri_to_rgb_batch([(state['xy'][0], state['xy'][1], state['bri']) for name, state in lights])
+            rgb = rgb.tolist() if numpy is not None else [rgb[n:n + 3] for n in range(0, len(rgb), 3)]
+            result.update((name, tuple(color)) for (name, state), color in zip(lights, rgb))
+        return result
+
+    def _put_action(self, state):
+        # group 0 is a special group containing all lights
+        self._comms.put('groups/0/action', json.dumps(state))
@@ -0,0 +1,24 @@
+import asyncio
+
+
+class AsyncCallableObj(object):
+    """
+    Asynchronous counterpart of CallableObj, Python 3 only.
+
+    Inherited by classes with a collection of coroutine methods added at run-time (AsyncLights, AsyncGroup),
+    stored in _method_list. Awaiting the call runs the method for each light associated concurrently,
+    with at most max_concurrency of them in flight at the same time.
+    """
+
+    def __init__(self, method_list, max_concurrency=10):
+        self._method_list = method_list
+        self.max_concurrency = max_concurrency
+
+    async def __call__(self, *args, **kwargs):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def call(method):
+            async with semaphore:
+                return await method(*args, **kwargs)
+
+        return await asyncio.gather(*[call(method) for method in self._method_list])
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+
+class AsyncComms(object):
+    """
+    Asynchronous (asyncio) communication with the bridge, Python 3 only.
+
+    Same requests as Comms (get, put, post, delete), but awaitable, so the event loop is never blocked.
+    Requests are sent on a small pool of keep-alive connections, at most max_connections at the same time.
+    The bridge IP and user are not discovered here, see AsyncBridge.create() for reusing the ones from Comms.
+    """
+
+    def __init__(self, bridge_ip, bridge_user, max_connections=4, timeout=10):
+        self.bridge_ip = bridge_ip
+        self.bridge_user = bridge_user
+        self.max_connections = max_connections  # maximum number of requests in flight (and connections open)
+        self.timeout = timeout                  # seconds to wait for each request (None = wait forever)
+        self._idle = []                         # idle keep-alive connections, as (reader, writer) pairs
+        self._semaphore = None                  # created on first use, inside the running event loop
+
+    async def get(self, url_suffix):
+        """
+        Get data from the bridge. See 'http://<bridgeIP>/debug/clip.html'.
+
+        :param url_suffix: Object to get (i.e. 'lights', 'groups', 'schedules', 'config', 'scenes', 'rules', etc.).
+        :return Requested data in JSON format.
+        """
+
+        status, reason, data = await self._request('GET', r'/api/' + self.bridge_user + r'/' + url_suffix)
+        return json.loads(data.decode('utf-8'))
+
+    async def put(self, url_suffix, data):
+        """
+        Set data on the bridge. See 'http://<bridgeIP>/debug/clip.html'.
+
+        :param url_suffix: Object to set (i.e. 'lights/<light_id>/state').
+        :param data: data to send to the bridge (i.e. '{"bri":200}').
+        :return Response in JSON format.
+        """
+
+        status, reason, data = await self._request('PUT', r'/api/' + self.bridge_user + r'/' + url_suffix, data)
+        return json.loads(data.decode('utf-8'))
+
+    async def post(self, url_suffix, data):
+        """
+        Add data to the bridge. See 'http://<bridgeIP>/debug/clip.html'.
+
+        :param url_suffix: Object to which the data is added (i.e. '<bridgeUser>/groups').
+        :param data: data to add to the bridge (i.e. '{"name":"Group X", "lights":["2", "4"]}').
+        :return Response in JSON format or None if the request failed.
+        """
+
+        status, reason, data = await self._request('POST', r'/api/' + url_suffix, data)
+        if status == 200:
+            return json.loads(data.decode('utf-8'))
+        return None
+
+    async def delete(self, url_suffix):
+        """
+        Delete data from the bridge. See 'http://<bridgeIP>/debug/clip.html'.
+
+        :param url_suffix: Object to be deleted (i.e. 'groups/<group_id>').
+        :return Response in JSON format or None if the request failed.
+        """
+
+        status, reason, data = await self._request('DELETE', r'/api/' + self.bridge_user + r'/' + url_suffix)
+        if status == 200:
+            return json.loads(data.decode('utf-8'))
+        return None
+
+    async def close(self):
+        """
+        Close all idle connections.
+
+        :return None
+        """
+
+        idle, self._idle = self._idle, []
+        [writer.close() for reader, writer in idle]
+
+    async def _request(self, method, url, body=None, headers=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        async with self._semaphore:
+            if self._idle:
+                try:
+                    return await asyncio.wait_for(self._send(self._idle.pop(), method, url, body, headers),
+                                                  self.timeout)
+                except (OSError, EOFError, ValueError, asyncio.IncompleteReadError):
+                    # the bridge closed the idle connection, send the request once again on a new one
+                    if method == 'POST':
+                        raise
+            connection = await asyncio.wait_for(asyncio.open_connection(self.bridge_ip, 80), self.timeout)
+            return await asyncio.wait_for(self._send(connection, method, url, body, headers), self.timeout)
+
+    async def _send(self, connection, method, url, body, headers):
+        reader, writer = connection
+        body = (body or '').encode('utf-8')
+        request = ['%s %s HTTP/1.1' % (method, url),
+                   'Host: %s' % self.bridge_ip,
+                   'Content-Length: %d' % len(body)]
+        request += ['%s: %s' % (key, value) for key, value in (headers or {}).items()]
+        try:
+            writer.write(('\r\n'.join(request) + '\r\n\r\n').encode('ascii') + body)
+            status, reason, data, keep_alive = await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            writer.close()
+        return status, reason, data
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = (await reader.readline()).decode('ascii', 'ignore')
+        if not status_line:
+            raise EOFError('Connection closed by the bridge')
+        version, status, reason = (status_line.rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = (version == 'HTTP/1.1') and (headers.get('connection', '').lower() != 'close')
+        if 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await reader.readline()
+                    break
+                data += await reader.readexactly(size)
+                await reader.readline()
+        else:
+            # no length given, the body ends when the bridge closes the connection
+            data = await reader.read()
+            keep_alive = False
+        return int(status), reason, data, keep_alive
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def topology_version(datastore):
+    """
+    Compute the topology version of a setup: it changes when lights or groups are added, removed, renamed
+    or when the lights of a group change (but not when the state of a light changes).
+
+    :param datastore: Whole datastore of the bridge (GET '/api/<bridgeUser>/').
+    :return Version as a hexadecimal string.
+    """
+
+    topology = {
+        'lights': sorted((id, light.get('name')) for id, light in datastore.get('lights', {}).items()),
+        'groups': sorted((id, group.get('name'), sorted(group.get('lights', [])))
+                         for id, group in datastore.get('groups', {}).items())
+    }
+    return hashlib.sha1(json.dumps(topology, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class BridgeStore(object):
+    """
+    Configuration of the bridges, stored in 'bridges.json' (JSON) and indexed by bridge serial number.
+
+    For each bridge: IP, previous IPs (most recent first), user, model, time of the last successful validation
+    and last known topology version (see topology_version()). The bridge used last is the default one.
+    The configuration of a single bridge from 'bridge.cfg' (IP and user) is taken over if there is no 'bridges.json'.
+    """
+
+    # previous IPs kept for each bridge (tried before scanning when the bridge is not found at its IP)
+    MAX_ADDRESSES = 4
+    # shared by all instances, bridges opened in parallel update the same file (see BridgeCluster)
+    _lock = threading.Lock()
+
+    def __init__(self, path=None, legacy_path=None):
+        """
+        :param path: Path of the JSON file (optional, 'bridges.json' in the current directory by default).
+        :param legacy_path: Path of the old configuration file (optional, 'bridge.cfg' in the current directory).
+        """
+
+        self.path = path or os.path.join(os.path.abspath('.'), 'bridges.json')
+        self.legacy_path = legacy_path or os.path.join(os.path.abspath('.'), 'bridge.cfg')
+
+    def __repr__(self):
+        data = self._load()
+        return "".join(serial + (' (default)' if serial == data['default'] else '') + ' * ' + str(bridge.get('ip')) +
+                       ' * ' + str(bridge.get('model')) + '\n' for serial, bridge in data['bridges'].items())
+
+    def serials(self):
+        """
+        Get the serial numbers of all bridges stored.
+
+        :return List of serial numbers.
+        """
+
+        with self._lock:
+            return list(self._load()['bridges'])
+
+    def get(self, serial=None):
+        """
+        Get the configuration of a bridge.
+
+        :param serial: Serial number of the bridge (optional, the default bridge if not given).
+        :return Dictionary with 'serial', 'ip', 'addresses', 'username', 'model', 'validated' and 'topology_version',
+                or None if the bridge is not stored.
+        """
+
+        with self._lock:
+            data = self._load()
+            serial = serial if serial is not None else data['default']
+            bridge = data['bridges'].get(serial)
+            return dict(bridge, serial=serial) if bridge is not None else None
+
+    def update(self, serial, **values):
+        """
+        Store values of a bridge (i.e. update('001788fffe4b21c0', ip='192.168.1.20', username='...')).
+        The bridge becomes the default one when its IP is stored (i.e. after connecting to it).
+
+        :param serial: Serial number of the bridge.
+        :param values: Values to store ('ip', 'username', 'model', 'validated', 'topology_version').
+        :return None
+        """
+
+        with self._lock:
+            data = self._load()
+            bridge = data['bridges'].setdefault(serial, {'ip': None, 'addresses': [], 'username': '', 'model': None,
+                                                         'validated': None, 'topology_version': None})
+            bridge.update(values)
+            if values.get('ip'):
+                # the new IP goes first in the addresses tried
+                bridge['addresses'] = ([values['ip']] + [ip for ip in bridge['addresses']
+                                                         if ip != values['ip']])[:self.MAX_ADDRESSES]
+                data['default'] = serial
+            self._save(data)
+
+    def remove(self, serial):
+        """
+        Remove a bridge from the configuration.
+
+        :param serial: Serial number of the bridge.
+        :return None
+        """
+
+        with self._lock:
+            data = self._load()
+            data['bridges'].pop(serial, None)
+            if data['default'] == serial:
+                data['default'] = next(iter(data['bridges']), None)
+            self._save(data)
+
+    def read_legacy(self):
+        """
+        Read the configuration from 'bridge.cfg' (IP on the first line, user on the second line).
+
+        :return Dictionary with 'ip', 'addresses' and 'username' (serial number not known yet), None if not found.
+        """
+
+        try:
+            with open(self.legacy_path, 'r') as f:
+                ip = f.readline().replace('\n', '')
+                username = f.readline().replace('\n', '')
+        except IOError:
+            return None
+        return {'serial': None, 'ip': ip, 'addresses': [ip], 'username': username, 'model': None, 'validated': None,
+                'topology_version': None}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except IOError:
+            data = {}
+        except ValueError:
+            print('Error : ' + self.path + ' is not valid JSON, ignoring it')
+            data = {}
+        data.setdefault('default', None)
+        data.setdefault('bridges', {})
+        return data
+
+    def _save(self, data):
+        # write a temporary file first, so that the configuration is never left half written
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
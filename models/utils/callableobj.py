@@ -1,12 +1,59 @@
+import functools
+from models.utils.scheduler import priority_lane, PRIORITY_BULK
+from models.utils.fanout import FanOutResult
+
+
 class CallableObj(object):
     """
     Inherited by classes with a collection of methods added at run-time (Lights, Group), stored in _method_list,
     designed to execute a method foreach light associated (DimmableLight, ColorLight, ExtendedColorLight),
     if that light supports the method.
+    Commands sent this way go on the bulk priority lane (see CommandScheduler).
+
+    If a group action is given (all lights support the method) and the method would send the same state
+    to every light (i.e. turn_on(), set_bri(200), but not set_color() for lights with different gamuts),
+    the state is sent once for all lights with the group action instead of once for each light.
+    Otherwise the method is called for each light concurrently when a fan-out executor is given (see FanOutExecutor),
+    or one light after another on the calling thread inside a batch (see StateBatch).
+
+    A call returns a FanOutResult with the value returned or the exception raised for each light, by light name.
     """
 
-    def __init__(self, method_list):
+    def __init__(self, method_list, action=None, fanout=None):
         self._method_list = method_list
+        self._action = action   # function sending a state to all the lights at once (i.e. Group._put_action)
+        self._fanout = fanout   # runs the method for each light concurrently (see FanOutExecutor)
 
     def __call__(self, *args, **kwargs):
-        [method(*args, **kwargs) for method in self._method_list]
+        with priority_lane(PRIORITY_BULK):
+            state = self._common_state(*args, **kwargs) if self._action is not None else None
+            if state:
+                return self._call_action(state)
+            calls = [(method.__self__.name, functools.partial(method, *args, **kwargs)) for method in self._method_list]
+            if (self._fanout is not None) and not self._in_batch():
+                return self._fanout.run(calls)
+            result = FanOutResult()
+            [result.call(name, call) for name, call in calls]
+            return result
+
+    def _in_batch(self):
+        # the lights in a batch of the calling thread only collect the settings (see Light.batch()), which must be
+        # done from that thread: the batch is not seen from the threads of the fan-out executor
+        return any(getattr(method.__self__, '_batch_state', None) is not None for method in self._method_list)
+
+    def _call_action(self, state):
+        # one request for all lights, its outcome applies to each of them
+        outcome = FanOutResult()
+        outcome.call('action', lambda: self._action(state))
+        result = FanOutResult()
+        for method in self._method_list:
+            result.results.update((method.__self__.name, value) for value in outcome.results.values())
+            result.errors.update((method.__self__.name, error) for error in outcome.errors.values())
+        return result
+
+    def _common_state(self, *args, **kwargs):
+        # the state each light would be sent (see Light._capture_state), if it is the same for all lights
+        states = [method.__self__._capture_state(method.__name__, *args, **kwargs) for method in self._method_list]
+        if states and all(state == states[0] for state in states):
+            return states[0]
+        return None
@@ -1,4 +1,31 @@
+import colorsys
 import math
+from array import array
+from models.utils.colortable import ColorTable
+
+try:
+    import numpy
+except ImportError:
+    # batch conversions fall back to the array module
+    numpy = None
+
+# wide gamut RGB (D65) to XYZ, see Gamut.get_xy_and_bri_from_rgb()
+RGB_TO_XYZ = ((0.664511, 0.154324, 0.162028),
+              (0.283881, 0.668433, 0.047685),
+              (0.000088, 0.072310, 0.986039))
+
+
+def _inverse(matrix):
+    # inverse of a 3 x 3 matrix (cofactors divided by the determinant)
+    (a, b, c), (d, e, f), (g, h, i) = matrix
+    determinant = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+    return ((e * i - f * h) / determinant, (c * h - b * i) / determinant, (b * f - c * e) / determinant), \
+           ((f * g - d * i) / determinant, (a * i - c * g) / determinant, (c * d - a * f) / determinant), \
+           ((d * h - e * g) / determinant, (b * g - a * h) / determinant, (a * e - b * d) / determinant)
+
+
+# XYZ to wide gamut RGB (D65), see Gamut.get_rgb_from_xy_and_bri()
+XYZ_TO_RGB = _inverse(RGB_TO_XYZ)
 
 
 class Gamut(object):
@@ -23,6 +50,12 @@ class Gamut(object):
         self.green_blue_b = (self.green_y * self.blue_x - self.green_x * self.blue_y) / (self.blue_x - self.green_x)
         self.blue_red_m = (self.red_y - self.blue_y) / (self.red_x - self.blue_x)
         self.blue_red_b = (self.blue_y * self.red_x - self.blue_x * self.red_y) / (self.red_x - self.blue_x)
+        # line and ends of each edge of the gamut, in the order used to pick the closest one (see gamut_aprox())
+        self._edges = [(self.red_green_m, self.red_green_b, self.red_x, self.red_y, self.green_x, self.green_y),
+                       (self.green_blue_m, self.green_blue_b, self.green_x, self.green_y, self.blue_x, self.blue_y),
+                       (self.blue_red_m, self.blue_red_b, self.blue_x, self.blue_y, self.red_x, self.red_y)]
+        # lookup table used by rgb_to_xy_bri(), if enabled (see use_table())
+        self.table = None
 
     def __repr__(self):
         str_format = ('*** Gamut %s ***\n' +
@@ -95,3 +128,234 @@ class Gamut(object):
         if not self.inside_gamut(x, y):
             x, y = self.gamut_aprox(x, y)
         return x, y, bri
+
+    def use_table(self, enabled=True, max_error=ColorTable.DEFAULT_MAX_ERROR, cache_dir=None):
+        """
+        Convert colors (see rgb_to_xy_bri()) from a lookup table instead of the formulas.
+        The table is built (or read from its cache file) as colors are converted.
+
+        :param enabled: False to use the formulas again.
+        :param max_error: Maximum difference of x and y from the formulas (see ColorTable).
+        :param cache_dir: Directory of the cache file (optional, 'color_tables' in the current directory by default).
+        :return None
+        """
+
+        self.table = ColorTable(self, max_error, cache_dir) if enabled else None
+
+    def rgb_to_xy_bri(self, red, green, blue):
+        """
+        Convert a RGB color, from the lookup table if enabled (see use_table()), otherwise with the formulas.
+
+        :param red: Red value between 0 and 255.
+        :param green: Green value between 0 and 255.
+        :param blue: Blue value between 0 and 255.
+        :return Tuple of x, y, bri.
+        """
+
+        if self.table is not None:
+            return self.table.get_xy_and_bri_from_rgb(red, green, blue)
+        return self.get_xy_and_bri_from_rgb(red, green, blue)
+
+    def rgb_to_xy_bri_batch(self, colors):
+        """
+        Convert many RGB colors at once, with the same results as get_xy_and_bri_from_rgb() for each color.
+
+        With NumPy all colors are converted together (vectorized), otherwise one after another.
+
+        :param colors: N x 3 array of red, green, blue values between 0 and 255 (a NumPy array, a list of triples,
+                       or a flat sequence of 3 * N values, i.e. array('B') or bytes of an RGB image).
+        :return N x 3 NumPy array of x, y, bri with NumPy, otherwise a flat array('d') of 3 * N values x, y, bri.
+        """
+
+        if numpy is not None:
+            return self._rgb_to_xy_bri_numpy(colors)
+        return self._rgb_to_xy_bri_array(colors)
+
+    def get_rgb_from_xy_and_bri(self, x, y, bri):
+        """
+        Convert the color of a light (i.e. its state) to RGB, the inverse of get_xy_and_bri_from_rgb().
+        Coordinates outside of the gamut are first moved to the closest point of the gamut (like the light does).
+
+        :param x: x coordinate in CIE color space.
+        :param y: y coordinate in CIE color space.
+        :param bri: Brightness (0 to 255).
+        :return Tuple of red, green, blue values between 0 and 255.
+        """
+
+        if not self.inside_gamut(x, y):
+            x, y = self.gamut_aprox(x, y)
+        if not y:
+            return 0, 0, 0
+        Y = float(bri) / 255
+        X = (Y / y) * x
+        Z = (Y / y) * (1 - x - y)
+        return self._encode_rgb([X * m[0] + Y * m[1] + Z * m[2] for m in XYZ_TO_RGB])
+
+    @staticmethod
+    def get_rgb_from_hue_and_sat(hue, sat, bri):
+        """
+        Convert hue and saturation (colormode 'hs') to RGB.
+
+        :param hue: Hue (0 to 65535, red = 0 or 65535, green = 25500, blue = 46920).
+        :param sat: Saturation (0 = white to 254).
+        :param bri: Brightness (0 to 255).
+        :return Tuple of red, green, blue values between 0 and 255.
+        """
+
+        return Gamut._scale_rgb(colorsys.hsv_to_rgb(float(hue) / 65535, min(float(sat) / 254, 1.0), 1.0), bri)
+
+    @staticmethod
+    def get_rgb_from_ct(ct, bri):
+        """
+        Convert a color temperature (colormode 'ct') to RGB, as the color of a black body at that temperature.
+
+        :param ct: Mired color temperature (153 = 6500K to 500 = 2000K).
+        :param bri: Brightness (0 to 255).
+        :return Tuple of red, green, blue values between 0 and 255.
+        """
+
+        # approximation of the black body colors by Tanner Helland (temperature in hundreds of Kelvin)
+        temperature = 10000.0 / ct
+        if temperature <= 66:
+            red = 255
+            green = 99.4708025861 * math.log(temperature) - 161.1195681661
+        else:
+            red = 329.698727446 * pow(temperature - 60, -0.1332047592)
+            green = 288.1221695283 * pow(temperature - 60, -0.0755148492)
+        if temperature >= 66:
+            blue = 255
+        elif temperature <= 19:
+            blue = 0
+        else:
+            blue = 138.5177312231 * math.log(temperature - 10) - 305.0447927307
+        return Gamut._scale_rgb([min(max(c, 0), 255) / 255.0 for c in (red, green, blue)], bri)
+
+    def xy_bri_to_rgb_batch(self, values):
+        """
+        Convert the colors of many lights at once, with the same results as get_rgb_from_xy_and_bri() for each one.
+
+        With NumPy all colors are converted together (vectorized), otherwise one after another.
+
+        :param values: N x 3 array of x, y, bri (a NumPy array or a list of triples).
+        :return N x 3 NumPy array of red, green, blue with NumPy, otherwise a flat array('B') of 3 * N values.
+        """
+
+        if numpy is None:
+            result = array('B')
+            for x, y, bri in values:
+                result.extend(self.get_rgb_from_xy_and_bri(x, y, bri))
+            return result
+
+        xy_bri = numpy.array(values, dtype=numpy.float64).reshape(-1, 3)
+        x, y, bri = xy_bri[:, 0], xy_bri[:, 1], xy_bri[:, 2]
+        self._gamut_aprox_numpy(x, y)
+        black = y == 0
+        y[black] = 1
+        Y = bri / 255
+        X = (Y / y) * x
+        Z = (Y / y) * (1 - x - y)
+        rgb = numpy.column_stack([X * m[0] + Y * m[1] + Z * m[2] for m in XYZ_TO_RGB])
+        rgb[black] = 0
+        # too bright colors are scaled down
+        rgb /= numpy.maximum(rgb.max(axis=1), 1)[:, numpy.newaxis]
+        rgb = numpy.where(rgb <= 0.0031308, 12.92 * rgb,
+                          (1.0 + 0.055) * numpy.power(numpy.maximum(rgb, 0.0031308), 1 / 2.4) - 0.055)
+        return numpy.rint(numpy.clip(rgb, 0, 1) * 255).astype(int)
+
+    @staticmethod
+    def _encode_rgb(rgb):
+        # linear RGB to sRGB values between 0 and 255 (too bright colors are scaled down)
+        highest = max(rgb)
+        if highest > 1:
+            rgb = [c / highest for c in rgb]
+        rgb = [12.92 * c if c <= 0.0031308 else (1.0 + 0.055) * pow(c, 1 / 2.4) - 0.055 for c in rgb]
+        return tuple(int(round(min(max(c, 0), 1) * 255)) for c in rgb)
+
+    @staticmethod
+    def _scale_rgb(rgb, bri):
+        # sRGB values between 0 and 1 at full brightness, scaled (as linear RGB) to the brightness
+        rgb = [pow((c + 0.055) / (1.0 + 0.055), 2.4) if c > 0.04045 else (c / 12.92) for c in rgb]
+        return Gamut._encode_rgb([c * bri / 255.0 for c in rgb])
+
+    @staticmethod
+    def _as_rgb_array(colors):
+        # N x 3 NumPy array of the colors, buffers (i.e. the bytes of an RGB image) are read in place
+        if isinstance(colors, (bytes, bytearray, memoryview)) or (
+                isinstance(colors, array) and colors.typecode == 'B'):
+            return numpy.frombuffer(colors, dtype=numpy.uint8).reshape(-1, 3)
+        return numpy.asarray(colors).reshape(-1, 3)
+
+    def _rgb_to_xy_bri_numpy(self, colors):
+        rgb = self._as_rgb_array(colors).astype(numpy.float64) / 255
+        rgb = numpy.where(rgb > 0.04045, numpy.power((rgb + 0.055) / (1.0 + 0.055), 2.4), rgb / 12.92)
+        red, green, blue = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+        X = red * 0.664511 + green * 0.154324 + blue * 0.162028
+        Y = red * 0.283881 + green * 0.668433 + blue * 0.047685
+        Z = red * 0.000088 + green * 0.072310 + blue * 0.986039
+        total = X + Y + Z
+        black = total == 0
+        total[black] = 1
+        x = numpy.where(black, 0.3227, X / total)
+        y = numpy.where(black, 0.329, Y / total)
+        bri = numpy.where(black, 1, numpy.floor(Y * 255))
+
+        self._gamut_aprox_numpy(x, y)
+        return numpy.column_stack((x, y, bri))
+
+    def _gamut_aprox_numpy(self, x, y):
+        # colors outside of the gamut go to the closest point of the closest edge (x and y are changed in place)
+        outside = ~((y - self.red_green_m * x - self.red_green_b <= 0) &
+                    (y - self.green_blue_m * x - self.green_blue_b <= 0) &
+                    (y - self.blue_red_m * x - self.blue_red_b >= 0))
+        if not outside.any():
+            return
+        ox, oy = x[outside], y[outside]
+        distances = numpy.array([numpy.abs((m * ox) - oy + b) * (math.sqrt(1 / ((m * m) + 1)))
+                                 for m, b, x1, y1, x2, y2 in self._edges])
+        closest = numpy.argmin(distances, axis=0)
+        new_x, new_y = numpy.empty_like(ox), numpy.empty_like(oy)
+        for i, (m, b, x1, y1, x2, y2) in enumerate(self._edges):
+            on_edge = closest == i
+            px = (ox[on_edge] + (m * oy[on_edge]) - (m * b)) / ((m * m) + 1)
+            py = (((m * m) * oy[on_edge]) + (m * ox[on_edge]) + b) / ((m * m) + 1)
+            # the projection is kept if it falls on the edge, otherwise the nearest end
+            (left_x, left_y), (right_x, right_y) = sorted([(x1, y1), (x2, y2)])
+            new_x[on_edge] = numpy.clip(px, left_x, right_x)
+            new_y[on_edge] = numpy.where(px < left_x, left_y, numpy.where(px > right_x, right_y, py))
+        x[outside], y[outside] = new_x, new_y
+
+    def _rgb_to_xy_bri_array(self, colors):
+        if len(colors) and isinstance(colors[0], (list, tuple)):
+            colors = [value for color in colors for value in color]
+        elif isinstance(colors, (bytes, bytearray, memoryview)):
+            colors = bytearray(colors)
+        # linear value of each 8 bit component, computed once for all colors
+        linear = self._linear_values()
+        result = array('d')
+        for i in range(0, len(colors) - 2, 3):
+            red, green, blue = colors[i], colors[i + 1], colors[i + 2]
+            if (red in linear) and (green in linear) and (blue in linear):
+                result.extend(self._xy_bri_from_linear(linear[red], linear[green], linear[blue]))
+            else:
+                result.extend(self.get_xy_and_bri_from_rgb(red, green, blue))
+        return result
+
+    @staticmethod
+    def _linear_values():
+        values = {}
+        for c in range(256):
+            value = float(c) / 255
+            values[c] = pow((value + 0.055) / (1.0 + 0.055), 2.4) if value > 0.04045 else (value / 12.92)
+        return values
+
+    def _xy_bri_from_linear(self, red, green, blue):
+        X = red * 0.664511 + green * 0.154324 + blue * 0.162028
+        Y = red * 0.283881 + green * 0.668433 + blue * 0.047685
+        Z = red * 0.000088 + green * 0.072310 + blue * 0.986039
+        if not X + Y + Z:
+            return 0.3227, 0.329, 1
+        x = X / (X + Y + Z)
+        y = Y / (X + Y + Z)
+        if not self.inside_gamut(x, y):
+            x, y = self.gamut_aprox(x, y)
+        return x, y, int(Y * 255)
@@ -0,0 +1,305 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    # lookups are done one color after another
+    numpy = None
+
+# Python 2 has no os.replace(), os.rename() replaces the file as well on POSIX systems
+_replace = getattr(os, 'replace', os.rename)
+
+
+class ColorTable(object):
+    """
+    Lookup table of the RGB to (x, y, bri) conversion for one gamut (see Gamut.get_xy_and_bri_from_rgb()),
+    for all 8 bit colors: converting a color is reading its entry.
+
+    x and y are stored on 16 bits (within 0.0000077 of the formulas, the bridge keeps 4 decimals), bri as is.
+    The table is built one red value at a time (65536 colors), when a color with that red value is first converted,
+    and the entries are checked against the formulas (all of them for the 16 bit rounding, a sample of them read back
+    from the table for the conversion itself): if they are not within max_error, the table is not used.
+    Colors which are not 8 bit values (i.e. 127.5) are converted with the formulas.
+
+    The table is stored in a cache file named after the gamut coordinates (the same file is used by all scripts)
+    and memory-mapped, so only the parts used are read and each part is built only once.
+    """
+
+    DEFAULT_MAX_ERROR = 0.0001
+    # increased when the conversion or the layout of the file changes, so that old files are not used
+    VERSION = 1
+    MAGIC = b'PIESHINE'
+    HEADER = struct.Struct('<8sI')
+    COLORS = 256 * 256 * 256
+    XY_SCALE = 65535.0
+    # green and blue values of the entries checked against the formulas for each red value built
+    SAMPLE = (0, 1, 37, 64, 127, 128, 200, 254, 255)
+
+    def __init__(self, gamut, max_error=DEFAULT_MAX_ERROR, cache_dir=None):
+        """
+        :param gamut: Gamut object of the conversion.
+        :param max_error: Maximum difference of x and y from the formulas.
+        :param cache_dir: Directory of the cache file (optional, 'color_tables' in the current directory by default).
+        """
+
+        self.gamut = gamut
+        self.max_error = max_error
+        coords = '%r %r %r %r %r %r' % (gamut.red_x, gamut.red_y, gamut.green_x, gamut.green_y, gamut.blue_x,
+                                        gamut.blue_y)
+        self.path = os.path.join(cache_dir or os.path.join(os.path.abspath('.'), 'color_tables'),
+                                 'gamut_' + str(gamut.name) + '_' + hashlib.sha1(coords.encode('ascii')).hexdigest()[:12] +
+                                 '.lut')
+        self.lookups = self.fallbacks = 0
+        self.disabled = False       # True if the table is not within max_error of the formulas
+        # red values built, then x, y and bri of each color (indexed by red * 65536 + green * 256 + blue)
+        self._built_offset = self.HEADER.size
+        self._x_offset = self._built_offset + 256
+        self._y_offset = self._x_offset + self.COLORS * 2
+        self._bri_offset = self._y_offset + self.COLORS * 2
+        self._length = self._bri_offset + self.COLORS
+        self._map = None
+        self._built = self._x = self._y = self._bri = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        built = sum(self._built[red] for red in range(256)) if self._built is not None else 0
+        return 'ColorTable(gamut %s) * %d/256 red values built * lookups = %d * fallbacks = %d * %s' % (
+            self.gamut.name, built, self.lookups, self.fallbacks, self.path)
+
+    def get_xy_and_bri_from_rgb(self, red, green, blue):
+        """
+        Convert a RGB color (i.e. set_color()) from the table.
+
+        :param red: Red value between 0 and 255.
+        :param green: Green value between 0 and 255.
+        :param blue: Blue value between 0 and 255.
+        :return Tuple of x, y, bri.
+        """
+
+        if self._map is None:
+            self.load()
+        self.lookups += 1
+        if (red.__class__ is not int and red != int(red)) or (green.__class__ is not int and green != int(green)) or (
+                blue.__class__ is not int and blue != int(blue)) or not (
+                (0 <= red <= 255) and (0 <= green <= 255) and (0 <= blue <= 255)) or self.disabled:
+            self.fallbacks += 1
+            return self.gamut.get_xy_and_bri_from_rgb(red, green, blue)
+        index = (int(red) << 16) | (int(green) << 8) | int(blue)
+        if not self._built[index >> 16]:
+            self._build(index >> 16)
+            if self.disabled:
+                self.lookups -= 1
+                return self.get_xy_and_bri_from_rgb(red, green, blue)
+        return self._x[index] / self.XY_SCALE, self._y[index] / self.XY_SCALE, self._bri[index]
+
+    def rgb_to_xy_bri_batch(self, colors):
+        """
+        Convert many RGB colors at once from the table (vectorized when NumPy is installed).
+
+        :param colors: N x 3 array of red, green, blue values between 0 and 255 (see Gamut.rgb_to_xy_bri_batch()).
+        :return N x 3 NumPy array of x, y, bri with NumPy, otherwise a flat array('d') of 3 * N values x, y, bri.
+        """
+
+        if self._map is None:
+            self.load()
+        if numpy is None:
+            if len(colors) and isinstance(colors[0], (list, tuple)):
+                colors = [value for color in colors for value in color]
+            elif isinstance(colors, (bytes, bytearray, memoryview)):
+                colors = bytearray(colors)
+            result = array('d')
+            for i in range(0, len(colors) - 2, 3):
+                result.extend(self.get_xy_and_bri_from_rgb(colors[i], colors[i + 1], colors[i + 2]))
+            return result
+
+        rgb = self.gamut._as_rgb_array(colors)
+        # colors read from the table (8 bit values), the other ones are converted with the formulas
+        if rgb.dtype == numpy.uint8:
+            table = numpy.ones(len(rgb), dtype=bool)
+        else:
+            table = ((rgb >= 0) & (rgb <= 255) & (rgb == numpy.floor(rgb))).all(axis=1)
+        index = rgb[table].astype(numpy.intp)
+        index = (index[:, 0] << 16) | (index[:, 1] << 8) | index[:, 2]
+        for red in numpy.unique(index >> 16):
+            if not self._built[red]:
+                self._build(int(red))
+        if self.disabled:
+            table[:] = False
+            index = index[:0]
+
+        result = numpy.empty((len(rgb), 3))
+        result[table, 0] = numpy.frombuffer(self._map, '<u2', self.COLORS, self._x_offset)[index] / self.XY_SCALE
+        result[table, 1] = numpy.frombuffer(self._map, '<u2', self.COLORS, self._y_offset)[index] / self.XY_SCALE
+        result[table, 2] = numpy.frombuffer(self._map, numpy.uint8, self.COLORS, self._bri_offset)[index]
+        if not table.all():
+            result[~table] = self.gamut.rgb_to_xy_bri_batch(rgb[~table])
+        self.lookups += len(rgb)
+        self.fallbacks += len(rgb) - int(table.sum())
+        return result
+
+    def build(self):
+        """
+        Build the whole table now (i.e. before an animation), instead of as colors are converted.
+        Takes a few seconds with NumPy (a lot longer without it), only once for all scripts using the cache file.
+
+        :return None
+        """
+
+        if self._map is None:
+            self.load()
+        for red in range(256):
+            if not self._built[red]:
+                self._build(red)
+
+    def load(self):
+        """
+        Open the cache file (created if needed), done by the first lookup.
+        The table is kept in memory if the file cannot be written.
+
+        :return None
+        """
+
+        with self._lock:
+            if self._map is not None:
+                return
+            data = self._open()
+            if data is None:
+                data = mmap.mmap(-1, self._length)
+                data[:self.HEADER.size] = self.HEADER.pack(self.MAGIC, self.VERSION)
+            self._built = self._view(data, self._built_offset, 'B', 256)
+            self._x = self._view(data, self._x_offset, 'H', self.COLORS)
+            self._y = self._view(data, self._y_offset, 'H', self.COLORS)
+            self._bri = self._view(data, self._bri_offset, 'B', self.COLORS)
+            self._map = data
+
+    def _open(self):
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            if not self._is_valid_file():
+                self._create_file()
+            with open(self.path, 'r+b') as f:
+                data = mmap.mmap(f.fileno(), 0)
+        except (IOError, OSError, ValueError) as e:
+            print('Error : cannot write ' + self.path + ' : ' + str(e))
+            return None
+        return data
+
+    def _is_valid_file(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            header = f.read(self.HEADER.size)
+        if (os.path.getsize(self.path) == self._length) and (len(header) == self.HEADER.size) and (
+                self.HEADER.unpack(header) == (self.MAGIC, self.VERSION)):
+            return True
+        print('Error : ' + self.path + ' is not a valid color table, building it again')
+        return False
+
+    def _create_file(self):
+        # created aside and moved in place, so that the other scripts using the file never see it half written
+        # (a script still using the previous file keeps reading it until it opens the new one)
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp',
+                                         dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # the parts not built yet take no space on disk
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+                f.truncate(self._length)
+            _replace(temp_path, self.path)
+        except (IOError, OSError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _view(data, offset, typecode, count):
+        # entries of the table read in place from the memory-mapped file
+        size = struct.calcsize(typecode)
+        if sys.version_info >= (3, 0) and (sys.byteorder == 'little' or size == 1):
+            return memoryview(data)[offset:offset + count * size].cast(typecode)
+        return _Entries(data, offset, '<' + typecode, size)
+
+    def _build(self, red):
+        # convert all colors with the given red value and check them against the formulas
+        with self._lock:
+            if self._built[red] or self.disabled:
+                return
+            if numpy is not None:
+                green_blue = numpy.indices((256, 256)).reshape(2, -1).T
+                colors = self.gamut.rgb_to_xy_bri_batch(numpy.column_stack((numpy.full(65536, red), green_blue)))
+                x = numpy.rint(colors[:, 0] * self.XY_SCALE).astype('<u2')
+                y = numpy.rint(colors[:, 1] * self.XY_SCALE).astype('<u2')
+                bri = colors[:, 2].astype(numpy.uint8)
+                error = max(numpy.abs(x / self.XY_SCALE - colors[:, 0]).max(),
+                            numpy.abs(y / self.XY_SCALE - colors[:, 1]).max())
+                x, y, bri = x.tobytes(), y.tobytes(), bri.tobytes()
+            else:
+                colors = self.gamut.rgb_to_xy_bri_batch(bytearray(value for green in range(256) for blue in range(256)
+                                                                  for value in (red, green, blue)))
+                x = array('H', [int(value * self.XY_SCALE + 0.5) for value in colors[0::3]])
+                y = array('H', [int(value * self.XY_SCALE + 0.5) for value in colors[1::3]])
+                bri = array('B', [int(value) for value in colors[2::3]])
+                error = max(max(abs(value / self.XY_SCALE - exact) for value, exact in zip(x, colors[0::3])),
+                            max(abs(value / self.XY_SCALE - exact) for value, exact in zip(y, colors[1::3])))
+                if sys.byteorder == 'big':
+                    # the file is little-endian
+                    x.byteswap()
+                    y.byteswap()
+                if sys.version_info < (3, 0):
+                    x, y, bri = x.tostring(), y.tostring(), bri.tostring()
+                else:
+                    x, y, bri = x.tobytes(), y.tobytes(), bri.tobytes()
+            if error > self.max_error:
+                self._disable(error)
+                return
+
+            start = red * 65536
+            self._map[self._x_offset + start * 2:self._x_offset + (start + 65536) * 2] = x
+            self._map[self._y_offset + start * 2:self._y_offset + (start + 65536) * 2] = y
+            self._map[self._bri_offset + start:self._bri_offset + start + 65536] = bri
+            # entries read back from the table, as lookups do, and checked against the scalar conversion
+            error = self._check_entries(red)
+            if error > self.max_error:
+                self._disable(error)
+                return
+            # marked as built once all its entries are written
+            self._map[self._built_offset + red:self._built_offset + red + 1] = b'\1'
+
+    def _check_entries(self, red):
+        # largest difference of x and y between a sample of entries of the red value and the formulas,
+        # infinite if a brightness differs
+        error = 0.0
+        for green in self.SAMPLE:
+            for blue in self.SAMPLE:
+                index = (red << 16) | (green << 8) | blue
+                x, y, bri = self.gamut.get_xy_and_bri_from_rgb(red, green, blue)
+                if self._bri[index] != bri:
+                    return float('inf')
+                error = max(error, abs(self._x[index] / self.XY_SCALE - x), abs(self._y[index] / self.XY_SCALE - y))
+        return error
+
+    def _disable(self, error):
+        print('Error : color table of gamut ' + str(self.gamut.name) + ' is not within ' + str(self.max_error) +
+              ' of the formulas (' + str(error) + '), using the formulas')
+        self.disabled = True
+
+
+class _Entries(object):
+    # entries of the table read from the memory-mapped file one at a time (Python 2, big-endian machines)
+
+    def __init__(self, data, offset, typecode, size):
+        self._data = data
+        self._offset = offset
+        self._typecode = typecode
+        self._size = size
+
+    def __getitem__(self, index):
+        return struct.unpack_from(self._typecode, self._data, self._offset + index * self._size)[0]
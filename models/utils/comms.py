@@ -1,10 +1,18 @@
 import socket
 import sys
 import time
-import re
-import xml.dom.minidom
-import os
+import functools
 import json
+import threading
+from collections import deque
+from models.utils.connpool import ConnectionPool
+from models.utils.scheduler import CommandScheduler
+from models.utils.pipeline import Pipeline
+from models.utils.statecache import StateCache
+from models.utils.fanout import FanOutExecutor
+from models.utils.discovery import Discovery, probe_description
+from models.utils.bridgestore import BridgeStore
+from models.utils.stream import StreamSender
 
 if sys.version_info < (3, 0):
     import httplib
@@ -17,75 +25,127 @@ class Comms(object):
     Communication with the bridge.
     """
 
-    def __init__(self):
+    # seconds a successful validation of the bridge is trusted: within that time only the user is checked
+    VALIDATION_MAX_AGE = 24 * 3600
+    # seconds to wait for each request sent while validating the bridge
+    VALIDATION_TIMEOUT = 2
+    # seconds to wait for the other requests
+    REQUEST_TIMEOUT = 10
+
+    def __init__(self, executor=None, max_concurrency=FanOutExecutor.DEFAULT_MAX_CONCURRENCY,
+                 discovery_deadline=Discovery.DEFAULT_DEADLINE, serial=None, store=None):
+        """
+        :param executor: Executor running the collection calls for each light (optional, see FanOutExecutor).
+        :param max_concurrency: Maximum number of collection calls running at the same time.
+        :param discovery_deadline: Maximum number of seconds spent looking for the bridge (see Discovery).
+        :param serial: Serial number of the bridge to connect to (optional, the default bridge from the store).
+        :param store: BridgeStore with the configuration of the bridges (optional, 'bridges.json').
+        """
+
+        self._pool = None           # keep-alive connections to the bridge (see _request)
+        self._pool_lock = threading.Lock()
+        self._scheduler = None      # paces the PUT requests when enabled (see enable_scheduler)
+        self._pipeline = None       # pipelines the PUT requests when enabled (see enable_pipelining)
+        self.put_errors = deque(maxlen=100)     # last errors returned for PUT requests, as (time, url, data, error)
+        self.error_callback = None              # called as error_callback(url_suffix, data, error) for each error
+        self.cache = StateCache(self.get)       # state of the lights, groups, etc. shared by all model objects
+        self.fanout = FanOutExecutor(executor, max_concurrency)     # runs collection calls for each light
+        self.discovery_deadline = discovery_deadline
+        self.store = store or BridgeStore()
+        self._serial = serial       # only this bridge is accepted when given
+        self.serial_number = serial
+        self.model_number = None
         self.get_bridge_data()
 
     def get_bridge_data(self):
         """
-        Get the bridge IP and user from 'bridge.cfg'.
+        Get the bridge IP and user from the bridges store ('bridges.json', or 'bridge.cfg' from older versions).
 
-        If there is data in the file validate it.
-        If there is no data to validate, restart the whole process - scan for IP and add user when bridge is found.
+        If there is data in the store validate it, at the last IP of the bridge and then at its previous IPs.
+        If there is no data to validate, or the bridge was not found at any of its IPs,
+        restart the whole process - scan for IP and add user when bridge is found.
 
         :return None
         """
 
-        try:
-            print('Attempting to use stored config')
-            f = open(os.path.join(os.path.abspath('.'), 'bridge.cfg'), 'r')
-            f.seek(0)
-            self.bridge_ip = f.readline().replace('\n', '')
-            self.bridge_user = f.readline().replace('\n', '')
-            f.close()
-            print('Done reading stored config')
-        except IOError:
+        print('Attempting to use stored config')
+        bridge = self.store.get(self._serial)
+        if (bridge is None) and (self._serial is None):
+            bridge = self.store.read_legacy()
+        if bridge is None:
             print('Failed reading stored config')
             self.bridge_user = ''
             self.init_bridge_data()
             return
-
-        if not self.verify_bridge_data():
-            self.init_bridge_data()
+        print('Done reading stored config')
+
+        self.bridge_user = bridge['username']
+        self.model_number = bridge['model']
+        self.serial_number = bridge['serial']
+        validated = bridge['validated']
+        if (validated is not None) and (time.time() - validated < self.VALIDATION_MAX_AGE):
+            # validated recently, a single small request checks the bridge is still there and the user is valid
+            self.bridge_ip = bridge['ip']
+            if self._check_user():
+                print('Bridge IP and user validated recently, user is valid')
+                print('Connection successful')
+                return
+        for ip in bridge['addresses'] or [bridge['ip']]:
+            self.bridge_ip = ip
+            if self.verify_bridge_data():
+                self.write_bridge_file()
+                print('Connection successful')
+                return
+        self.init_bridge_data()
         print('Connection successful')
 
     def verify_bridge_data(self):
         """
-        Validate the bridge IP and user from 'bridge.cfg'.
+        Validate the bridge IP and user from the bridges store.
 
         Validate the bridge IP by sending HTTP GET for 'http://<bridgeIP>:80/description.xml'.
-        Parse the resulted XML for <modelName> against Philips hue bridge.
+        Parse the resulted XML for <modelName> against Philips hue bridge (and for <serialNumber> if already known).
+        The user is checked at the same time (see _check_user()).
 
-        :return None
+        :return True if bridge IP and user are valid, False otherwise
         """
-        if sys.version_info < (3, 0):
-            conn_exception = socket.error
-        else:
-            conn_exception = TimeoutError
-        try:
-            print('Validating bridge IP by sending HTTP GET to http://' + str(self.bridge_ip) + '/description.xml')
-            conn = httplib.HTTPConnection(self.bridge_ip, 80)
-            conn.request('GET', '/description.xml')
-        except (conn_exception):
-            print('Failed to get HTTP response, bridge IP not valid')
-            return False
 
-        print('Getting HTTP response')
-        r1 = conn.getresponse()
-        data = r1.read()
-        try:
-            dom = xml.dom.minidom.parseString(data)
-        except xml.parsers.expat.ExpatError:
-            print('XML parse error')
+        print('Validating bridge IP and user by sending HTTP GET to http://' + str(self.bridge_ip) + '/description.xml'
+              ' and /api/<bridgeUser>/lights/new')
+        outcome = self.fanout.run([
+            ('ip', functools.partial(probe_description, self.bridge_ip, '/description.xml', self.VALIDATION_TIMEOUT)),
+            ('user', self._check_user)])
+        bridge = outcome.results.get('ip')
+        if bridge is None:
+            print('Failed to get a valid HTTP response, bridge IP not valid')
+            return False
+        if (self.serial_number is not None) and (bridge.serial_number != self.serial_number):
+            print('Another bridge (' + bridge.serial_number + ') found at this IP')
             return False
-        model_name = dom.getElementsByTagName('modelName')[0].firstChild.nodeValue
-        print('Parsing XML from HTTP response')
-        if (not set(['Philips', 'hue', 'bridge']).issubset(model_name.split()) or
-                isinstance(self.get(''), list)):
+        self.serial_number = bridge.serial_number
+        self.model_number = bridge.model_number
+        if not outcome.results.get('user'):
             print('Bridge IP or user not valid')
             return False
         print('Bridge IP and user are valid')
         return True
 
+    def _check_user(self):
+        # the smallest request needing a valid user: GET 'lights/new' answers '{"lastscan":"none"}' (or the time
+        # of the last search for new lights), and an error if the user is not valid
+        if self.bridge_user == '':
+            return False
+        try:
+            conn = httplib.HTTPConnection(self.bridge_ip, 80, timeout=self.VALIDATION_TIMEOUT)
+            try:
+                conn.request('GET', r'/api/' + self.bridge_user + r'/lights/new')
+                data = json.loads(conn.getresponse().read().decode('utf-8'))
+            finally:
+                conn.close()
+        except (socket.error, httplib.HTTPException, ValueError):
+            return False
+        return isinstance(data, dict)
+
     def init_bridge_data(self):
         """
         Raise exception if bridge was not found.
@@ -94,152 +154,53 @@ class Comms(object):
         """
 
         print('Attempting to find bridge IP')
-        found = False
-        for ip, url in self._scan():
-            print('Checking IP = ' + str(ip) + ', URL = ' + str(url) + ' from SSDP scan results')
-            if self.write_bridge_data(ip, url):
-                found = True
-                break
-        if not found:
-            raise RuntimeError('Bridge not found !!!')
-
-    def _scan(self):
-        """
-        Scans for the bridge IP.
-
-        Send out an UDP packet to multicast address 239.255.255.250:1900 (for IPv4).
-        Parse each response LOCATION URL (the bridge will respond with 'LOCATION: http://<IP>:80/description.xml').
-
-        :return (IP, URL)
-        """
-
-        # get your IP address
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        except (socket.error):
-            print('Failed to create socket')
-            sys.exit()
-
-        try:
-            # let's hope there is an internet connection
-            s.connect(('meethue.com', 80))
-        except:
-            # if not... (this doesn't even have to be reachable)
-            s.connect(('10.255.255.255', 0))
-        finally:
-            local_interface = s.getsockname()[0]
-            s.close()
-
-        found = False
-        dest_ips = []
-
-        # send HTTP M-SEARCH as UDP multicast (239.255.255.250:1900 for IPv4)
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        except (socket.error):
-            print('Failed to create socket')
-            sys.exit()
-
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 12)
-        sock.settimeout(1)
-        sock.bind((local_interface, 0))
-
-        try:
-            sock.sendto(('M-SEARCH * HTTP/1.1\r\n'
-                         'HOST: 239.255.255.250:1900\r\n'
-                         'MAN: "ssdp:discover"\r\n'
-                         'MX: 1\r\n'
-                         'ST: ssdp:all\r\n\r\n').encode('utf-8'),
-                        ('239.255.255.250', 1900))
-        except (socket.error):
-            print('Failed to send M-SEARCH on ' + local_interface)
-            sys.exit()
-
-        initial_time = time.time()
-
-        # parse each response received for the UDP packet sent (there could be more than one device responding)
-        while 1:
-            if time.time() - initial_time > 10:
-                break
-            try:
-                data = sock.recv(1024).decode('ascii', 'ignore')
-                if data:
-                    ip = port = url = ''
-                    for line in data.split('\n'):
-                        # try to extract IP, port, URL from LOCATION tag response
-                        res = re.match(r'^LOCATION:\s*http://([\d]+.[\d]+.[\d]+.[\d]+):([\d]+)(/[\w./-]+)', line)
-                        if res:
-                            ip = res.group(1)
-                            port = res.group(2)
-                            url = res.group(3).replace('\r', '')
-                            break
-
-                    # check if extracted data is valid
-                    if ip == '':
-                        continue
-                    # further a HTTP GET message will be sent, port must be 80
-                    if port != '80':
-                        continue
-                    # the same device can send the same response more than once
-                    if ip not in dest_ips:
-                        dest_ips.append(ip)
-                        found = True
-                        # a valid and unique pair of IP, URL that can be further used
-                        yield (ip, url)
-                    else:
-                        continue
-
-            except (socket.error):
-                print('Waiting to receive NOTIFY to ' + local_interface)
-                time.sleep(1)
-
-        sock.close()
-        if not found:
-            raise RuntimeError('Bridge not found !!!')
+        discovery = Discovery(self.discovery_deadline)
+        for bridge in discovery.scan():
+            print('Checking IP = ' + str(bridge.ip) + ', URL = ' + str(bridge.url) + ' from SSDP scan results')
+            if (self._serial is not None) and (bridge.serial_number != self._serial):
+                continue
+            if self.write_bridge_data(bridge.ip, bridge.url, bridge):
+                return
+        raise RuntimeError('Bridge not found !!!')
 
     def write_bridge_file(self):
         """
-        Write bridge IP and user in 'bridge.cfg'
+        Write bridge IP and user in the bridges store ('bridges.json'), indexed by the bridge serial number.
 
         :return None
         """
 
-        f = open(os.path.join(os.path.abspath('.'), 'bridge.cfg'), 'w+')
-        f.seek(0)
-        f.write(self.bridge_ip + '\n' + self.bridge_user + '\n')
-        f.close()
+        self.store.update(self.serial_number, ip=self.bridge_ip, username=self.bridge_user, model=self.model_number,
+                          validated=time.time())
 
-    def write_bridge_data(self, ip, url):
+    def write_bridge_data(self, ip, url, bridge=None):
         """
         Parse the XML obtained from IP and URL and check <modelName> for Philips hue bridge.
 
         If the device is indeed a Philips hue bridge, then we have our bridge IP, otherwise exception is raised.
-        Try to add a new bridge user and write it in 'bridge.cfg' if none is given or existing one is not valid.
+        Try to add a new bridge user and write it in the bridges store if none is given or existing one is not valid.
 
         :param ip: IP extracted from LOCATION tag in the HTTP response.
         :param url: URL extracted from LOCATION tag in the HTTP response (bridge responds with 'description.xml').
-        :return True is valid bridge IP and user were written in 'bridge.cfg' or False otherwise.
+        :param bridge: BridgeDescription already obtained from IP and URL (optional, see Discovery).
+        :return True is valid bridge IP and user were written in the bridges store or False otherwise.
         """
 
-        # get XML from 'http://<ip>:80/<url>'
-        conn = httplib.HTTPConnection(ip, 80)
-        conn.request('GET', url)
-        r1 = conn.getresponse()
-        res = r1.read()
-        dom = xml.dom.minidom.parseString(res)
-        model_name = dom.getElementsByTagName('modelName')[0].firstChild.nodeValue
-
-        # check <modelName> from XML for Philips hue bridge device
-        if set(['Philips', 'hue', 'bridge']).issubset(model_name.split()):
+        # get XML from 'http://<ip>:80/<url>' and check <modelName> for Philips hue bridge device
+        if bridge is None:
+            bridge = probe_description(ip, url)
+        if bridge is not None:
             print('Philips hue bridge found')
-            self.model_number = dom.getElementsByTagName('modelNumber')[0].firstChild.nodeValue
-            self.serial_number = dom.getElementsByTagName('serialNumber')[0].firstChild.nodeValue
+            if bridge.serial_number != self.serial_number:
+                # another bridge than the stored one, its user is not valid there
+                self.bridge_user = ''
+            self.model_number = bridge.model_number
+            self.serial_number = bridge.serial_number
             self.bridge_ip = ip
 
-            # no bridge user present in 'bridge.cfg' or existing one is not valid
-            if (self.bridge_user == '') or isinstance(self.get(''), list):
-                print('No bridge user present in bridge.cfg or existing one is not valid')
+            # no bridge user present in the store or existing one is not valid
+            if not self._check_user():
+                print('No bridge user present in bridges.json or existing one is not valid')
                 self.bridge_user = ''
                 initial_time = time.time()
                 while 1:
@@ -261,8 +222,8 @@ class Comms(object):
                         break
                 if self.bridge_user == '':
                     raise RuntimeError('Failed to add a new user and write configuration file !!!')
-            # got valid bridge IP and user, writing in 'bridge.cfg'
-            print('Got valid bridge IP and user, writing in bridge.cfg')
+            # got valid bridge IP and user, writing in the bridges store
+            print('Got valid bridge IP and user, writing in bridges.json')
             self.write_bridge_file()
             return True
 
@@ -277,13 +238,10 @@ class Comms(object):
         :return Requested data in JSON format.
         """
 
-        conn = httplib.HTTPConnection(self.bridge_ip, 80)
-        conn.request('GET', r'/api/' + self.bridge_user + r'/' + url_suffix)
-        data = conn.getresponse().read()
-        conn.close()
+        status, reason, data = self._request('GET', r'/api/' + self.bridge_user + r'/' + url_suffix)
         return json.loads(data.decode('utf-8'))
 
-    def put(self, url_suffix, data):
+    def put(self, url_suffix, data, immediate=False):
         """
         Set data on the bridge. See 'http://<bridgeIP>/debug/clip.html'.
 
@@ -292,12 +250,18 @@ class Comms(object):
                     (Change the brightness of a light to 200:
                      url_suffix = 'lights/<light_id>/state'
                      data = '{"bri":200}')
-        :return None
+        :param immediate: Send the request right away and wait for the response,
+                          even if the scheduler or pipelining are enabled (i.e. for renames).
+        :return response in JSON format if immediate, None otherwise
         """
 
-        conn = httplib.HTTPConnection(self.bridge_ip, 80)
-        conn.request('PUT', r'/api/' + self.bridge_user + r'/' + url_suffix, data)
-        conn.close()
+        if immediate:
+            status, reason, body = self._request('PUT', r'/api/' + self.bridge_user + r'/' + url_suffix, data)
+            return self._on_put_response(url_suffix, data, status, body)
+        if self._scheduler is not None:
+            self._scheduler.submit(url_suffix, data)
+        else:
+            self._put(url_suffix, data)
 
     def post(self, url_suffix, data):
         """
@@ -312,15 +276,10 @@ class Comms(object):
         :return response in JSON format
         """
 
-        conn = httplib.HTTPConnection(self.bridge_ip, 80)
-        conn.request("POST", r'/api/' + url_suffix, data, {"Accept": "text/plain"})
-        response = conn.getresponse()
-        if (response.status == httplib.OK) and (response.reason == 'OK'):
-            data = json.loads(response.read().decode('utf-8'))
-        else:
-            data = None
-        conn.close()
-        return data
+        status, reason, data = self._request("POST", r'/api/' + url_suffix, data, {"Accept": "text/plain"})
+        if (status == httplib.OK) and (reason == 'OK'):
+            return json.loads(data.decode('utf-8'))
+        return None
 
     def delete(self, url_suffix):
         """
@@ -331,12 +290,151 @@ class Comms(object):
         :return response in JSON format
         """
 
-        conn = httplib.HTTPConnection(self.bridge_ip, 80)
-        conn.request("DELETE", r'/api/' + self.bridge_user + r'/' + url_suffix)
-        response = conn.getresponse()
-        if (response.status == httplib.OK) and (response.reason == 'OK'):
-            data = json.loads(response.read().decode('utf-8'))
+        status, reason, data = self._request("DELETE", r'/api/' + self.bridge_user + r'/' + url_suffix)
+        if (status == httplib.OK) and (reason == 'OK'):
+            return json.loads(data.decode('utf-8'))
+        return None
+
+    def enable_scheduler(self, rates=None, burst=1, max_pending=100):
+        """
+        Send all PUT requests through a CommandScheduler (rate limiting per resource class, merging of superseded
+        writes for the same resource and priority lanes). PUT requests are then queued and sent in background.
+
+        :param rates: Dictionary of commands per second by resource class (i.e. {'lights': 10, 'groups': 1}).
+        :param burst: Number of commands that can be sent at once after an idle period (for each resource class).
+        :param max_pending: Maximum number of commands waiting to be sent.
+        :return The CommandScheduler instance.
+        """
+
+        if self._scheduler is None:
+            self._scheduler = CommandScheduler(self._put, rates, burst, max_pending)
+        return self._scheduler
+
+    def disable_scheduler(self):
+        """
+        Send all pending commands and go back to sending each PUT request right away.
+
+        :return None
+        """
+
+        scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None:
+            scheduler.stop()
+
+    def scheduler_stats(self):
+        """
+        Get the statistics of the command scheduler (see CommandScheduler.stats()).
+
+        :return Dictionary of statistics or None if the scheduler is not enabled.
+        """
+
+        if self._scheduler is None:
+            return None
+        return self._scheduler.stats()
+
+    def enable_pipelining(self, error_callback=None, max_in_flight=16):
+        """
+        Send all PUT requests back-to-back on one persistent connection (see Pipeline), without waiting for
+        the response of the previous request. Responses are read in background and each error returned by the bridge
+        is recorded in put_errors and passed to error_callback.
+
+        :param error_callback: Function called as error_callback(url_suffix, data, error) for each error (optional).
+        :param max_in_flight: Maximum number of requests waiting for a response.
+        :return The Pipeline instance.
+        """
+
+        if error_callback is not None:
+            self.error_callback = error_callback
+        if self._pipeline is None:
+            self._pipeline = Pipeline(self.bridge_ip, 80, self._on_put_response, max_in_flight)
+        return self._pipeline
+
+    def disable_pipelining(self):
+        """
+        Wait for the responses of all pipelined requests and go back to sending each PUT request on its own.
+
+        :return None
+        """
+
+        pipeline, self._pipeline = self._pipeline, None
+        if pipeline is not None:
+            pipeline.close()
+
+    def start_stream(self, light_ids, rate=StreamSender.DEFAULT_RATE, color_space='rgb', colors=None, address=None,
+                     port=StreamSender.DEFAULT_PORT):
+        """
+        Stream the colors of a set of lights over UDP at a fixed rate (see StreamSender), instead of sending
+        a PUT request for each change.
+
+        :param light_ids: Ids of the lights streamed.
+        :param rate: Messages sent per second.
+        :param color_space: 'rgb' or 'xy'.
+        :param colors: Initial colors indexed by light id (optional).
+        :param address: IP receiving the stream (optional, the bridge by default).
+        :param port: UDP port receiving the stream.
+        :return The started StreamSender instance.
+        """
+
+        return StreamSender(light_ids, address or self.bridge_ip, port, rate, color_space, colors).start()
+
+    def pool_stats(self):
+        """
+        Get the statistics of the keep-alive connection pool (see ConnectionPool).
+
+        :return Dictionary with 'hits', 'misses', 'reconnects', 'open' and 'idle' counters.
+        """
+
+        if self._pool is None:
+            return {'hits': 0, 'misses': 0, 'reconnects': 0, 'open': 0, 'idle': 0}
+        return self._pool.stats()
+
+    def close(self):
+        """
+        Send the pending commands (see disable_scheduler() and disable_pipelining()) and close the connections
+        to the bridge. They are opened again by the next request.
+
+        :return None
+        """
+
+        self.disable_scheduler()
+        self.disable_pipelining()
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _put(self, url_suffix, data):
+        url = r'/api/' + self.bridge_user + r'/' + url_suffix
+        if self._pipeline is not None:
+            self._pipeline.submit(url_suffix, url, data)
         else:
-            data = None
-        conn.close()
-        return data
+            status, reason, body = self._request('PUT', url, data)
+            self._on_put_response(url_suffix, data, status, body)
+
+    def _on_put_response(self, url_suffix, data, status, body):
+        # the bridge responds with a list of '{"success":{..}}' and '{"error":{..}}' items, one for each attribute
+        try:
+            response = json.loads(body.decode('utf-8'))
+        except (AttributeError, ValueError):
+            description = 'no response from the bridge' if status is None else 'invalid response from the bridge'
+            response = [{'error': {'type': status, 'address': '/' + url_suffix, 'description': description}}]
+        if not isinstance(response, list):
+            response = []
+
+        self.cache.apply_write(url_suffix, data, response)
+        for item in response:
+            if isinstance(item, dict) and 'error' in item:
+                self.put_errors.append((time.time(), url_suffix, data, item['error']))
+                if self.error_callback is not None:
+                    self.error_callback(url_suffix, data, item['error'])
+        return response
+
+    def _request(self, method, url, body=None, headers=None):
+        # the bridge IP can change while scanning, connections are pooled only for the current one
+        with self._pool_lock:
+            if (self._pool is None) or (self._pool.host != self.bridge_ip):
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = ConnectionPool(self.bridge_ip, 80, self.fanout.max_concurrency, self.REQUEST_TIMEOUT)
+            pool = self._pool
+        return pool.request(method, url, body, headers)
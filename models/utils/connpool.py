@@ -0,0 +1,131 @@
+import socket
+import sys
+import threading
+
+if sys.version_info < (3, 0):
+    import httplib
+else:
+    import http.client as httplib
+
+
+class ConnectionPool(object):
+    """
+    Pool of persistent HTTP/1.1 (keep-alive) connections to one bridge.
+
+    Idle connections are kept after each request and reused by the next one, so a burst of requests
+    (i.e. bridge.lights.turn_on()) pays the TCP setup only once per connection instead of once per request.
+    If the bridge dropped an idle socket in the meantime, the request is sent again on a fresh connection.
+
+    Statistics:
+        hits - Requests sent on a reused idle connection.
+        misses - Requests that had to open a new connection.
+        reconnects - Requests sent again because the bridge dropped a reused connection.
+        open - Connections currently open (idle or in use).
+        idle - Connections currently waiting in the pool.
+    """
+
+    # methods that can safely be sent again if the reused connection turns out to be dead
+    IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE', 'HEAD')
+
+    def __init__(self, host, port=80, max_size=4, timeout=None):
+        self.host = host
+        self.port = port
+        self.max_size = max_size    # maximum number of idle connections kept in the pool
+        self.timeout = timeout      # socket timeout in seconds for each connection (None = blocking)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.reconnects = self.open = 0
+
+    def __repr__(self):
+        return 'ConnectionPool(%s:%d) * hits = %d * misses = %d * reconnects = %d * open = %d * idle = %d' % (
+            self.host, self.port, self.hits, self.misses, self.reconnects, self.open, len(self._idle))
+
+    def stats(self):
+        """
+        Get the pool statistics.
+
+        :return Dictionary with 'hits', 'misses', 'reconnects', 'open' and 'idle' counters.
+        """
+
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'reconnects': self.reconnects,
+                    'open': self.open,
+                    'idle': len(self._idle)}
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a HTTP request on a pooled connection and read the whole response.
+
+        :param method: HTTP method ('GET', 'PUT', 'POST', 'DELETE').
+        :param url: Absolute URL path on the bridge (i.e. '/api/<bridgeUser>/lights').
+        :param body: Request body (optional).
+        :param headers: Dictionary of request headers (optional).
+        :return (status, reason, data) - HTTP status code, reason phrase and the raw response body.
+        """
+
+        # a non idempotent request (i.e. POST) is never sent twice, so it must not go out on a possibly dead socket
+        conn, reused = self._acquire(fresh=method not in self.IDEMPOTENT_METHODS)
+        try:
+            response, data = self._send(conn, method, url, body, headers)
+        except (socket.error, httplib.HTTPException):
+            self._discard(conn)
+            if not reused:
+                raise
+            # the bridge closed the idle connection, try once again on a new one
+            with self._lock:
+                self.reconnects += 1
+            conn, reused = self._acquire(fresh=True)
+            try:
+                response, data = self._send(conn, method, url, body, headers)
+            except (socket.error, httplib.HTTPException):
+                self._discard(conn)
+                raise
+
+        if response.will_close:
+            self._discard(conn)
+        else:
+            self._release(conn)
+        return response.status, response.reason, data
+
+    def close(self):
+        """
+        Close all idle connections.
+
+        :return None
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.open -= len(idle)
+        [conn.close() for conn in idle]
+
+    def _acquire(self, fresh=False):
+        with self._lock:
+            if self._idle and not fresh:
+                self.hits += 1
+                return self._idle.pop(), True
+            self.misses += 1
+            self.open += 1
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+            self.open -= 1
+        conn.close()
+
+    def _discard(self, conn):
+        with self._lock:
+            self.open -= 1
+        conn.close()
+
+    @staticmethod
+    def _send(conn, method, url, body, headers):
+        conn.request(method, url, body, headers or {})
+        response = conn.getresponse()
+        # the response must be fully read before the connection can be used again
+        return response, response.read()
@@ -0,0 +1,270 @@
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+import xml.dom.minidom
+import xml.parsers.expat
+
+if sys.version_info < (3, 0):
+    import httplib
+    import Queue as queue
+else:
+    import http.client as httplib
+    import queue
+
+# SSDP multicast address (IPv4)
+SSDP_ADDRESS = ('239.255.255.250', 1900)
+# search target the hue bridges respond to (their responses also carry a 'hue-bridgeid' header)
+HUE_ST = 'urn:schemas-upnp-org:device:basic:1'
+
+
+class BridgeDescription(object):
+    """
+    Philips hue bridge found on the network, as described by its 'description.xml'.
+
+    Properties:
+        ip - IP address of the bridge.
+        url - URL of the description (i.e. '/description.xml').
+        model_name - i.e. 'Philips hue bridge 2015'.
+        model_number - i.e. 'BSB002'.
+        serial_number - Serial number of the bridge (its MAC address).
+    """
+
+    def __init__(self, ip, url, model_name, model_number, serial_number):
+        self.ip = ip
+        self.url = url
+        self.model_name = model_name
+        self.model_number = model_number
+        self.serial_number = serial_number
+
+    def __repr__(self):
+        return self.model_name + ' (' + self.model_number + ') * serial = ' + self.serial_number + ' * ' + self.ip
+
+
+def probe_description(ip, url='/description.xml', timeout=2):
+    """
+    Get 'http://<ip>:80/<url>' and check <modelName> for a Philips hue bridge.
+
+    :param ip: IP of the device.
+    :param url: URL of the device description.
+    :param timeout: Seconds to wait for the connection and for the response.
+    :return BridgeDescription if the device is a Philips hue bridge, None otherwise (or if it could not be reached).
+    """
+
+    try:
+        conn = httplib.HTTPConnection(ip, 80, timeout=timeout)
+        try:
+            conn.request('GET', url)
+            data = conn.getresponse().read()
+        finally:
+            conn.close()
+        dom = xml.dom.minidom.parseString(data)
+    except (socket.error, httplib.HTTPException, xml.parsers.expat.ExpatError):
+        return None
+
+    values = {}
+    for tag in ('modelName', 'modelNumber', 'serialNumber'):
+        nodes = dom.getElementsByTagName(tag)
+        values[tag] = nodes[0].firstChild.nodeValue if nodes and nodes[0].firstChild else ''
+    if not set(['Philips', 'hue', 'bridge']).issubset(values['modelName'].split()):
+        return None
+    return BridgeDescription(ip, url, values['modelName'], values['modelNumber'], values['serialNumber'])
+
+
+class Discovery(object):
+    """
+    Discovery of Philips hue bridges on the local network with SSDP.
+
+    An M-SEARCH for the hue bridge search target is sent to the SSDP multicast address (and sent again every
+    SEARCH_INTERVAL seconds, UDP packets can be lost). The description of each device responding is probed
+    right away, concurrently with the other ones and with receiving more responses.
+    discover() returns as soon as the first bridge is confirmed, scan() yields each bridge until the deadline.
+    No device is probed after the deadline, but the probes started before it are waited for (at most probe_timeout
+    seconds), so a bridge responding right before the deadline is not missed.
+    """
+
+    DEFAULT_DEADLINE = 10
+    # seconds between two M-SEARCH requests
+    SEARCH_INTERVAL = 1
+    # seconds between two checks of the probes while waiting for responses
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, deadline=DEFAULT_DEADLINE, address=SSDP_ADDRESS, st=HUE_ST, probe_timeout=2):
+        """
+        :param deadline: Maximum number of seconds spent waiting for responses (the probes in progress then
+                         take at most probe_timeout seconds more).
+        :param address: Address the M-SEARCH requests are sent to (i.e. the address of an SSDPResponder).
+        :param st: Search target.
+        :param probe_timeout: Seconds to wait for the description of each device.
+        """
+
+        self.deadline = deadline
+        self.address = address
+        self.st = st
+        self.probe_timeout = probe_timeout
+        self.responses = []         # (ip, url) of each device that responded, in order
+
+    def discover(self):
+        """
+        Find the first Philips hue bridge.
+
+        :return BridgeDescription of the bridge or None if no bridge was found before the deadline.
+        """
+
+        scan = self.scan()
+        try:
+            return next(scan, None)
+        finally:
+            scan.close()
+
+    def scan(self):
+        """
+        Find the Philips hue bridges (until the deadline).
+
+        :return Generator of BridgeDescription, in the order they are confirmed.
+        """
+
+        end_time = time.time() + self.deadline
+        confirmed = queue.Queue()
+        probes = []
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            sock.bind(('', 0))
+            next_search = time.time()
+            while True:
+                # bridges confirmed by the probes so far
+                while not confirmed.empty():
+                    yield confirmed.get()
+
+                now = time.time()
+                if now >= end_time:
+                    break
+                if now >= next_search:
+                    self._search(sock)
+                    next_search = now + self.SEARCH_INTERVAL
+
+                sock.settimeout(max(0.001, min(self.POLL_INTERVAL, end_time - now)))
+                try:
+                    data = sock.recv(1024).decode('ascii', 'ignore')
+                except socket.error:
+                    # timeout, nothing received yet
+                    continue
+                location = self._parse_location(data)
+                if time.time() >= end_time:
+                    # received while the deadline passed, too late to be probed
+                    break
+                if (location is not None) and (location not in self.responses):
+                    # the same device can send the same response more than once
+                    self.responses.append(location)
+                    thread = threading.Thread(target=self._probe, args=(location, confirmed), name='Discovery')
+                    thread.daemon = True
+                    thread.start()
+                    probes.append(thread)
+        finally:
+            sock.close()
+
+        # grace period for the probes in progress at the deadline
+        for thread in probes:
+            thread.join(max(0.0, end_time + self.probe_timeout - time.time()))
+            while not confirmed.empty():
+                yield confirmed.get()
+
+    def _search(self, sock):
+        try:
+            sock.sendto(('M-SEARCH * HTTP/1.1\r\n'
+                         'HOST: 239.255.255.250:1900\r\n'
+                         'MAN: "ssdp:discover"\r\n'
+                         'MX: 1\r\n'
+                         'ST: ' + self.st + '\r\n\r\n').encode('utf-8'), self.address)
+        except socket.error as e:
+            print('Failed to send M-SEARCH : ' + str(e))
+
+    @staticmethod
+    def _parse_location(data):
+        # the bridge responds with 'LOCATION: http://<IP>:80/description.xml'
+        res = re.search(r'^LOCATION:\s*http://(\d+\.\d+\.\d+\.\d+)(?::(\d+))?(/[\w./-]*)', data, re.I | re.M)
+        # further a HTTP GET message will be sent, port must be 80
+        if (res is None) or (res.group(2) not in (None, '80')):
+            return None
+        return res.group(1), res.group(3)
+
+    def _probe(self, location, confirmed):
+        bridge = probe_description(location[0], location[1], self.probe_timeout)
+        if bridge is not None:
+            confirmed.put(bridge)
+
+
+class SSDPResponder(object):
+    """
+    Stand-in for the SSDP part of a Philips hue bridge (i.e. for testing the discovery without a bridge).
+
+    Responds to the M-SEARCH requests for the hue bridge search target (or 'ssdp:all') with the given location.
+    Listens on the given address, i.e. SSDPResponder(location, address=('127.0.0.1', 0)) along with
+    Discovery(address=responder.address), or joins the SSDP multicast group when given SSDP_ADDRESS.
+    """
+
+    def __init__(self, location, bridge_id='001788FFFE000000', address=('127.0.0.1', 0), delay=0):
+        """
+        :param location: URL sent in the LOCATION header (i.e. 'http://127.0.0.1:80/description.xml').
+        :param bridge_id: Bridge id sent in the 'hue-bridgeid' header.
+        :param address: Address to listen on.
+        :param delay: Seconds to wait before responding.
+        """
+
+        self.location = location
+        self.bridge_id = bridge_id
+        self.delay = delay
+        self.requests = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if address == SSDP_ADDRESS:
+            self._sock.bind(('', SSDP_ADDRESS[1]))
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                  struct.pack('4sl', socket.inet_aton(SSDP_ADDRESS[0]), socket.INADDR_ANY))
+            self.address = SSDP_ADDRESS
+        else:
+            self._sock.bind(address)
+            self.address = self._sock.getsockname()
+        self._sock.settimeout(0.5)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='SSDPResponder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop responding.
+
+        :return None
+        """
+
+        self._running = False
+        self._thread.join()
+        self._sock.close()
+
+    def _run(self):
+        while self._running:
+            try:
+                data, sender = self._sock.recvfrom(1024)
+            except socket.error:
+                continue
+            data = data.decode('ascii', 'ignore')
+            res = re.search(r'^ST:\s*(\S+)', data, re.I | re.M)
+            if not data.startswith('M-SEARCH') or (res is None) or (res.group(1) not in (HUE_ST, 'ssdp:all')):
+                continue
+            self.requests += 1
+            if self.delay:
+                time.sleep(self.delay)
+            self._sock.sendto(('HTTP/1.1 200 OK\r\n'
+                               'HOST: 239.255.255.250:1900\r\n'
+                               'EXT:\r\n'
+                               'CACHE-CONTROL: max-age=100\r\n'
+                               'LOCATION: ' + self.location + '\r\n'
+                               'SERVER: Linux/3.14.0 UPnP/1.0 IpBridge/1.26.0\r\n'
+                               'hue-bridgeid: ' + self.bridge_id + '\r\n'
+                               'ST: ' + res.group(1) + '\r\n'
+                               'USN: uuid:2f402f80-da50-11e1-9b23-' + self.bridge_id.lower() + '::' + res.group(1) +
+                               '\r\n\r\n').encode('ascii'), sender)
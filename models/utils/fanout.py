@@ -0,0 +1,97 @@
+import threading
+from models.utils.scheduler import current_priority, priority_lane
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the 'futures' backport, calls are run one after another
+    ThreadPoolExecutor = None
+
+
+class FanOutResult(object):
+    """
+    Outcome of a collection call (i.e. bridge.lights.set_color(255, 0, 0)) for each light.
+
+    Properties:
+        results - Dictionary of the value returned for each light, indexed by light name.
+        errors - Dictionary of the exception raised for each light, indexed by light name.
+        ok - True if no light raised an exception.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+
+    def __repr__(self):
+        return 'FanOutResult * %d succeeded * %d failed' % (len(self.results), len(self.errors)) + "".join(
+            '\n' + str(name) + ' : ' + repr(error) for name, error in self.errors.items())
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def call(self, key, function):
+        """
+        Call a function and record the value it returns or the exception it raises.
+
+        :param key: Key of the outcome (i.e. light name).
+        :param function: Function called without arguments.
+        :return None
+        """
+
+        try:
+            self.results[key] = function()
+        except Exception as e:
+            self.errors[key] = e
+
+
+class FanOutExecutor(object):
+    """
+    Runs the calls of a collection call for each light concurrently, on a bounded thread pool
+    (or on the executor given, i.e. a concurrent.futures.ThreadPoolExecutor shared with the application).
+
+    At most max_concurrency calls run at the same time, across all collection calls,
+    so that the bridge is not overwhelmed.
+    """
+
+    DEFAULT_MAX_CONCURRENCY = 4
+
+    def __init__(self, executor=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        :param executor: Executor with a submit(function, *args) method returning a future (optional).
+        :param max_concurrency: Maximum number of calls running at the same time.
+        """
+
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        if (executor is None) and (ThreadPoolExecutor is not None):
+            executor = ThreadPoolExecutor(max_concurrency)
+        self._executor = executor
+
+    def __repr__(self):
+        return 'FanOutExecutor * max concurrency = %d * executor = %s' % (self.max_concurrency, self._executor)
+
+    def run(self, calls):
+        """
+        Run all calls and wait for them to finish.
+
+        :param calls: List of (key, function) pairs, each function is called without arguments.
+        :return FanOutResult with the value returned or the exception raised by each function, indexed by key.
+        """
+
+        result = FanOutResult()
+        if (self._executor is None) or (len(calls) < 2):
+            for key, function in calls:
+                self._call(result, key, function, current_priority())
+            return result
+
+        # the priority lane (see CommandScheduler) of the caller applies to the calls run by the pool
+        priority = current_priority()
+        futures = [self._executor.submit(self._call, result, key, function, priority) for key, function in calls]
+        [future.result() for future in futures]
+        return result
+
+    def _call(self, result, key, function, priority):
+        with self._semaphore:
+            with priority_lane(priority):
+                result.call(key, function)
@@ -0,0 +1,252 @@
+import socket
+import threading
+import time
+from collections import deque
+
+
+class PipelinedCommand(object):
+    """
+    A PUT request written on the pipeline, waiting for its response.
+    """
+
+    def __init__(self, host, url_suffix, url, data):
+        self.url_suffix = url_suffix
+        self.data = data
+        body = data.encode('utf-8')
+        self.request = ('PUT ' + url + ' HTTP/1.1\r\n'
+                        'Host: ' + host + '\r\n'
+                        'Content-Type: application/json\r\n'
+                        'Content-Length: ' + str(len(body)) + '\r\n\r\n').encode('utf-8') + body
+        self.retries = 0
+
+
+class Pipeline(object):
+    """
+    HTTP/1.1 pipelining of PUT requests on one persistent connection to the bridge.
+
+    Each request is written right away, without waiting for the responses of the previous ones
+    (at most max_in_flight requests wait for a response at the same time).
+    A background thread reads the responses, which come in the same order as the requests,
+    and passes each one along with its request to on_response(url_suffix, data, status, body).
+    If the connection is lost, the requests without a response are sent again on a new connection
+    (at most MAX_RETRIES times), then given up with on_response(url_suffix, data, None, None).
+
+    Statistics: sent, answered, resent and lost requests.
+    """
+
+    # times a request without a response is sent again (PUT requests can safely be sent more than once)
+    MAX_RETRIES = 3
+
+    def __init__(self, host, port=80, on_response=None, max_in_flight=16, timeout=10):
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout                      # seconds to wait for a response before reconnecting
+        self._on_response = on_response
+        self._sock = None
+        self._file = None
+        self._in_flight = deque()                   # commands written, waiting for a response, oldest first
+        self._cond = threading.Condition()
+        self.sent = self.answered = self.resent = self.lost = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='Pipeline')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return 'Pipeline(%s:%d) * in flight = %d * sent = %d * answered = %d * resent = %d * lost = %d' % (
+            self.host, self.port, len(self._in_flight), self.sent, self.answered, self.resent, self.lost)
+
+    def submit(self, url_suffix, url, data):
+        """
+        Write a PUT request on the pipeline (blocks only while max_in_flight requests wait for a response).
+
+        :param url_suffix: Object to set (i.e. 'lights/<light_id>/state'), passed back to on_response.
+        :param url: Absolute URL path of the request (i.e. '/api/<bridgeUser>/lights/<light_id>/state').
+        :param data: data to send to the bridge (i.e. '{"bri":200}').
+        :return None
+        """
+
+        command = PipelinedCommand(self.host, url_suffix, url, data)
+        lost = []
+        with self._cond:
+            while self._running and len(self._in_flight) >= self.max_in_flight:
+                self._cond.wait()
+            if not self._running:
+                raise RuntimeError('Pipeline stopped')
+            if (self._sock is None) and self._in_flight:
+                # the connection was lost before the responses of the requests written, they are sent again first
+                # so that the responses on the new connection come in the order of self._in_flight
+                lost = self._reconnect()
+            self._write(command)
+            self.sent += 1
+        for lost_command in lost:
+            self._notify(lost_command, None, None)
+
+    def flush(self, timeout=None):
+        """
+        Wait until all requests written got a response (or were given up).
+
+        :param timeout: Maximum number of seconds to wait (optional).
+        :return True if no request is waiting for a response anymore, False on timeout.
+        """
+
+        end_time = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._in_flight:
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """
+        Wait for all responses and close the connection.
+
+        :return None
+        """
+
+        self.flush(self.timeout)
+        with self._cond:
+            self._running = False
+            self._disconnect()
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        """
+        Get the pipeline statistics.
+
+        :return Dictionary with 'in_flight', 'sent', 'answered', 'resent' and 'lost' counters.
+        """
+
+        with self._cond:
+            return {'in_flight': len(self._in_flight),
+                    'sent': self.sent,
+                    'answered': self.answered,
+                    'resent': self.resent,
+                    'lost': self.lost}
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._file = self._sock.makefile('rb')
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except socket.error:
+                pass
+        self._sock = self._file = None
+
+    def _write(self, command):
+        # called with the lock held, the order of the requests on the socket must match self._in_flight
+        try:
+            if self._sock is None:
+                self._connect()
+            self._sock.sendall(command.request)
+        except socket.error:
+            # resent on a new connection, by the reader or by the next submit()
+            self._disconnect()
+        self._in_flight.append(command)
+        self._cond.notify_all()
+
+    def _reconnect(self):
+        # called by the reader (or by submit()) with the lock held: resend the requests without a response
+        self._disconnect()
+        commands = list(self._in_flight)
+        self._in_flight.clear()
+        lost = []
+        for i, command in enumerate(commands):
+            if command.retries >= self.MAX_RETRIES:
+                lost.append(command)
+                continue
+            command.retries += 1
+            self.resent += 1
+            self._write(command)
+            if self._sock is None:
+                # the bridge cannot be reached anymore, give up all requests
+                lost += list(self._in_flight) + commands[i + 1:]
+                self._in_flight.clear()
+                break
+        self.lost += len(lost)
+        self._cond.notify_all()
+        return lost
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._in_flight:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                connection, stream = self._sock, self._file
+
+            lost = []
+            try:
+                if stream is None:
+                    raise socket.error('Not connected')
+                status, keep_alive, body = self._read_response(stream)
+            except (socket.error, ValueError, EOFError):
+                with self._cond:
+                    # unless submit() already sent the requests again on a new connection
+                    if self._running and (self._sock is connection):
+                        lost = self._reconnect()
+                for command in lost:
+                    self._notify(command, None, None)
+                continue
+
+            with self._cond:
+                if self._sock is not connection:
+                    # response on a connection given up meanwhile, its request was sent again on the new one
+                    continue
+                command = self._in_flight.popleft()
+                self.answered += 1
+                if not keep_alive:
+                    # the bridge closes the connection after this response, the next requests go on a new one
+                    lost = self._reconnect()
+                self._cond.notify_all()
+            self._notify(command, status, body)
+            for command in lost:
+                self._notify(command, None, None)
+
+    def _notify(self, command, status, body):
+        if self._on_response is not None:
+            try:
+                self._on_response(command.url_suffix, command.data, status, body)
+            except Exception as e:
+                print('Error handling the response for ' + command.url_suffix + ' : ' + str(e))
+
+    @staticmethod
+    def _read_response(stream):
+        status_line = stream.readline().decode('ascii', 'ignore')
+        if not status_line:
+            raise EOFError('Connection closed by the bridge')
+        version, status, reason = (status_line.rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+        headers = {}
+        while True:
+            line = stream.readline().decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = (version == 'HTTP/1.1') and (headers.get('connection', '').lower() != 'close')
+        if 'content-length' in headers:
+            body = stream.read(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(stream.readline().split(b';')[0], 16)
+                if not size:
+                    stream.readline()
+                    break
+                body += stream.read(size)
+                stream.readline()
+        else:
+            body = stream.read()
+            keep_alive = False
+        return int(status), keep_alive, body
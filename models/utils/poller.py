@@ -0,0 +1,206 @@
+import copy
+import threading
+import time
+
+
+class ChangeEvent(object):
+    """
+    Change of a light or group detected by the StatePoller.
+
+    Properties:
+        resource - 'lights' or 'groups'.
+        id - Id of the light or group.
+        name - Name of the light or group (the new one if it was renamed).
+        kind - What changed:
+            'on' - turned on/off (for groups: the 'on' setting of the group action)
+            'bri' - brightness
+            'xy' - color coordinates
+            'ct' - color temperature
+            'reachable' - light became reachable/unreachable
+            'renamed' - name changed
+            'added' - new light or group (old is None)
+            'removed' - light or group deleted (new is None)
+        old - Previous value.
+        new - Current value.
+    """
+
+    def __init__(self, resource, id, name, kind, old, new):
+        self.resource = resource
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.old = old
+        self.new = new
+
+    def __repr__(self):
+        return '(' + str(self.id) + ') * ' + str(self.name) + ' * ' + self.kind + ' : ' + str(self.old) + ' -> ' + str(
+            self.new)
+
+
+class StatePoller(object):
+    """
+    Background poller of the bridge state.
+
+    Every 'interval' seconds all lights and all groups are fetched with a single request each,
+    compared with the previous ones and each change (see ChangeEvent) is passed to the callbacks subscribed
+    for that resource type. The data fetched also refreshes the shared state cache (see StateCache).
+    """
+
+    # event kind and location in the resource data of each attribute watched, for each resource type
+    WATCHED = {
+        'lights': [('on', ('state', 'on')),
+                   ('bri', ('state', 'bri')),
+                   ('xy', ('state', 'xy')),
+                   ('ct', ('state', 'ct')),
+                   ('reachable', ('state', 'reachable')),
+                   ('renamed', ('name',))],
+        'groups': [('on', ('action', 'on')),
+                   ('bri', ('action', 'bri')),
+                   ('xy', ('action', 'xy')),
+                   ('ct', ('action', 'ct')),
+                   ('renamed', ('name',))]
+    }
+
+    def __init__(self, comms, interval=1.0):
+        """
+        :param comms: Comms instance to communicate with the bridge.
+        :param interval: Seconds between two polls.
+        """
+
+        self._comms = comms
+        self.interval = interval
+        self._callbacks = dict((resource, []) for resource in self.WATCHED)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+
+    def __repr__(self):
+        return 'StatePoller * interval = %.2fs * polls = %d * %s' % (
+            self.interval, self.polls, 'running' if self.running else 'stopped')
+
+    @property
+    def running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def subscribe(self, resource, callback, kinds=None):
+        """
+        Register a callback for the changes of a resource type.
+
+        :param resource: 'lights' or 'groups'.
+        :param callback: Function called as callback(event) for each change (see ChangeEvent).
+        :param kinds: List of event kinds the callback is interested in (optional, all kinds if not given).
+        :return None
+        """
+
+        if resource not in self.WATCHED:
+            raise ValueError('Cannot subscribe to ' + str(resource) + ', only to ' + ', '.join(self.WATCHED))
+        with self._lock:
+            self._callbacks[resource].append((callback, set(kinds) if kinds is not None else None))
+
+    def unsubscribe(self, resource, callback):
+        """
+        Remove all registrations of a callback for a resource type.
+
+        :param resource: 'lights' or 'groups'.
+        :param callback: Function previously subscribed.
+        :return None
+        """
+
+        with self._lock:
+            self._callbacks[resource] = [(registered, kinds) for registered, kinds in self._callbacks[resource]
+                                         if registered != callback]
+
+    def start(self):
+        """
+        Start polling in background (nothing happens if already polling).
+
+        :return None
+        """
+
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='StatePoller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling.
+
+        :return None
+        """
+
+        self._stop.set()
+        if self.running and (self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def poll(self):
+        """
+        Fetch all lights and groups once, update the state cache and dispatch the changes.
+        The first poll only records the current state.
+
+        :return List of ChangeEvent instances dispatched.
+        """
+
+        events = []
+        for resource in self.WATCHED:
+            fetch_time = time.time()
+            data = self._comms.get(resource + '/')
+            if not isinstance(data, dict):
+                # i.e. error response
+                continue
+            self._comms.cache.merge_all(resource, data, fetch_time)
+            previous = self._snapshots.get(resource)
+            self._snapshots[resource] = copy.deepcopy(data)
+            if previous is not None:
+                events += self._diff(resource, previous, data)
+        self.polls += 1
+
+        for event in events:
+            self._dispatch(event)
+        return events
+
+    def _diff(self, resource, previous, current):
+        events = []
+        for id, data in current.items():
+            if id not in previous:
+                events.append(ChangeEvent(resource, id, data.get('name'), 'added', None, data))
+                continue
+            for kind, location in self.WATCHED[resource]:
+                old, new = self._lookup(previous[id], location), self._lookup(data, location)
+                if old != new:
+                    events.append(ChangeEvent(resource, id, data.get('name'), kind, old, new))
+        for id, data in previous.items():
+            if id not in current:
+                events.append(ChangeEvent(resource, id, data.get('name'), 'removed', data, None))
+        return events
+
+    @staticmethod
+    def _lookup(data, location):
+        for key in location:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data
+
+    def _dispatch(self, event):
+        with self._lock:
+            callbacks = list(self._callbacks[event.resource])
+        for callback, kinds in callbacks:
+            if (kinds is None) or (event.kind in kinds):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print('Error in callback for ' + str(event) + ' : ' + str(e))
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.poll()
+            except Exception as e:
+                print('Failed polling the bridge : ' + str(e))
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
@@ -0,0 +1,328 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+# Priority lanes, lower value is sent first.
+PRIORITY_INTERACTIVE = 0    # commands typed in the shell or called directly on a light
+PRIORITY_BULK = 1           # collection calls (bridge.lights.turn_on(), bridge.groups.Living.set_bri(), etc.)
+PRIORITY_BACKGROUND = 2     # scripts and effects that can wait (or be dropped when the bridge is overloaded)
+
+_lane = threading.local()
+
+
+def current_priority():
+    """
+    Get the priority lane used for the commands sent from the current thread.
+
+    :return PRIORITY_INTERACTIVE, PRIORITY_BULK or PRIORITY_BACKGROUND.
+    """
+
+    return getattr(_lane, 'priority', PRIORITY_INTERACTIVE)
+
+
+class priority_lane(object):
+    """
+    Context manager sending all commands from the current thread on a given priority lane, i.e.:
+
+        with priority_lane(PRIORITY_BACKGROUND):
+            bridge.lights.set_bri(100)
+
+    Nested lanes can only lower the priority (a background script stays in background for collection calls too).
+    """
+
+    def __init__(self, priority):
+        self.priority = priority
+
+    def __enter__(self):
+        self._previous = current_priority()
+        _lane.priority = max(self._previous, self.priority)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _lane.priority = self._previous
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing 'rate' commands per second on average, with bursts of at most 'burst' commands.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last_time = time.time()
+
+    def delay(self):
+        """
+        Get the time to wait until a command can be sent.
+
+        :return Seconds to wait (0 if a command can be sent now).
+        """
+
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class Command(object):
+    """
+    A pending write to one resource (i.e. 'lights/5/state'), merging all writes submitted until it is sent.
+    """
+
+    def __init__(self, key, url_suffix, data, priority):
+        self.key = key      # key of the pending write slot (the url_suffix, unless the data cannot be merged)
+        self.url_suffix = url_suffix
+        self.resource = url_suffix.split('/')[0]
+        self.priority = priority
+        try:
+            self.state = json.loads(data)
+        except ValueError:
+            self.state = None
+        self.data = data
+
+    def merge(self, data, priority):
+        """
+        Merge a newer write into this one (newer values replace older ones for the same attributes).
+
+        :return True if merged or False if the data cannot be merged (not a JSON object).
+        """
+
+        if not isinstance(self.state, dict):
+            return False
+        try:
+            state = json.loads(data)
+        except ValueError:
+            return False
+        if not isinstance(state, dict):
+            return False
+        self.state.update(state)
+        self.data = json.dumps(self.state)
+        self.priority = min(self.priority, priority)
+        return True
+
+
+class CommandScheduler(object):
+    """
+    Paces the commands (PUT requests) sent to the bridge, which starts dropping or delaying commands
+    above about 10 light commands/s and 1 group command/s.
+
+    - Each resource class ('lights', 'groups', etc.) has its own token bucket (see DEFAULT_RATES).
+    - Each resource has a single pending write slot: writes submitted before the slot is sent are merged,
+      so only the latest values are sent (i.e. only the last 'bri' for light 5).
+    - Commands are sent by priority lane (see priority_lane()): interactive, then bulk, then background.
+      When max_pending commands are waiting, the oldest background command is dropped to make room.
+
+    Statistics (see stats()): queue depth, submitted/sent/merged/dropped/failed counts and achieved command rate.
+    """
+
+    # average commands per second accepted by the bridge for each resource class
+    DEFAULT_RATES = {'lights': 10.0, 'groups': 1.0}
+    # commands per second for any other resource class
+    DEFAULT_RATE = 10.0
+    # time window in seconds for computing the achieved command rate
+    RATE_WINDOW = 10.0
+
+    def __init__(self, send, rates=None, burst=1, max_pending=100):
+        """
+        :param send: Function sending a command to the bridge, called as send(url_suffix, data) (i.e. Comms._put).
+        :param rates: Dictionary of commands per second by resource class, overriding DEFAULT_RATES (optional).
+        :param burst: Number of commands that can be sent at once after an idle period (for each resource class).
+        :param max_pending: Maximum number of commands waiting to be sent.
+        """
+
+        self._send = send
+        self.rates = dict(self.DEFAULT_RATES)
+        self.rates.update(rates or {})
+        self.burst = burst
+        self.max_pending = max_pending
+        self._buckets = {}
+        self._pending = {}                                  # pending write slot for each resource (url_suffix)
+        self._lanes = [deque(), deque(), deque()]           # pending commands for each priority lane, oldest first
+        self._sent_times = deque()
+        self._in_flight = 0
+        self.submitted = self.sent = self.merged = self.dropped = self.failed = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='CommandScheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        stats = self.stats()
+        return ('CommandScheduler * queue depth = %d * sent = %d * merged = %d * dropped = %d * failed = %d * '
+                'rate = %.2f/s' % (stats['queue_depth'], stats['sent'], stats['merged'], stats['dropped'],
+                                   stats['failed'], stats['rate']))
+
+    def submit(self, url_suffix, data, priority=None):
+        """
+        Queue a command, merging it with the pending command for the same resource if there is one.
+
+        :param url_suffix: Object to set (i.e. 'lights/<light_id>/state').
+        :param data: data to send to the bridge (i.e. '{"bri":200}').
+        :param priority: Priority lane (optional, the current lane of the calling thread if not given).
+        :return True if the command was queued or merged, False if it was dropped.
+        """
+
+        if priority is None:
+            priority = current_priority()
+        with self._cond:
+            self.submitted += 1
+            key = url_suffix
+            command = self._pending.get(key)
+            if command is not None:
+                previous_priority = command.priority
+                if command.merge(data, priority):
+                    self.merged += 1
+                    if command.priority != previous_priority:
+                        # promoted to a higher priority lane (it is skipped when met again in the old one)
+                        self._lanes[command.priority].append(command)
+                    self._cond.notify()
+                    return True
+                # cannot be merged, the pending command is sent first and this one waits in its own slot
+                key = (url_suffix, self.submitted)
+
+            if (len(self._pending) >= self.max_pending) and not self._drop_background():
+                if priority == PRIORITY_BACKGROUND:
+                    self.dropped += 1
+                    return False
+
+            command = Command(key, url_suffix, data, priority)
+            self._pending[key] = command
+            self._lanes[priority].append(command)
+            self._cond.notify()
+            return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until all pending commands are sent.
+
+        :param timeout: Maximum number of seconds to wait (optional).
+        :return True if all commands were sent, False on timeout.
+        """
+
+        end_time = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, flush=True):
+        """
+        Stop sending commands.
+
+        :param flush: Send all pending commands before stopping.
+        :return None
+        """
+
+        if flush:
+            self.flush()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        """
+        Get the scheduler statistics.
+
+        :return Dictionary with:
+            'queue_depth' - commands waiting to be sent,
+            'queue_depth_per_lane' - commands waiting in each priority lane (interactive, bulk, background),
+            'submitted', 'sent', 'merged', 'dropped', 'failed' - command counters,
+            'rate' - commands sent per second over the last RATE_WINDOW seconds.
+        """
+
+        with self._cond:
+            self._trim_sent_times()
+            lanes = [0, 0, 0]
+            for command in self._pending.values():
+                lanes[command.priority] += 1
+            return {'queue_depth': len(self._pending),
+                    'queue_depth_per_lane': lanes,
+                    'submitted': self.submitted,
+                    'sent': self.sent,
+                    'merged': self.merged,
+                    'dropped': self.dropped,
+                    'failed': self.failed,
+                    'rate': len(self._sent_times) / self.RATE_WINDOW}
+
+    def _bucket(self, resource):
+        if resource not in self._buckets:
+            self._buckets[resource] = TokenBucket(self.rates.get(resource, self.DEFAULT_RATE), self.burst)
+        return self._buckets[resource]
+
+    def _is_pending(self, command, priority):
+        return (command.priority == priority) and (self._pending.get(command.key) is command)
+
+    def _drop_background(self):
+        lane = self._lanes[PRIORITY_BACKGROUND]
+        while lane:
+            command = lane.popleft()
+            if self._is_pending(command, PRIORITY_BACKGROUND):
+                del self._pending[command.key]
+                self.dropped += 1
+                return True
+        return False
+
+    def _next_command(self):
+        # the first command, by priority lane, whose resource class can be sent now
+        # or None along with the time to wait until one can be sent
+        wait = None
+        for priority, lane in enumerate(self._lanes):
+            blocked = set()
+            for command in list(lane):
+                if not self._is_pending(command, priority):
+                    # already sent, dropped or promoted to another lane
+                    lane.remove(command)
+                    continue
+                if command.resource in blocked:
+                    continue
+                delay = self._bucket(command.resource).delay()
+                if delay == 0:
+                    lane.remove(command)
+                    del self._pending[command.key]
+                    self._bucket(command.resource).consume()
+                    return command, None
+                blocked.add(command.resource)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _trim_sent_times(self):
+        while self._sent_times and time.time() - self._sent_times[0] > self.RATE_WINDOW:
+            self._sent_times.popleft()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    command, wait = self._next_command()
+                    if command is not None:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                self._in_flight += 1
+
+            try:
+                self._send(command.url_suffix, command.data)
+                failed = False
+            except Exception as e:
+                print('Error sending ' + command.data + ' to ' + command.url_suffix + ' : ' + str(e))
+                failed = True
+
+            with self._cond:
+                self._in_flight -= 1
+                self.sent += 1
+                self.failed += failed
+                self._sent_times.append(time.time())
+                self._cond.notify_all()
@@ -0,0 +1,356 @@
+import json
+import threading
+import time
+
+
+class StateCache(object):
+    """
+    Shared cache of the bridge state, keyed by resource path (i.e. 'lights/3', 'groups/1').
+
+    All lights (and all groups) are refreshed together with a single request (GET 'lights/', GET 'groups/')
+    once their data is older than the time to live of their resource type (see DEFAULT_TTL).
+    Stale data is still returned (stale-while-revalidate) while a background refresh runs,
+    unless it is older than ttl + max_stale seconds, in which case it is fetched right away.
+    Invalidated resources (see invalidate()) are always fetched right away, on their own.
+
+    After writes to 'lights/<id>/state', 'groups/<id>/action' or 'lights/<id>' (i.e. renames), the values confirmed
+    by the bridge are applied right away to the cached data, while attributes that failed or were not confirmed are fetched again
+    (see apply_write()).
+
+    Statistics: hits (fresh data), stale hits (stale data returned while refreshing), misses (fetched right away)
+    and the number of requests sent.
+    """
+
+    # time to live in seconds for each resource type
+    DEFAULT_TTL = {'lights': 5, 'groups': 5}
+    # time to live in seconds for any other resource type
+    DEFAULT_TYPE_TTL = 5
+    # color mode of a light after setting one of these attributes
+    COLOR_MODES = {'xy': 'xy', 'ct': 'ct', 'hue': 'hs', 'sat': 'hs'}
+    # attributes that are accepted by the bridge without being part of the state
+    TRANSIENT_ATTRIBUTES = ('transitiontime',)
+
+    def __init__(self, fetch, ttl=None, max_stale=60):
+        """
+        :param fetch: Function getting data from the bridge, called as fetch(url_suffix) (i.e. Comms.get).
+        :param ttl: Dictionary of time to live in seconds by resource type, overriding DEFAULT_TTL (optional).
+        :param max_stale: Seconds after the time to live when stale data is not returned anymore.
+        """
+
+        self._fetch = fetch
+        self.ttl = dict(self.DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.max_stale = max_stale
+        self._types = {}            # cached data for each resource type
+        self._refreshing = set()    # resource types being refreshed in background
+        self._loading = {}          # requests running for the readers (see _load()), indexed by path fetched
+        self._lock = threading.RLock()
+        self.hits = self.stale_hits = self.misses = self.requests = 0
+
+    def __repr__(self):
+        return 'StateCache * hits = %d * stale hits = %d * misses = %d * requests = %d' % (
+            self.hits, self.stale_hits, self.misses, self.requests)
+
+    @staticmethod
+    def _split(path):
+        parts = str(path).strip('/').split('/')
+        return parts[0], (parts[1] if len(parts) > 1 else None)
+
+    def _entry(self, resource_type):
+        if resource_type not in self._types:
+            # data and refresh time of each resource, invalidation time of invalid ones, refresh time of all resources
+            self._types[resource_type] = {'data': {}, 'times': {}, 'invalid': {}, 'time': None}
+        return self._types[resource_type]
+
+    def get(self, path):
+        """
+        Get the data of one resource.
+
+        :param path: Resource path (i.e. 'lights/3').
+        :return Data of the resource in JSON format.
+        """
+
+        resource_type, id = self._split(path)
+        with self._lock:
+            entry = self._types.get(resource_type)
+            if (entry is None) or (entry['time'] is None):
+                # never loaded, get all resources of this type at once
+                self.misses += 1
+                load_id = None
+            elif (id not in entry['data']) or (id in entry['invalid']):
+                # new or invalidated resource, get it on its own
+                self.misses += 1
+                load_id = id
+            else:
+                age = time.time() - entry['times'][id]
+                ttl = self.ttl.get(resource_type, self.DEFAULT_TYPE_TTL)
+                if age < ttl:
+                    self.hits += 1
+                    return entry['data'][id]
+                if age < ttl + self.max_stale:
+                    self.stale_hits += 1
+                    self._revalidate(resource_type)
+                    return entry['data'][id]
+                self.misses += 1
+                load_id = None
+        # fetched without holding the lock, so that the readers of the other resources are not blocked
+        self._load(resource_type, load_id)
+        with self._lock:
+            return self._types[resource_type]['data'][id]
+
+    def get_all(self, resource_type):
+        """
+        Get the data of all resources of a type, with a single request if they have to be fetched.
+
+        :param resource_type: Resource type (i.e. 'lights' or 'groups').
+        :return Dictionary of resource data indexed by resource id.
+        """
+
+        with self._lock:
+            entry = self._types.get(resource_type)
+            ttl = self.ttl.get(resource_type, self.DEFAULT_TYPE_TTL)
+            if (entry is None) or (entry['time'] is None) or entry['invalid'] or (
+                    time.time() - entry['time'] >= ttl + self.max_stale):
+                self.misses += 1
+            else:
+                if time.time() - entry['time'] >= ttl:
+                    self.stale_hits += 1
+                    self._revalidate(resource_type)
+                else:
+                    self.hits += 1
+                return dict(entry['data'])
+        self._load(resource_type)
+        with self._lock:
+            return dict(self._types[resource_type]['data'])
+
+    def set(self, path, data):
+        """
+        Store the data of one resource (i.e. fetched along with other data).
+
+        :param path: Resource path (i.e. 'lights/3').
+        :param data: Data of the resource in JSON format.
+        :return None
+        """
+
+        resource_type, id = self._split(path)
+        with self._lock:
+            entry = self._entry(resource_type)
+            entry['data'][id] = data
+            entry['times'][id] = time.time()
+            entry['invalid'].pop(id, None)
+            if entry['time'] is None:
+                entry['time'] = time.time()
+
+    def set_all(self, resource_type, data):
+        """
+        Store the data of all resources of a type (i.e. from GET 'lights/' or from the whole datastore).
+
+        :param resource_type: Resource type (i.e. 'lights' or 'groups').
+        :param data: Dictionary of resource data indexed by resource id.
+        :return None
+        """
+
+        with self._lock:
+            now = time.time()
+            entry = self._entry(resource_type)
+            entry['data'] = dict(data)
+            entry['times'] = dict((id, now) for id in data)
+            entry['invalid'] = {}
+            entry['time'] = now
+
+    def merge_all(self, resource_type, data, fetch_time):
+        """
+        Store the data of all resources of a type fetched in background, keeping the resources that were set
+        or invalidated after the request was sent (their cached data is more recent than the data fetched).
+
+        :param resource_type: Resource type (i.e. 'lights' or 'groups').
+        :param data: Dictionary of resource data indexed by resource id.
+        :param fetch_time: Time when the request was sent.
+        :return None
+        """
+
+        with self._lock:
+            entry = self._entry(resource_type)
+            now = time.time()
+            for id, value in data.items():
+                if entry['times'].get(id, 0) < fetch_time:
+                    entry['data'][id] = value
+                    entry['times'][id] = now
+            for id in [id for id in entry['data'] if id not in data]:
+                # deleted from the bridge
+                self.discard(resource_type + '/' + id)
+            entry['invalid'] = dict((id, invalid_time) for id, invalid_time in entry['invalid'].items()
+                                    if invalid_time >= fetch_time)
+            entry['time'] = now
+
+    def refresh_time(self, path):
+        """
+        Get the time when the data of one resource was last fetched.
+
+        :param path: Resource path (i.e. 'lights/3').
+        :return Time in seconds since the epoch or None if never fetched.
+        """
+
+        resource_type, id = self._split(path)
+        with self._lock:
+            return self._types.get(resource_type, {}).get('times', {}).get(id)
+
+    def invalidate(self, path):
+        """
+        Invalidate one resource (i.e. 'lights/3') or all resources of a type (i.e. 'lights'),
+        so that the next read fetches it from the bridge.
+
+        :param path: Resource path or resource type.
+        :return None
+        """
+
+        resource_type, id = self._split(path)
+        with self._lock:
+            entry = self._types.get(resource_type)
+            if entry is None:
+                return
+            if id is None:
+                entry['time'] = None
+            elif id in entry['data']:
+                entry['invalid'][id] = time.time()
+
+    def discard(self, path):
+        """
+        Remove one resource from the cache (i.e. after it was deleted from the bridge).
+
+        :param path: Resource path (i.e. 'groups/8').
+        :return None
+        """
+
+        resource_type, id = self._split(path)
+        with self._lock:
+            entry = self._types.get(resource_type)
+            if entry is not None:
+                entry['data'].pop(id, None)
+                entry['times'].pop(id, None)
+                entry['invalid'].pop(id, None)
+
+    def apply_write(self, url_suffix, data, response):
+        """
+        Update the cache after a write to the bridge.
+
+        The values confirmed by the bridge ('[{"success":{"/lights/<id>/state/bri":150}}]') are written
+        to the cached data of the resource, so that reading them right after the write needs no request.
+        If an attribute failed or was not confirmed, the resource is invalidated (fetched again on the next read).
+        For groups, the confirmed values are written to the lights from the group too.
+
+        :param url_suffix: Object written (i.e. 'lights/<id>/state', 'groups/<id>/action' or 'lights/<id>').
+        :param data: data sent to the bridge (i.e. '{"bri":150}').
+        :param response: Response of the bridge in JSON format.
+        :return None
+        """
+
+        parts = str(url_suffix).strip('/').split('/')
+        if len(parts) not in (2, 3):
+            return
+        # attributes of the resource itself (i.e. 'name') have no section
+        resource_type, id, section = (parts + [None])[:3]
+        try:
+            sent = json.loads(data)
+        except ValueError:
+            sent = {}
+        if not isinstance(sent, dict):
+            sent = {}
+
+        # values confirmed by the bridge for this resource, indexed by attribute
+        confirmed = {}
+        for item in response:
+            if isinstance(item, dict) and isinstance(item.get('success'), dict):
+                for address, value in item['success'].items():
+                    address = address.strip('/').split('/')
+                    if (len(address) == len(parts) + 1) and (address[:-1] == parts):
+                        confirmed[address[-1]] = value
+
+        with self._lock:
+            self._apply_confirmed(resource_type, id, section, sent, confirmed, True)
+            if (resource_type == 'groups') and (section == 'action'):
+                # the lights of the group changed too (attributes a light does not have are ignored)
+                for light_id in self._group_lights(id):
+                    self._apply_confirmed('lights', light_id, 'state', sent, confirmed, False)
+
+    def _apply_confirmed(self, resource_type, id, section, sent, confirmed, strict):
+        entry = self._types.get(resource_type)
+        cached = entry['data'].get(id) if entry is not None else None
+        if not isinstance(cached, dict) or (id in entry['invalid']):
+            return
+        target = cached if section is None else cached.get(section)
+        if not isinstance(target, dict):
+            return
+        refetch = any(key not in confirmed for key in sent if key not in self.TRANSIENT_ATTRIBUTES)
+        for key, value in confirmed.items():
+            if key in target:
+                target[key] = value
+                if (key in self.COLOR_MODES) and ('colormode' in target):
+                    target['colormode'] = self.COLOR_MODES[key]
+                if (section == 'action') and (key == 'on') and isinstance(cached.get('state'), dict):
+                    # all lights of the group were turned on/off
+                    cached['state'].update({'all_on': value, 'any_on': value})
+            elif strict and (key not in self.TRANSIENT_ATTRIBUTES):
+                # i.e. 'bri_inc', the resulting value is not known
+                refetch = True
+        if refetch:
+            self.invalidate(resource_type + '/' + id)
+        else:
+            entry['times'][id] = time.time()
+
+    def _group_lights(self, group_id):
+        if group_id == '0':
+            # group 0 is a special group containing all lights
+            return list(self._types.get('lights', {}).get('data', {}).keys())
+        group = self._types.get('groups', {}).get('data', {}).get(group_id)
+        return list(group.get('lights', [])) if isinstance(group, dict) else []
+
+    def _load(self, resource_type, id=None):
+        # fetch all resources of a type (or one resource) and store them, the lock is only held to mark the request
+        # as running and to store its result: the readers needing the same data wait for the same request
+        path = resource_type + '/' + (id if id is not None else '')
+        with self._lock:
+            loading = self._loading.get(path)
+            running = loading is not None
+            if not running:
+                loading = self._loading[path] = threading.Event()
+                loading.error = None
+                self.requests += 1
+        if running:
+            loading.wait()
+            if loading.error is not None:
+                raise loading.error
+            return
+        try:
+            data = self._fetch(path)
+            if id is None:
+                self.set_all(resource_type, data)
+            else:
+                self.set(path, data)
+        except Exception as e:
+            loading.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(path, None)
+            loading.set()
+
+    def _revalidate(self, resource_type):
+        if resource_type in self._refreshing:
+            return
+        self._refreshing.add(resource_type)
+        thread = threading.Thread(target=self._background_load, args=(resource_type,), name='StateCache')
+        thread.daemon = True
+        thread.start()
+
+    def _background_load(self, resource_type):
+        try:
+            with self._lock:
+                self.requests += 1
+            started = time.time()
+            self.merge_all(resource_type, self._fetch(resource_type + '/'), started)
+        except Exception as e:
+            print('Failed refreshing ' + resource_type + ' : ' + str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(resource_type)
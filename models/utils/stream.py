@@ -0,0 +1,318 @@
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+
+# message layout of the Hue entertainment API (version 1.0): protocol name, version, sequence number,
+# color space, then 9 bytes for each light (type, id and three 16 bit values), big endian
+PROTOCOL = b'HueStream'
+HEADER = struct.Struct('>9sBBBHBB')
+LIGHT = struct.Struct('>BHHHH')
+COLOR_SPACES = {'rgb': 0, 'xy': 1}
+
+
+def encode_message(sequence, color_space, colors):
+    """
+    Encode the colors of the lights in one stream message.
+
+    :param sequence: Sequence number of the message (0 to 255).
+    :param color_space: 'rgb' (red, green, blue) or 'xy' (x, y, brightness).
+    :param colors: List of (light id, (value1, value2, value3)) with 16 bit values.
+    :return The message as bytes.
+    """
+
+    message = bytearray(HEADER.size + LIGHT.size * len(colors))
+    HEADER.pack_into(message, 0, PROTOCOL, 1, 0, sequence & 0xff, 0, COLOR_SPACES[color_space], 0)
+    for n, (light_id, values) in enumerate(colors):
+        LIGHT.pack_into(message, HEADER.size + n * LIGHT.size, 0, int(light_id), *values)
+    return bytes(message)
+
+
+def decode_message(message):
+    """
+    Decode a stream message (see encode_message()).
+
+    :param message: The message as bytes.
+    :return Tuple of sequence number, color space and list of (light id, (value1, value2, value3)),
+            None if the message is not valid.
+    """
+
+    if len(message) < HEADER.size or (len(message) - HEADER.size) % LIGHT.size:
+        return None
+    protocol, major, minor, sequence, reserved, color_space, reserved = HEADER.unpack_from(message, 0)
+    if protocol != PROTOCOL or major != 1 or color_space not in COLOR_SPACES.values():
+        return None
+    colors = []
+    for offset in range(HEADER.size, len(message), LIGHT.size):
+        light_type, light_id, value1, value2, value3 = LIGHT.unpack_from(message, offset)
+        colors.append((str(light_id), (value1, value2, value3)))
+    space = 'rgb' if color_space == COLOR_SPACES['rgb'] else 'xy'
+    return sequence, space, colors
+
+
+class StreamSender(object):
+    """
+    Streaming of the colors of a set of lights over UDP, at a fixed rate (see Group.start_stream()).
+
+    A background thread sends the latest colors of all lights 'rate' times per second, in sequence numbered
+    messages (at most MAX_LIGHTS lights each, see encode_message()), whether they changed or not: a lost message
+    is made up for by the next one. Setting a color only updates the values sent next, so colors can be set
+    at any rate without queueing requests.
+
+    Statistics:
+        sent - Messages sent.
+        late - Messages skipped because the sender fell behind.
+        errors - Messages that could not be sent.
+    """
+
+    DEFAULT_RATE = 25
+    DEFAULT_PORT = 2100
+    # lights in one message
+    MAX_LIGHTS = 10
+
+    def __init__(self, light_ids, address, port=DEFAULT_PORT, rate=DEFAULT_RATE, color_space='rgb', colors=None):
+        """
+        :param light_ids: Ids of the lights streamed.
+        :param address: IP of the receiver.
+        :param port: UDP port of the receiver.
+        :param rate: Messages sent per second (for each MAX_LIGHTS lights).
+        :param color_space: 'rgb' (see set_color()) or 'xy' (see set_xy()).
+        :param colors: Initial colors, dictionary of (red, green, blue) or (x, y, bri) indexed by light id
+                       (optional, the lights are off by default).
+        """
+
+        if color_space not in COLOR_SPACES:
+            raise ValueError('Unknown color space ' + str(color_space) + ', use one of ' + ', '.join(
+                sorted(COLOR_SPACES)))
+        self.light_ids = [str(light_id) for light_id in light_ids]
+        self.address = address
+        self.port = port
+        self.rate = float(rate)
+        self.color_space = color_space
+        self.sent = self.late = self.errors = 0
+        self._values = dict((light_id, (0, 0, 0)) for light_id in self.light_ids)
+        self._sequence = 0
+        self._stop = threading.Event()
+        self._socket = None
+        self._thread = None
+        for light_id, color in (colors or {}).items():
+            if color_space == 'rgb':
+                self.set_color(light_id, *color)
+            else:
+                self.set_xy(light_id, *color)
+
+    def __repr__(self):
+        return 'StreamSender * %d lights * %s:%d * %d messages/s * %s * sent = %d * late = %d * errors = %d * %s' % (
+            len(self.light_ids), self.address, self.port, self.rate, self.color_space, self.sent, self.late,
+            self.errors, 'running' if self.running else 'stopped')
+
+    @property
+    def running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def start(self):
+        """
+        Start streaming in background.
+
+        :return The StreamSender instance.
+        """
+
+        if not self.running:
+            self._stop.clear()
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._thread = threading.Thread(target=self._run, name='StreamSender')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop streaming, the lights keep the last colors sent.
+
+        :return None
+        """
+
+        self._stop.set()
+        if self.running and (self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def set_color(self, light, red, green, blue):
+        """
+        Set the color sent for a light ('rgb' color space).
+
+        :param light: Light object or light id.
+        :param red: Red value between 0 and 255.
+        :param green: Green value between 0 and 255.
+        :param blue: Blue value between 0 and 255.
+        :return None
+        """
+
+        if self.color_space != 'rgb':
+            raise ValueError('set_color() needs the rgb color space, use set_xy()')
+        # 8 bit values are scaled to 16 bit (255 * 257 = 65535)
+        self._set_values(light, (int(red) * 257, int(green) * 257, int(blue) * 257))
+
+    def set_xy(self, light, x, y, bri):
+        """
+        Set the color sent for a light ('xy' color space).
+
+        :param light: Light object or light id.
+        :param x: X coordinate in CIE color space.
+        :param y: Y coordinate in CIE color space.
+        :param bri: Brightness (1 to 254).
+        :return None
+        """
+
+        if self.color_space != 'xy':
+            raise ValueError('set_xy() needs the xy color space, use set_color()')
+        self._set_values(light, (int(round(x * 0xffff)), int(round(y * 0xffff)), int(round(bri * 0xffff / 254.0))))
+
+    def _set_values(self, light, values):
+        light_id = str(getattr(light, 'id', light))
+        if light_id not in self._values:
+            raise ValueError('Light ' + light_id + ' is not streamed')
+        self._values[light_id] = tuple(max(0, min(0xffff, value)) for value in values)
+
+    def _get_messages(self):
+        # the latest colors of all lights, in messages of at most MAX_LIGHTS lights each
+        colors = [(light_id, self._values[light_id]) for light_id in self.light_ids]
+        messages = []
+        for n in range(0, len(colors), self.MAX_LIGHTS):
+            messages.append(encode_message(self._sequence, self.color_space, colors[n:n + self.MAX_LIGHTS]))
+            self._sequence = (self._sequence + 1) & 0xff
+        return messages
+
+    def _run(self):
+        next_time = time.time()
+        try:
+            while not self._stop.is_set():
+                for message in self._get_messages():
+                    try:
+                        self._socket.sendto(message, (self.address, self.port))
+                        self.sent += 1
+                    except socket.error:
+                        self.errors += 1
+                # sent at fixed times, the messages missed when falling behind are skipped (not sent late)
+                next_time += 1 / self.rate
+                now = time.time()
+                if now > next_time:
+                    missed = int((now - next_time) * self.rate)
+                    self.late += missed
+                    next_time += missed / self.rate
+                self._stop.wait(max(0.0, next_time - now))
+        finally:
+            self._socket.close()
+
+
+class StreamReceiver(object):
+    """
+    Local stand-in for the bridge receiving a stream (see StreamSender), for testing: decodes the messages,
+    keeps the latest color of each light and measures the quality of the stream.
+
+    Statistics:
+        received - Messages received.
+        lost - Messages missing from the sequence numbers.
+        out_of_order - Messages received after a newer one.
+        invalid - Datagrams which are not stream messages.
+        colors - Latest color of each light: (red, green, blue) between 0 and 255 or (x, y, bri), indexed by light id.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        """
+        :param host: IP to listen on.
+        :param port: UDP port to listen on (optional, a free port by default, see 'port').
+        """
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.2)
+        self.host, self.port = self._socket.getsockname()
+        self.received = self.lost = self.out_of_order = self.invalid = 0
+        self.colors = {}
+        self._sequence = None
+        self._arrivals = {}         # arrival times of the last messages, indexed by the first light of the message
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='StreamReceiver')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        stats = self.stats()
+        return ('StreamReceiver * %s:%d * received = %d * lost = %d (%.1f%%) * out of order = %d * '
+                'rate = %.1f/s * jitter = %.2fms' % (self.host, self.port, stats['received'], stats['lost'],
+                                                     stats['loss'] * 100, stats['out_of_order'], stats['rate'],
+                                                     stats['jitter'] * 1000))
+
+    def stats(self):
+        """
+        Get the statistics of the stream received.
+
+        :return Dictionary with 'received', 'lost', 'out_of_order', 'invalid' counters, 'loss' (ratio of messages
+                lost), 'rate' (messages per second) and 'jitter' (mean deviation of the time between two messages
+                for the same lights from its average, in seconds), the last two over the last 1000 messages of each.
+        """
+
+        # the messages of each set of lights (see StreamSender.MAX_LIGHTS) are timed separately
+        rate = deviation = 0.0
+        count = 0
+        for arrivals in list(self._arrivals.values()):
+            arrivals = list(arrivals)
+            intervals = [t1 - t0 for t0, t1 in zip(arrivals, arrivals[1:])]
+            mean = sum(intervals) / len(intervals) if intervals else 0.0
+            if mean:
+                rate += 1 / mean
+                deviation += sum(abs(interval - mean) for interval in intervals)
+                count += len(intervals)
+        return {'received': self.received,
+                'lost': self.lost,
+                'out_of_order': self.out_of_order,
+                'invalid': self.invalid,
+                'loss': float(self.lost) / (self.received + self.lost) if self.received + self.lost else 0.0,
+                'rate': rate,
+                'jitter': deviation / count if count else 0.0}
+
+    def close(self):
+        """
+        Stop receiving.
+
+        :return None
+        """
+
+        self._stop.set()
+        self._thread.join()
+        self._socket.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                message = self._socket.recv(65535)
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            arrival = time.time()
+            decoded = decode_message(message)
+            if decoded is None:
+                self.invalid += 1
+                continue
+            sequence, color_space, colors = decoded
+            self.received += 1
+            self._arrivals.setdefault(colors[0][0] if colors else None, deque(maxlen=1000)).append(arrival)
+            if self._sequence is not None:
+                # sequence numbers wrap after 255, a gap of more than half of the range is an older message
+                gap = (sequence - self._sequence) & 0xff
+                if gap == 0 or gap > 0x80:
+                    # counted as lost when the newer message was received
+                    self.out_of_order += 1
+                    self.lost = max(0, self.lost - (gap > 0x80))
+                    continue
+                self.lost += gap - 1
+            self._sequence = sequence
+            for light_id, values in colors:
+                if color_space == 'rgb':
+                    self.colors[light_id] = tuple(value // 257 for value in values)
+                else:
+                    self.colors[light_id] = (values[0] / 65535.0, values[1] / 65535.0,
+                                             int(round(values[2] * 254 / 65535.0)))
@@ -2,6 +2,9 @@ class UserObj(object):
     """
     Inherited by classes with a collection of objects (Lights, Group, Groups)
     designed to act like a dictionary stored in _obj.
+
+    The objects (having 'id' and 'name') are also indexed by id and by adapted name (name without spaces),
+    see by_id() and by_name().
     """
 
     def __getitem__(self, key):
@@ -15,6 +18,10 @@ class UserObj(object):
 
     def set_obj(self, obj):
         self._obj = obj
+        self._by_id = dict((value.id, value) for value in obj.values())
+        self._by_name = dict((value._adapt_name(), value) for value in obj.values())
+        # name each object is indexed with, by object id (the object name can change, see _reindex())
+        self._names = dict((value.id, key) for key, value in obj.items())
 
     def values(self):
         return self._obj.values()
@@ -27,3 +34,48 @@ class UserObj(object):
 
     def pop(self, key):
         return self._obj.pop(key)
+
+    def by_id(self, id):
+        """
+        Get an object by id.
+
+        :param id: Object id (i.e. Light.id).
+        :return The object or None if there is no object with this id.
+        """
+
+        return self._by_id.get(str(id))
+
+    def by_name(self, name):
+        """
+        Get an object by name, spaces are ignored (i.e. 'Living Main' or 'LivingMain').
+
+        :param name: Object name.
+        :return The object or None if there is no object with this name.
+        """
+
+        return self._by_name.get(str(name).replace(' ', ''))
+
+    def _add(self, obj):
+        # add an object to the dictionary and to the indexes, its adapted name becomes a member of this instance
+        self._obj[obj.name] = obj
+        self._by_id[obj.id] = obj
+        self._by_name[obj._adapt_name()] = obj
+        self._names[obj.id] = obj.name
+        setattr(self, obj._adapt_name(), obj)
+
+    def _remove(self, obj):
+        # remove an object from the dictionary, from the indexes and from the members of this instance
+        name = self._names.pop(obj.id)
+        adapted_name = name.replace(' ', '')
+        self._obj.pop(name, None)
+        self._by_id.pop(obj.id, None)
+        if self._by_name.get(adapted_name) is obj:
+            self._by_name.pop(adapted_name)
+        if getattr(self, adapted_name, None) is obj:
+            delattr(self, adapted_name)
+
+    def _reindex(self, obj):
+        # index an object again after it was renamed
+        if self._by_id.get(obj.id) is obj:
+            self._remove(obj)
+            self._add(obj)
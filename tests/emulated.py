@@ -0,0 +1,59 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from emulator import BridgeEmulator
+
+
+class EmulatedBridgeTest(unittest.TestCase):
+    """
+    Test case running a BridgeEmulator on 127.0.0.1:80 (PieShine talks to the bridge on port 80), registered in
+    the 'bridges.json' of a temporary directory, so that Bridge() and Comms() connect to it.
+    The tests are skipped if port 80 cannot be used.
+    """
+
+    LIGHTS = 6
+    KINDS = ('B',)
+    GROUP_SIZE = 3
+    LATENCY = 0
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.mkdtemp()
+        os.chdir(self._dir)
+        try:
+            self.emulator = BridgeEmulator(self.LIGHTS, self.KINDS, self.GROUP_SIZE, username='pieshine',
+                                           latency=self.LATENCY)
+        except (socket.error, OSError) as e:
+            self._restore()
+            raise unittest.SkipTest('Cannot run the bridge emulator on port 80 : ' + str(e))
+        self.emulator.register()
+
+        # requests received by the emulator, as (method, path without the user)
+        self.requests = []
+        handle = self.emulator._handle
+
+        def record(method, path, body):
+            self.requests.append((method, path.replace('/api/pieshine', '', 1)))
+            return handle(method, path, body)
+        self.emulator._handle = record
+
+    def tearDown(self):
+        self.emulator.close()
+        self._restore()
+
+    def _restore(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def sent(self, method='PUT'):
+        """
+        Get the paths of the requests received by the emulator since the last call, for one method.
+
+        :param method: HTTP method of the requests.
+        :return List of paths (without '/api/<user>').
+        """
+
+        requests, self.requests[:] = list(self.requests), []
+        return [path for request_method, path in requests if request_method == method]
@@ -0,0 +1,61 @@
+import unittest
+from array import array
+from models.lights import gamutA, gamutB, gamutC
+from models.utils.color import numpy
+
+COLORS = [(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 255, 0), (0, 0, 255), (37, 171, 186), (200, 171, 196),
+          (1, 2, 3), (254, 128, 7)]
+
+
+def as_triples(result):
+    # batch results as a list of (x, y, bri), with or without NumPy
+    if numpy is not None:
+        return [tuple(values) for values in result.tolist()]
+    return [tuple(result[n:n + 3]) for n in range(0, len(result), 3)]
+
+
+class TestBatchConversion(unittest.TestCase):
+
+    def _check(self, colors):
+        for gamut in (gamutA, gamutB, gamutC):
+            expected = [gamut.get_xy_and_bri_from_rgb(*color) for color in COLORS]
+            result = as_triples(gamut.rgb_to_xy_bri_batch(colors))
+            self.assertEqual(len(result), len(expected))
+            for (x, y, bri), (expected_x, expected_y, expected_bri) in zip(result, expected):
+                self.assertAlmostEqual(x, expected_x, places=12)
+                self.assertAlmostEqual(y, expected_y, places=12)
+                self.assertEqual(bri, expected_bri)
+
+    def test_list_of_triples(self):
+        self._check(COLORS)
+
+    def test_bytes(self):
+        self._check(bytes(bytearray(value for color in COLORS for value in color)))
+
+    def test_bytearray(self):
+        self._check(bytearray(value for color in COLORS for value in color))
+
+    def test_memoryview(self):
+        self._check(memoryview(bytearray(value for color in COLORS for value in color)))
+
+    def test_array(self):
+        self._check(array('B', [value for color in COLORS for value in color]))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_arrays(self):
+        self._check(numpy.array(COLORS, dtype=numpy.uint8))
+        self._check(numpy.array(COLORS, dtype=numpy.float64))
+
+
+class TestInverseConversion(unittest.TestCase):
+
+    def test_batch_matches_scalar(self):
+        values = [gamutB.get_xy_and_bri_from_rgb(*color) for color in COLORS]
+        result = gamutB.xy_bri_to_rgb_batch(values)
+        result = result.tolist() if numpy is not None else [list(result[n:n + 3]) for n in range(0, len(result), 3)]
+        self.assertEqual([tuple(rgb) for rgb in result],
+                         [tuple(gamutB.get_rgb_from_xy_and_bri(*value)) for value in values])
+
+
+if __name__ == '__main__':
+    unittest.main()
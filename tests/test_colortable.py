@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from models.lights import gamutA, gamutC
+from models.utils.color import numpy
+from models.utils.colortable import ColorTable
+
+
+class TestColorTable(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def test_matches_the_formulas(self):
+        table = ColorTable(gamutC, cache_dir=self.dir)
+        for color in [(0, 0, 0), (255, 255, 255), (12, 200, 99), (12, 0, 255)]:
+            x, y, bri = table.get_xy_and_bri_from_rgb(*color)
+            expected_x, expected_y, expected_bri = gamutC.get_xy_and_bri_from_rgb(*color)
+            self.assertAlmostEqual(x, expected_x, delta=table.max_error)
+            self.assertAlmostEqual(y, expected_y, delta=table.max_error)
+            self.assertEqual(bri, expected_bri)
+        self.assertFalse(table.disabled)
+        self.assertEqual(table.fallbacks, 0)
+
+    def test_not_8_bit_values(self):
+        table = ColorTable(gamutA, cache_dir=self.dir)
+        self.assertEqual(table.get_xy_and_bri_from_rgb(127.5, 3, 4), gamutA.get_xy_and_bri_from_rgb(127.5, 3, 4))
+        self.assertEqual(table.fallbacks, 1)
+
+    def test_shared_file(self):
+        ColorTable(gamutA, cache_dir=self.dir).get_xy_and_bri_from_rgb(40, 50, 60)
+        table = ColorTable(gamutA, cache_dir=self.dir)
+        table.load()
+        self.assertEqual(table._built[40], 1)
+        self.assertEqual(table._built[41], 0)
+
+    def test_invalid_file_replaced(self):
+        path = ColorTable(gamutA, cache_dir=self.dir).path
+        with open(path, 'wb') as f:
+            f.write(b'not a color table')
+        table = ColorTable(gamutA, cache_dir=self.dir)
+        table.get_xy_and_bri_from_rgb(1, 2, 3)
+        self.assertFalse(table.disabled)
+        self.assertEqual(os.path.getsize(path), table._length)
+        # no temporary file left
+        self.assertEqual(os.listdir(self.dir), [os.path.basename(path)])
+
+    def test_disabled_if_not_accurate(self):
+        table = ColorTable(gamutA, max_error=1e-9, cache_dir=self.dir)
+        self.assertEqual(table.get_xy_and_bri_from_rgb(1, 2, 3), gamutA.get_xy_and_bri_from_rgb(1, 2, 3))
+        self.assertTrue(table.disabled)
+
+    def test_wrong_entries_detected(self):
+        table = ColorTable(gamutA, cache_dir=self.dir)
+        table.gamut = _ShiftedGamut(gamutA)
+        table.get_xy_and_bri_from_rgb(1, 2, 3)
+        self.assertTrue(table.disabled)
+
+
+class _ShiftedGamut(object):
+    # batch conversion one color off from the scalar conversion
+
+    def __init__(self, gamut):
+        self._gamut = gamut
+        self.name = gamut.name
+
+    def get_xy_and_bri_from_rgb(self, red, green, blue):
+        return self._gamut.get_xy_and_bri_from_rgb(red, green, blue)
+
+    def rgb_to_xy_bri_batch(self, colors):
+        result = self._gamut.rgb_to_xy_bri_batch(colors)
+        if numpy is not None:
+            return numpy.roll(result, 1, axis=0)
+        return result[3:] + result[:3]
+
+
+if __name__ == '__main__':
+    unittest.main()
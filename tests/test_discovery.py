@@ -0,0 +1,50 @@
+import time
+import unittest
+from models.utils.discovery import Discovery, SSDPResponder
+from tests.emulated import EmulatedBridgeTest
+
+
+class TestDiscovery(EmulatedBridgeTest):
+
+    LATENCY = 0.2
+
+    def responder(self, delay=0):
+        responder = SSDPResponder('http://127.0.0.1:80/description.xml', delay=delay)
+        self.addCleanup(responder.close)
+        return responder
+
+    def test_discover(self):
+        bridge = Discovery(deadline=2, address=self.responder().address).discover()
+        self.assertEqual((bridge.ip, bridge.serial_number), ('127.0.0.1', self.emulator.serial))
+
+    def test_each_bridge_once(self):
+        responder = self.responder()
+        bridges = list(Discovery(deadline=1.5, address=responder.address).scan())
+        # searched twice, probed once
+        self.assertEqual(responder.requests, 2)
+        self.assertEqual(len(bridges), 1)
+
+    def test_probe_in_progress_at_the_deadline(self):
+        # responds right before the deadline, the description comes after it
+        start = time.time()
+        bridge = Discovery(deadline=0.5, address=self.responder(delay=0.4).address).discover()
+        self.assertIsNotNone(bridge)
+        self.assertGreater(time.time() - start, 0.5)
+
+    def test_response_after_the_deadline(self):
+        discovery = Discovery(deadline=0.3, address=self.responder(delay=0.6).address)
+        start = time.time()
+        self.assertIsNone(discovery.discover())
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(discovery.responses, [])
+
+    def test_not_a_bridge(self):
+        responder = SSDPResponder('http://127.0.0.1:80/other.xml')
+        self.addCleanup(responder.close)
+        discovery = Discovery(deadline=0.5, address=responder.address)
+        self.assertIsNone(discovery.discover())
+        self.assertEqual(discovery.responses, [('127.0.0.1', '/other.xml')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import unittest
+from models.utils.comms import Comms
+from tests.emulated import EmulatedBridgeTest
+
+
+class TestBridgeEmulator(EmulatedBridgeTest):
+
+    LIGHTS = 5
+    KINDS = ('B', 'white')
+
+    def setUp(self):
+        super(TestBridgeEmulator, self).setUp()
+        self.comms = Comms()
+
+    def tearDown(self):
+        self.comms.close()
+        super(TestBridgeEmulator, self).tearDown()
+
+    def test_datastore(self):
+        datastore = self.comms.get('')
+        self.assertEqual(sorted(datastore['lights'], key=int), ['1', '2', '3', '4', '5'])
+        self.assertEqual(datastore['lights']['2']['type'], 'Dimmable light')
+        self.assertEqual(datastore['groups']['1']['lights'], ['1', '2', '3'])
+        self.assertEqual(datastore['groups']['2']['lights'], ['4', '5'])
+
+    def test_values_checked_like_the_bridge(self):
+        response = self.comms.put('lights/1/state', json.dumps({'bri': 100}), immediate=True)
+        self.assertIn('error', response[0])
+        self.assertEqual(response[0]['error']['type'], 201)
+
+        response = self.comms.put('lights/1/state', json.dumps({'on': True, 'bri': 300, 'xy': [0.31234, 0.3]}),
+                                  immediate=True)
+        # one success for each attribute, with the value set
+        self.assertTrue(all('success' in item for item in response))
+        self.assertEqual(dict(item for result in response for item in result['success'].items()),
+                         {'/lights/1/state/on': True, '/lights/1/state/bri': 254, '/lights/1/state/xy': [0.3123, 0.3]})
+        state = self.emulator.light(1)['state']
+        self.assertEqual((state['bri'], state['xy'], state['colormode']), (254, [0.3123, 0.3], 'xy'))
+
+    def test_group_action(self):
+        self.comms.put('groups/1/action', json.dumps({'on': True, 'xy': [0.2, 0.3]}), immediate=True)
+        self.assertEqual([self.emulator.light(id)['state']['on'] for id in range(1, 6)],
+                         [True, True, True, False, False])
+        # the white light of the group ignores the color
+        self.assertEqual(self.emulator.light(1)['state']['xy'], [0.2, 0.3])
+        self.assertNotIn('xy', self.emulator.light(2)['state'])
+
+    def test_link_button(self):
+        self.assertEqual(self.comms.post('', json.dumps({'devicetype': 'test'}))[0]['error']['type'], 101)
+        self.emulator.press_link_button()
+        response = self.comms.post('', json.dumps({'devicetype': 'test'}))
+        self.assertIn('username', response[0]['success'])
+        self.assertEqual(self.emulator.stats()['users_created'], 1)
+
+    def test_rate_limits(self):
+        self.emulator.rate_limits = {'lights': 1}
+        for n in range(3):
+            self.comms.put('lights/1/state', json.dumps({'alert': 'select'}), immediate=True)
+        self.assertEqual(self.emulator.stats()['throttled'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
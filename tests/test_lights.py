@@ -0,0 +1,121 @@
+import threading
+import unittest
+from bridge import Bridge
+from tests.emulated import EmulatedBridgeTest
+
+
+class TestSetState(EmulatedBridgeTest):
+
+    def setUp(self):
+        super(TestSetState, self).setUp()
+        self.bridge = Bridge()
+        self.light = self.bridge.lights.Light1
+        self.sent()
+
+    def test_set_state(self):
+        self.light.set_state(on=True, bri=20, xy=[0.3, 0.3])
+        self.assertEqual(self.sent(), ['/lights/1/state'])
+        state = self.emulator.light(1)['state']
+        self.assertEqual((state['on'], state['bri'], state['xy']), (True, 20, [0.3, 0.3]))
+
+    def test_batch(self):
+        with self.light.batch():
+            self.light.turn_on()
+            self.light.set_bri(50)
+            self.light.set_ct(300)
+            self.assertEqual(self.sent(), [])
+        self.assertEqual(self.sent(), ['/lights/1/state'])
+        state = self.emulator.light(1)['state']
+        self.assertEqual((state['on'], state['bri'], state['ct']), (True, 50, 300))
+
+    def test_batch_not_sent_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.light.batch():
+                self.light.turn_on()
+                1 / 0
+        self.assertEqual(self.sent(), [])
+        self.assertFalse(self.emulator.light(1)['state']['on'])
+
+    def test_write_from_another_thread_during_batch(self):
+        with self.light.batch():
+            self.light.turn_on()
+            thread = threading.Thread(target=self.light.set_alert, args=('select',))
+            thread.start()
+            thread.join()
+            # sent right away by the other thread, not collected by the batch
+            self.assertEqual(self.sent(), ['/lights/1/state'])
+            self.assertEqual(self.emulator.light(1)['state']['alert'], 'select')
+            self.assertFalse(self.emulator.light(1)['state']['on'])
+        self.assertEqual(self.sent(), ['/lights/1/state'])
+        self.assertTrue(self.emulator.light(1)['state']['on'])
+
+    def test_lights_batch(self):
+        with self.bridge.lights.batch():
+            self.bridge.lights.turn_on()
+            self.bridge.lights.set_bri(200)
+            self.assertEqual(self.sent(), [])
+        self.assertEqual(sorted(self.sent()), ['/lights/%d/state' % id for id in range(1, 7)])
+        self.assertEqual([self.emulator.light(id)['state']['bri'] for id in range(1, 7)], [200] * 6)
+        self.assertTrue(all(self.emulator.light(id)['state']['on'] for id in range(1, 7)))
+
+    def test_group_batch(self):
+        group = self.bridge.groups.Room2
+        with group.batch():
+            group.turn_on()
+            group.set_bri(10)
+            self.assertEqual(self.sent(), [])
+        self.assertEqual(sorted(self.sent()), ['/lights/4/state', '/lights/5/state', '/lights/6/state'])
+        self.assertEqual([self.emulator.light(id)['state']['bri'] for id in range(1, 7)], [254] * 3 + [10] * 3)
+
+
+class TestCollectionRouting(EmulatedBridgeTest):
+
+    def setUp(self):
+        super(TestCollectionRouting, self).setUp()
+        self.bridge = Bridge()
+        self.bridge.lights.turn_on()
+        self.sent()
+
+    def test_group_action(self):
+        self.bridge.groups.Room1.set_bri(100)
+        self.assertEqual(self.sent(), ['/groups/1/action'])
+        self.assertEqual([self.emulator.light(id)['state']['bri'] for id in range(1, 7)], [100] * 3 + [254] * 3)
+
+    def test_all_lights_action(self):
+        self.bridge.lights.set_bri(10)
+        self.assertEqual(self.sent(), ['/groups/0/action'])
+        self.assertEqual([self.emulator.light(id)['state']['bri'] for id in range(1, 7)], [10] * 6)
+
+    def test_same_color_for_the_same_gamut(self):
+        self.bridge.groups.Room2.set_color(255, 0, 0)
+        self.assertEqual(self.sent(), ['/groups/2/action'])
+
+    def test_set_state(self):
+        self.bridge.groups.Room1.set_state(bri=30, alert='select')
+        self.assertEqual(self.sent(), ['/groups/1/action'])
+        self.assertEqual(self.emulator.light(2)['state']['bri'], 30)
+
+
+class TestCollectionFanOut(EmulatedBridgeTest):
+
+    KINDS = ('A', 'B', 'C')
+
+    def setUp(self):
+        super(TestCollectionFanOut, self).setUp()
+        self.bridge = Bridge()
+        self.bridge.lights.turn_on()
+        self.sent()
+
+    def test_different_states_for_each_light(self):
+        # the same color is a different xy for each gamut
+        self.bridge.groups.Room1.set_color(255, 0, 0)
+        self.assertEqual(sorted(self.sent()), ['/lights/1/state', '/lights/2/state', '/lights/3/state'])
+        self.assertEqual(len(set(tuple(self.emulator.light(id)['state']['xy']) for id in range(1, 4))), 3)
+
+    def test_same_state_for_all_gamuts(self):
+        self.bridge.groups.Room1.set_bri(120)
+        self.assertEqual(self.sent(), ['/groups/1/action'])
+
+
+if __name__ == '__main__':
+    unittest.main()
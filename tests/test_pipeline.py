@@ -0,0 +1,85 @@
+import json
+import socket
+import unittest
+from models.utils.pipeline import Pipeline
+from tests.emulated import EmulatedBridgeTest
+
+
+class TestPipeline(EmulatedBridgeTest):
+
+    def setUp(self):
+        super(TestPipeline, self).setUp()
+        self.responses = []
+        self.pipeline = Pipeline(self.emulator.host, self.emulator.port, self.on_response, timeout=5)
+
+    def tearDown(self):
+        self.pipeline.close()
+        super(TestPipeline, self).tearDown()
+
+    def on_response(self, url_suffix, data, status, body):
+        self.responses.append((url_suffix, status, json.loads(body.decode('utf-8')) if body else None))
+
+    def submit(self, light_id, state):
+        self.pipeline.submit('lights/%d/state' % light_id, '/api/pieshine/lights/%d/state' % light_id,
+                             json.dumps(state))
+
+    def check_responses(self):
+        # each response is the one of its own request
+        for url_suffix, status, body in self.responses:
+            self.assertEqual(status, 200)
+            self.assertTrue(all(address.startswith('/' + url_suffix + '/')
+                                for item in body for address in item['success']))
+
+    def test_responses_in_order(self):
+        for light_id in range(1, 7):
+            self.submit(light_id, {'on': True, 'bri': light_id * 10})
+        self.assertTrue(self.pipeline.flush(5))
+        self.assertEqual([url_suffix for url_suffix, status, body in self.responses],
+                         ['lights/%d/state' % light_id for light_id in range(1, 7)])
+        self.check_responses()
+        self.assertEqual([self.emulator.light(light_id)['state']['bri'] for light_id in range(1, 7)],
+                         [10, 20, 30, 40, 50, 60])
+
+    def test_failed_write_sent_again(self):
+        self.submit(1, {'on': True})
+        self.assertTrue(self.pipeline.flush(5))
+        # the connection is lost while idle: the next write fails, and the one after it is written
+        # before the reader notices (the lock is reentrant, the reader waits for it)
+        self.pipeline._sock = _BrokenSocket(self.pipeline._sock)
+        with self.pipeline._cond:
+            self.submit(2, {'on': True})
+            self.submit(3, {'on': True})
+        self.assertTrue(self.pipeline.flush(5))
+        self.assertEqual(sorted(url_suffix for url_suffix, status, body in self.responses),
+                         ['lights/1/state', 'lights/2/state', 'lights/3/state'])
+        self.check_responses()
+        self.assertEqual([self.emulator.light(light_id)['state']['on'] for light_id in range(1, 4)], [True] * 3)
+        self.assertEqual(self.pipeline.stats()['lost'], 0)
+
+    def test_connection_lost_while_waiting(self):
+        self.emulator.latency = 0.3
+        for light_id in range(1, 4):
+            self.submit(light_id, {'on': True})
+        # closed under the pending responses
+        self.pipeline._sock.shutdown(2)
+        self.assertTrue(self.pipeline.flush(5))
+        self.check_responses()
+        self.assertEqual([self.emulator.light(light_id)['state']['on'] for light_id in range(1, 4)], [True] * 3)
+        self.assertGreater(self.pipeline.stats()['resent'], 0)
+
+
+class _BrokenSocket(object):
+    # connection closed by the bridge, writing on it fails
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def sendall(self, data):
+        raise socket.error(32, 'Broken pipe')
+
+    def close(self):
+        self._sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+import unittest
+from models.utils.comms import Comms
+from models.utils.statecache import StateCache
+from tests.emulated import EmulatedBridgeTest
+
+
+class TestStateCache(EmulatedBridgeTest):
+
+    def setUp(self):
+        super(TestStateCache, self).setUp()
+        self.comms = Comms()
+        self.cache = self.comms.cache
+        self.sent('GET')
+
+    def tearDown(self):
+        self.comms.close()
+        super(TestStateCache, self).tearDown()
+
+    def test_all_lights_fetched_together(self):
+        self.cache.get('lights/1')
+        self.cache.get('lights/2')
+        self.cache.get_all('lights')
+        self.assertEqual(self.sent('GET'), ['/lights/'])
+        self.assertEqual((self.cache.hits, self.cache.misses, self.cache.requests), (2, 1, 1))
+
+    def test_ttl(self):
+        self.cache.ttl['lights'] = 0.2
+        self.cache.max_stale = 0
+        self.cache.get('lights/1')
+        self.cache.get('lights/1')
+        self.assertEqual(self.sent('GET'), ['/lights/'])
+        time.sleep(0.3)
+        self.cache.get('lights/1')
+        self.assertEqual(self.sent('GET'), ['/lights/'])
+
+    def test_stale_while_revalidate(self):
+        self.cache.ttl['lights'] = 0.2
+        self.cache.get('lights/1')
+        self.sent('GET')
+        self.emulator._datastore['lights']['1']['name'] = 'Renamed'
+        time.sleep(0.3)
+        # the stale data is returned while it is refreshed in background
+        self.assertEqual(self.cache.get('lights/1')['name'], 'Light 1')
+        self.assertEqual(self.cache.stale_hits, 1)
+        for n in range(50):
+            if self.cache.get('lights/1')['name'] == 'Renamed':
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.cache.get('lights/1')['name'], 'Renamed')
+        self.assertEqual(self.sent('GET'), ['/lights/'])
+
+    def test_apply_write(self):
+        self.cache.get_all('lights')
+        self.cache.get_all('groups')
+        self.sent('GET')
+        self.comms.put('lights/1/state', json.dumps({'on': True, 'bri': 40, 'transitiontime': 2}))
+        self.assertEqual(self.cache.get('lights/1')['state']['bri'], 40)
+        self.comms.put('groups/1/action', json.dumps({'ct': 300}))
+        self.assertEqual(self.cache.get('lights/1')['state']['ct'], 300)
+        self.assertEqual(self.cache.get('lights/1')['state']['colormode'], 'ct')
+        # confirmed values are applied without fetching them again
+        self.assertEqual(self.sent('GET'), [])
+
+    def test_failed_write_fetched_again(self):
+        self.cache.get_all('lights')
+        self.sent('GET')
+        # the light is off, the bridge refuses the brightness
+        self.comms.put('lights/2/state', json.dumps({'bri': 40}))
+        self.assertEqual(self.cache.get('lights/2')['state']['bri'], 254)
+        self.assertEqual(self.sent('GET'), ['/lights/2'])
+
+
+class TestStateCacheLocking(unittest.TestCase):
+
+    def setUp(self):
+        self.fetched = []
+        self.release = threading.Event()
+
+    def fetch(self, url_suffix):
+        self.fetched.append(url_suffix)
+        if url_suffix.startswith('lights'):
+            self.release.wait(5)
+        return {'1': {'name': url_suffix}}
+
+    def test_fetch_does_not_block_other_readers(self):
+        cache = StateCache(self.fetch)
+        cache.get('groups/1')
+        readers = [threading.Thread(target=cache.get, args=('lights/1',)) for n in range(3)]
+        [reader.start() for reader in readers]
+        try:
+            # the groups are read while the lights are being fetched
+            time.sleep(0.1)
+            self.assertEqual(cache.get('groups/1'), {'name': 'groups/'})
+        finally:
+            self.release.set()
+            [reader.join() for reader in readers]
+        # the readers of the lights shared the same request
+        self.assertEqual(self.fetched, ['groups/', 'lights/'])
+        self.assertEqual(cache.requests, 2)
+
+    def test_fetch_error_raised_to_all_readers(self):
+        def fetch(url_suffix):
+            time.sleep(0.1)
+            raise IOError('no response')
+        cache = StateCache(fetch)
+        errors = []
+
+        def read():
+            try:
+                cache.get('lights/1')
+            except IOError as e:
+                errors.append(e)
+        readers = [threading.Thread(target=read) for n in range(3)]
+        [reader.start() for reader in readers]
+        [reader.join() for reader in readers]
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(cache.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
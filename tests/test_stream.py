@@ -0,0 +1,90 @@
+import socket
+import time
+import unittest
+from models.utils.stream import StreamReceiver, StreamSender, decode_message, encode_message
+
+
+class TestMessages(unittest.TestCase):
+
+    def test_round_trip(self):
+        colors = [('1', (0, 0, 0)), ('7', (65535, 257, 1234)), ('300', (1, 2, 3))]
+        for color_space in ('rgb', 'xy'):
+            message = encode_message(42, color_space, colors)
+            self.assertEqual(len(message), 16 + 9 * len(colors))
+            self.assertEqual(decode_message(message), (42, color_space, colors))
+
+    def test_sequence_wraps(self):
+        self.assertEqual(decode_message(encode_message(256 + 5, 'rgb', []))[0], 5)
+
+    def test_invalid_messages(self):
+        message = encode_message(1, 'rgb', [('1', (1, 2, 3))])
+        self.assertIsNone(decode_message(message[:-1]))
+        self.assertIsNone(decode_message(b'HueStreax' + message[9:]))
+        self.assertIsNone(decode_message(b'not a stream message'))
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = StreamReceiver()
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def wait_for(self, condition, timeout=2):
+        end_time = time.time() + timeout
+        while not condition() and (time.time() < end_time):
+            time.sleep(0.01)
+        return condition()
+
+    def test_colors_received(self):
+        sender = StreamSender(['1', '2'], self.receiver.host, self.receiver.port, rate=50,
+                              colors={'1': (255, 0, 0)}).start()
+        try:
+            self.assertTrue(self.wait_for(lambda: self.receiver.colors.get('1') == (255, 0, 0)))
+            sender.set_color('2', 10, 20, 30)
+            self.assertTrue(self.wait_for(lambda: self.receiver.colors.get('2') == (10, 20, 30)))
+        finally:
+            sender.stop()
+        self.assertFalse(sender.running)
+        self.assertEqual(self.receiver.stats()['lost'], 0)
+
+    def test_xy_received(self):
+        sender = StreamSender(['1'], self.receiver.host, self.receiver.port, rate=50, color_space='xy').start()
+        try:
+            sender.set_xy('1', 0.3, 0.4, 127)
+            self.assertTrue(self.wait_for(lambda: self.receiver.colors.get('1', (0, 0, 0))[2] == 127))
+        finally:
+            sender.stop()
+        x, y, bri = self.receiver.colors['1']
+        self.assertAlmostEqual(x, 0.3, places=4)
+        self.assertAlmostEqual(y, 0.4, places=4)
+
+    def test_messages_split(self):
+        sender = StreamSender([str(n) for n in range(1, 26)], self.receiver.host, self.receiver.port)
+        messages = sender._get_messages()
+        self.assertEqual([len(decode_message(message)[2]) for message in messages], [10, 10, 5])
+        self.assertEqual([decode_message(message)[0] for message in messages], [0, 1, 2])
+
+    def test_wrong_color_space(self):
+        sender = StreamSender(['1'], self.receiver.host, self.receiver.port)
+        self.assertRaises(ValueError, sender.set_xy, '1', 0.3, 0.3, 100)
+        self.assertRaises(ValueError, sender.set_color, '3', 1, 2, 3)
+
+    def test_loss_and_order(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for sequence in (254, 255, 2, 1, 3):
+                sock.sendto(encode_message(sequence, 'rgb', [('1', (0, 0, 0))]), (self.receiver.host,
+                                                                                   self.receiver.port))
+            sock.sendto(b'garbage', (self.receiver.host, self.receiver.port))
+            self.assertTrue(self.wait_for(lambda: self.receiver.invalid == 1))
+        finally:
+            sock.close()
+        stats = self.receiver.stats()
+        # 0 and 1 missing when 2 arrived, then 1 arrived late
+        self.assertEqual((stats['received'], stats['lost'], stats['out_of_order']), (5, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()